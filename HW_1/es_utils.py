@@ -48,7 +48,7 @@ class EsUtils:
 
     @classmethod
     @timing
-    def bulk_add_document_to_ap_data_index(cls, documents: list, chunk_size: int = Constants.CHUNK_SIZE):
+    def bulk_add_document_to_ap_data_index(cls, documents, chunk_size: int = Constants.CHUNK_SIZE):
         def get_document_generator():
             for document in documents:
                 yield {
@@ -83,12 +83,12 @@ class EsUtils:
         return document_ids
 
     @classmethod
-    def get_mtermvector_query(cls, document_ids: list):
+    def get_mtermvector_query(cls, document_ids: list, term_statistics: bool = True):
         return {
             "ids": document_ids,
             "parameters": {
                 "fields": ["text"],
-                "term_statistics": True,
+                "term_statistics": term_statistics,
                 "positions": False,
                 "offsets": False,
                 "field_statistics": False,
@@ -98,9 +98,11 @@ class EsUtils:
 
     @classmethod
     @timing
-    def get_termvectors(cls, index_name: str, document_ids: list, timeout: int = Constants.ES_TIMEOUT) -> dict:
+    def get_termvectors(cls, index_name: str, document_ids: list, timeout: int = Constants.ES_TIMEOUT,
+                        term_statistics: bool = True) -> dict:
         es_client = cls.get_es_client(timeout)
-        response = es_client.mtermvectors(index=index_name, body=cls.get_mtermvector_query(document_ids))
+        response = es_client.mtermvectors(index=index_name,
+                                          body=cls.get_mtermvector_query(document_ids, term_statistics))
         return response['docs']
 
     @classmethod
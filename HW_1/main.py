@@ -3,8 +3,11 @@ import math
 import os
 from collections import Counter
 
+import numpy as np
+
 from HW_1.es_utils import EsUtils
-from HW_1.parser import TRECParser
+from HW_1.parser import StreamingTRECParser
+from HW_1.term_statistics import TermStatistics
 from constants.constants import Constants
 from utils.decorators import timing
 from utils.utils import Utils
@@ -18,7 +21,7 @@ def get_file_paths_to_parse(dir_path: str) -> list:
 def get_parsed_documents(file_paths: list):
     logging.info("Parsing documents")
     parsed_documents = []
-    parser = TRECParser(Constants.AP_DATA_FILE_ENCODING)
+    parser = StreamingTRECParser(Constants.AP_DATA_FILE_ENCODING)
     for file_path in file_paths:
         parsed_documents.extend(parser.parse(file_path))
 
@@ -27,10 +30,19 @@ def get_parsed_documents(file_paths: list):
     return parsed_documents
 
 
+def iterate_parsed_documents(file_paths: list, no_of_workers: int = Constants.NO_OF_PARALLEL_PARSING_TASKS):
+    """
+    Parses the files in parallel without holding the whole collection in memory
+    :return: generator of the documents, the files are not in their given order
+    """
+    logging.info("Parsing documents using {} workers".format(no_of_workers))
+    return StreamingTRECParser(Constants.AP_DATA_FILE_ENCODING).parse_files(file_paths, no_of_workers)
+
+
 def create_ap_data_index_and_insert_documents():
     dir_path = Utils.get_ap89_collection_abs_path()
     file_paths = get_file_paths_to_parse(dir_path)
-    parsed_documents = get_parsed_documents(file_paths)
+    parsed_documents = iterate_parsed_documents(file_paths)
 
     Utils.delete_ap_data_index(ignore_unavailable=True)
     Utils.create_ap_data_index()
@@ -478,6 +490,110 @@ def find_scores_using_unigram_lm_with_jelinek_mercer_smoothing_with_es_significa
                                                                                  vocabulary_size=vocabulary_size)
 
 
+def calculate_okapi_tf_scores_locally(term_statistics, query):
+    scores = np.zeros(len(term_statistics.document_ids))
+    for token in query['tokens']:
+        doc_indices, tfs = term_statistics.get_postings(token)
+        doc_lengths = term_statistics.doc_lengths[doc_indices]
+        scores[doc_indices] += tfs / (tfs + 0.5 + (1.5 * (doc_lengths / term_statistics.avg_doc_len)))
+    return term_statistics.get_scores(scores)
+
+
+def calculate_okapi_tf_idf_scores_locally(term_statistics, query):
+    scores = np.zeros(len(term_statistics.document_ids))
+    for token in query['tokens']:
+        doc_indices, tfs = term_statistics.get_postings(token)
+        if len(doc_indices):
+            doc_lengths = term_statistics.doc_lengths[doc_indices]
+            temp = tfs / (tfs + 0.5 + (1.5 * (doc_lengths / term_statistics.avg_doc_len)))
+            scores[doc_indices] += temp * math.log(term_statistics.total_documents /
+                                                   term_statistics.get_doc_freq(token))
+    return term_statistics.get_scores(scores)
+
+
+def calculate_okapi_bm25_scores_locally(term_statistics, query, k_1=1.2, k_2=500, b=0.75):
+    scores = np.zeros(len(term_statistics.document_ids))
+    query_term_freq = Counter(query['tokens'])
+    for token in query['tokens']:
+        doc_indices, tfs = term_statistics.get_postings(token)
+        if len(doc_indices):
+            query_tf = query_term_freq.get(token)
+            doc_freq = term_statistics.get_doc_freq(token)
+            doc_lengths = term_statistics.doc_lengths[doc_indices]
+            temp_1 = math.log((term_statistics.total_documents + 0.5) / (doc_freq + 0.5))
+            temp_2 = (tfs + (k_1 * tfs)) / (tfs + (k_1 * ((1 - b) + (b * (doc_lengths / term_statistics.avg_doc_len)))))
+            temp_3 = (query_tf + (k_2 * query_tf)) / (query_tf + k_2)
+            scores[doc_indices] += (temp_1 * temp_2 * temp_3)
+    return term_statistics.get_scores(scores)
+
+
+def calculate_unigram_lm_with_laplace_smoothing_scores_locally(term_statistics, query):
+    scores = np.zeros(len(term_statistics.document_ids))
+    for token in query['tokens']:
+        doc_indices, tfs = term_statistics.get_postings(token)
+        all_tfs = np.zeros(len(scores))
+        all_tfs[doc_indices] = tfs
+        scores += np.log((all_tfs + 1.0) / (term_statistics.doc_lengths + term_statistics.vocabulary_size))
+    return term_statistics.get_scores(scores)
+
+
+def calculate_unigram_lm_with_jelinek_mercer_smoothing_scores_locally(term_statistics, query, lam=0.8):
+    scores = np.zeros(len(term_statistics.document_ids))
+    for token in query['tokens']:
+        token_ttf = term_statistics.get_ttf(token)
+        # the log of 0 is skipped, as for the scores computed over Elasticsearch
+        if not token_ttf:
+            continue
+
+        doc_indices, tfs = term_statistics.get_postings(token)
+        all_tfs = np.zeros(len(scores))
+        all_tfs[doc_indices] = tfs
+        temp_1 = lam * (all_tfs / term_statistics.doc_lengths)
+        temp_2 = (1 - lam) * (token_ttf / term_statistics.vocabulary_size)
+        scores += np.log(temp_1 + temp_2)
+    return term_statistics.get_scores(scores)
+
+
+def get_term_statistics(index_name=Constants.AP_DATA_INDEX_NAME):
+    """
+    :return: TermStatistics of the index, the term vectors are fetched from Elasticsearch only if there is no
+    snapshot of the index yet
+    """
+    file_path = TermStatistics.get_term_statistics_file_path(index_name)
+    if os.path.isfile(file_path):
+        return TermStatistics(file_path)
+    return TermStatistics.snapshot(index_name, file_path)
+
+
+def find_scores_locally_and_write_to_file(queries, score_calculator, file_name, term_statistics, result_sub_dir=None,
+                                          **kwargs):
+    results_to_write = []
+    for query in queries:
+        scores = score_calculator(term_statistics, query, **kwargs)
+        scores.sort(reverse=True)
+        results_to_write.extend(transform_scores_for_writing_to_file(scores, query))
+
+    file_path = 'results'
+    if result_sub_dir:
+        file_path = '{}/{}'.format(file_path, result_sub_dir)
+    file_path = '{}/{}.txt'.format(file_path, file_name)
+
+    Utils.write_results_to_file(file_path, results_to_write)
+
+
+@timing
+def find_scores_using_term_statistics(queries):
+    term_statistics = get_term_statistics()
+    for score_calculator, file_name in [
+        (calculate_okapi_tf_scores_locally, 'okapi_tf'),
+        (calculate_okapi_tf_idf_scores_locally, 'okapi_tf_idf'),
+        (calculate_okapi_bm25_scores_locally, 'okapi_bm25'),
+        (calculate_unigram_lm_with_laplace_smoothing_scores_locally, 'unigram_lm_with_laplace_smoothing'),
+        (calculate_unigram_lm_with_jelinek_mercer_smoothing_scores_locally, 'unigram_lm_with_jelinek_mercer_smoothing')
+    ]:
+        find_scores_locally_and_write_to_file(queries, score_calculator, file_name, term_statistics)
+
+
 if __name__ == '__main__':
     Utils.configure_logging()
     # create_ap_data_index_and_insert_documents()
@@ -488,6 +604,7 @@ if __name__ == '__main__':
     # find_scores_using_okapi_bm25(_queries)
     # find_scores_using_unigram_lm_with_laplace_smoothing(_queries)
     # find_scores_using_unigram_lm_with_jelinek_mercer_smoothing(_queries)
+    # find_scores_using_term_statistics(_queries)
 
     # find_scores_using_okapi_tf_with_custom_feedback(_queries)
     # find_scores_using_okapi_tf_idf_with_custom_feedback(_queries)
@@ -1,6 +1,10 @@
+import concurrent.futures
+import itertools
 import logging
 import re
 
+from constants.constants import Constants
+
 
 class TRECParser:
     def __init__(self, file_encoding) -> None:
@@ -128,3 +132,140 @@ class TRECParser:
                     documents.append(document)
 
         return documents
+
+
+class StreamingTRECParser:
+    """
+    Produces the same documents as TRECParser, one at a time.
+    The file is read in large chunks which are split at the </DOC> lines, only the lines of a single document are then
+    walked to find its tags, the text and the head are sliced out of the document instead of joined line by line.
+    """
+
+    def __init__(self, file_encoding, read_size: int = Constants.TREC_PARSER_READ_SIZE) -> None:
+        self.file_encoding = file_encoding
+        self.read_size = read_size
+
+    @staticmethod
+    def _find_line_end(text: str, pos: int) -> int:
+        """
+        :return: position following the new line which ends the line of pos, or the length of the text
+        """
+        end = text.find('\n', pos)
+        return len(text) if end == -1 else end + 1
+
+    @classmethod
+    def _find_end_line(cls, text: str, end_tag: str, pos: int):
+        """
+        :return: tuple of the start and of the end of the first line from pos which ends with the end tag,
+        or None if there is no such line
+        """
+        while True:
+            tag_pos = text.find(end_tag, pos)
+            if tag_pos == -1:
+                return None
+
+            line_end = cls._find_line_end(text, tag_pos)
+            if tag_pos + len(end_tag) == line_end or text[tag_pos + len(end_tag):line_end].isspace():
+                return text.rfind('\n', 0, tag_pos) + 1, line_end
+            pos = tag_pos + len(end_tag)
+
+    @classmethod
+    def _append_section(cls, document, key, section):
+        old_section = document.get(key, '')
+        document[key] = '{}\n{}'.format(old_section, section) if old_section else section
+
+    @classmethod
+    def _parse_document(cls, text: str):
+        document = {}
+        pos = 0
+        while pos < len(text):
+            line_end = cls._find_line_end(text, pos)
+            line = text[pos:line_end]
+
+            if line.startswith('<DOCNO>'):
+                stripped_line = line.rstrip()
+                if not stripped_line.endswith('</DOCNO>'):
+                    raise RuntimeError('line does not end with doc_no end tag')
+                doc_no = stripped_line[len('<DOCNO>'):stripped_line.rfind('</DOCNO>')].strip()
+                if not doc_no:
+                    raise RuntimeError('Empty doc_no in line: {}'.format(line))
+                document['id'] = doc_no
+            elif line.startswith('<TEXT>'):
+                end_line = cls._find_end_line(text, '</TEXT>', line_end)
+                if not end_line:
+                    raise RuntimeError('unexpected EOF while parsing text')
+                cls._append_section(document, 'text', text[line_end:end_line[0]])
+                line_end = end_line[1]
+            elif line.startswith('<HEAD>'):
+                end_line = cls._find_end_line(text, '</HEAD>', pos)
+                if not end_line:
+                    raise RuntimeError('unexpected EOF while parsing head')
+                # the new line of the last line of the head is not part of it
+                head_end = text.rfind('</HEAD>', end_line[0], end_line[1])
+                head_start = pos + len('<HEAD>')
+                if end_line[0] == pos:
+                    cls._append_section(document, 'head', text[head_start:head_end])
+                else:
+                    cls._append_section(document, 'head', text[head_start:line_end].rstrip('\n') +
+                                        text[line_end:head_end])
+                line_end = end_line[1]
+
+            pos = line_end
+
+        for attr in ['id', 'text']:
+            if attr not in document:
+                raise RuntimeError('Document does not have the "{}"'.format(attr))
+        document['length'] = document['text'].count(' ')
+        return document
+
+    def parse(self, file_path: str):
+        """
+        :param file_path:
+        :return: generator of the documents of the file, in the order of the file
+        """
+        no_of_documents = 0
+        with open(file_path, encoding=self.file_encoding) as file:
+            logging.debug('Parsing file: {}'.format(file_path))
+            buffer = ''
+            while True:
+                chunk = file.read(self.read_size)
+                buffer += chunk
+
+                pos = 0
+                while True:
+                    end_line = self._find_end_line(buffer, '</DOC>', pos)
+                    # the last line of the buffer may continue in the next chunk
+                    if not end_line or (end_line[1] == len(buffer) and chunk and not buffer.endswith('\n')):
+                        break
+                    yield self._parse_document(buffer[pos:end_line[1]])
+                    no_of_documents += 1
+                    pos = end_line[1]
+
+                buffer = buffer[pos:]
+                if not chunk:
+                    break
+
+        logging.debug('{} documents parsed from file: {}'.format(no_of_documents, file_path))
+
+    def parse_to_list(self, file_path: str) -> list:
+        return list(self.parse(file_path))
+
+    def parse_files(self, file_paths: list, no_of_workers: int = Constants.NO_OF_PARALLEL_PARSING_TASKS):
+        """
+        Parses the files in parallel, a worker parses a whole file at a time
+        :param file_paths:
+        :param no_of_workers:
+        :return: generator of the documents of all the files, the documents of a file are yielded as soon as the file
+        is parsed hence the files are not in their given order
+        """
+        file_paths = iter(file_paths)
+        with concurrent.futures.ProcessPoolExecutor(no_of_workers) as pool:
+            # at most two files per worker are parsed ahead of the consumer
+            futures = {pool.submit(self.parse_to_list, file_path) for file_path in
+                       itertools.islice(file_paths, no_of_workers * 2)}
+            while futures:
+                done, futures = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+                    for file_path in itertools.islice(file_paths, 1):
+                        futures.add(pool.submit(self.parse_to_list, file_path))
@@ -0,0 +1,112 @@
+import logging
+import os
+from array import array
+
+import numpy as np
+
+from HW_1.es_utils import EsUtils
+from constants.constants import Constants
+from utils.decorators import timing
+from utils.utils import Utils
+
+
+class TermStatistics:
+    """
+    Snapshot of the term vectors of an Elasticsearch index, taken once, so that the models score the whole collection
+    locally instead of fetching the term vectors of every document for every query.
+    The tfs are stored as a sparse matrix of the documents by the terms in the CSR layout, the postings of every term
+    are built from it when the snapshot is loaded. The df and the ttf of the terms are computed over the snapshot.
+    """
+
+    def __init__(self, file_path: str) -> None:
+        with np.load(file_path) as snapshot:
+            self.document_ids = snapshot['document_ids'].tolist()
+            self.terms = {term: term_id for term_id, term in enumerate(snapshot['terms'].tolist())}
+            doc_indptr = snapshot['doc_indptr']
+            term_indices = snapshot['term_indices']
+            tfs = snapshot['tfs']
+            self.total_documents = int(snapshot['total_documents'])
+            self.avg_doc_len = float(snapshot['avg_doc_len'])
+            self.vocabulary_size = int(snapshot['vocabulary_size'])
+
+        # the doc length of the HW_1 models is the number of distinct terms of the document
+        self.doc_lengths = np.diff(doc_indptr).astype(np.float64)
+
+        # postings of every term, sorted by the index of the document
+        order = np.argsort(term_indices, kind='stable')
+        self.posting_doc_indices = np.repeat(np.arange(len(self.document_ids)), np.diff(doc_indptr))[order]
+        self.posting_tfs = tfs[order].astype(np.float64)
+        self.term_indptr = np.zeros(len(self.terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_indices, minlength=len(self.terms)), out=self.term_indptr[1:])
+        self.ttfs = np.add.reduceat(self.posting_tfs, self.term_indptr[:-1]) if len(self.posting_tfs) else \
+            np.zeros(len(self.terms))
+
+    def get_postings(self, term):
+        """
+        :return: tuple of the indices of the documents containing the term and of the tfs of the term in them
+        """
+        term_id = self.terms.get(term)
+        if term_id is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+
+        start, end = self.term_indptr[term_id], self.term_indptr[term_id + 1]
+        return self.posting_doc_indices[start:end], self.posting_tfs[start:end]
+
+    def get_doc_freq(self, term) -> int:
+        term_id = self.terms.get(term)
+        return int(self.term_indptr[term_id + 1] - self.term_indptr[term_id]) if term_id is not None else 0
+
+    def get_ttf(self, term) -> int:
+        term_id = self.terms.get(term)
+        return int(self.ttfs[term_id]) if term_id is not None else 0
+
+    def get_scores(self, scores):
+        """
+        :param scores: score of every document of the snapshot
+        :return: list of (score, doc id) tuples, as returned by the score calculators working over Elasticsearch
+        """
+        return list(zip(scores.tolist(), self.document_ids))
+
+    @classmethod
+    def get_term_statistics_dir(cls):
+        return '{}/{}'.format(Utils.get_data_dir_abs_path(), 'term-statistics')
+
+    @classmethod
+    def get_term_statistics_file_path(cls, index_name: str):
+        return '{}/{}.npz'.format(cls.get_term_statistics_dir(), index_name)
+
+    @classmethod
+    @timing
+    def snapshot(cls, index_name: str, file_path: str, chunk_size: int = Constants.TERM_STATISTICS_CHUNK_SIZE):
+        """
+        Fetches the term vectors of all the documents of the index once, chunk_size documents at a time
+        :return: TermStatistics of the index
+        """
+        all_document_ids = EsUtils.get_all_document_ids(index_name)
+        document_ids = []
+        terms = {}
+        doc_indptr = array('q', [0])
+        term_indices = array('I')
+        tfs = array('I')
+        for start in range(0, len(all_document_ids), chunk_size):
+            term_vectors = EsUtils.get_termvectors(index_name, all_document_ids[start:start + chunk_size],
+                                                   Constants.ES_TIMEOUT * 10, term_statistics=False)
+            for term_vector in term_vectors:
+                # the documents without any term are not scored by the models
+                if not term_vector.get('term_vectors'):
+                    continue
+
+                document_ids.append(term_vector['_id'])
+                for term, value in term_vector['term_vectors']['text']['terms'].items():
+                    term_indices.append(terms.setdefault(term, len(terms)))
+                    tfs.append(value['term_freq'])
+                doc_indptr.append(len(term_indices))
+            logging.info('Term vectors of {} documents fetched'.format(min(start + chunk_size, len(all_document_ids))))
+
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        np.savez(file_path, document_ids=np.array(document_ids), terms=np.array(list(terms)),
+                 doc_indptr=np.frombuffer(doc_indptr, dtype=np.int64),
+                 term_indices=np.frombuffer(term_indices, dtype=np.uint32), tfs=np.frombuffer(tfs, dtype=np.uint32),
+                 total_documents=len(all_document_ids), avg_doc_len=EsUtils.get_average_doc_length(index_name),
+                 vocabulary_size=EsUtils.get_vocabulary_size(index_name))
+        return cls(file_path)
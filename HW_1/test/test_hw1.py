@@ -0,0 +1,171 @@
+import math
+import random
+from collections import Counter
+
+import pytest
+
+import HW_1.main as hw1
+from HW_1.es_utils import EsUtils
+from HW_1.parser import TRECParser, StreamingTRECParser
+from HW_1.term_statistics import TermStatistics
+from utils.utils import Utils
+
+
+@pytest.fixture
+def documents():
+    # zipf distributed words, some documents are empty
+    rng = random.Random(7)
+    words = ['w{}'.format(i) for i in range(60)]
+    weights = [1 / (i + 1) for i in range(len(words))]
+    return {'AP-{}'.format(i): rng.choices(words, weights, k=rng.randint(1, 60)) if i % 40 else []
+            for i in range(300)}
+
+
+@pytest.fixture
+def es_utils(documents, monkeypatch):
+    """
+    EsUtils over the documents, the term vectors of the documents are computed as Elasticsearch does for a single shard
+    """
+    ttf, doc_freq = Counter(), Counter()
+    for terms in documents.values():
+        ttf.update(terms)
+        doc_freq.update(set(terms))
+
+    def get_termvectors(cls, index_name, document_ids, timeout=None, term_statistics=True):
+        term_vectors = []
+        for document_id in document_ids:
+            term_freq = Counter(documents[document_id])
+            terms = {term: {'term_freq': tf, 'ttf': ttf[term], 'doc_freq': doc_freq[term]} if term_statistics
+                     else {'term_freq': tf} for term, tf in term_freq.items()}
+            term_vectors.append({'_id': document_id, 'term_vectors': {'text': {'terms': terms}} if terms else {}})
+        return term_vectors
+
+    non_empty_documents = [terms for terms in documents.values() if terms]
+    average_doc_length = sum(len(set(terms)) for terms in non_empty_documents) / len(non_empty_documents)
+    monkeypatch.setattr(EsUtils, 'get_termvectors', classmethod(get_termvectors))
+    monkeypatch.setattr(EsUtils, 'get_all_document_ids', classmethod(lambda cls, index_name: list(documents)))
+    monkeypatch.setattr(EsUtils, 'get_average_doc_length', classmethod(lambda cls, index_name: average_doc_length))
+    monkeypatch.setattr(EsUtils, 'get_vocabulary_size', classmethod(lambda cls, index_name: len(ttf)))
+    return EsUtils
+
+
+@pytest.fixture
+def term_statistics(es_utils, tmpdir):
+    return TermStatistics.snapshot('ap_data', str(tmpdir.join('term-statistics.npz')), chunk_size=37)
+
+
+@pytest.fixture
+def queries():
+    rng = random.Random(3)
+    terms = ['w{}'.format(i) for i in range(60)] + ['missing']
+    return [{'id': str(ix), 'tokens': [rng.choice(terms) for _ in range(rng.randint(1, 5))]} for ix in range(20)]
+
+
+def assert_scores(local_scores, es_scores):
+    assert dict((doc_id, score) for score, doc_id in local_scores) == pytest.approx(
+        dict((doc_id, score) for score, doc_id in es_scores))
+
+
+def test_term_statistics(documents, term_statistics):
+    # the documents without any term are left out
+    assert term_statistics.document_ids == [document_id for document_id, terms in documents.items() if terms]
+    assert term_statistics.total_documents == len(documents)
+
+    term_vectors = EsUtils.get_termvectors('ap_data', list(documents))
+    for term in ['w0', 'w30', 'missing']:
+        ttf = sum(Counter(terms)[term] for terms in documents.values())
+        doc_freq = sum(term in terms for terms in documents.values())
+        assert (term_statistics.get_ttf(term), term_statistics.get_doc_freq(term)) == (ttf, doc_freq)
+
+        doc_indices, tfs = term_statistics.get_postings(term)
+        assert {term_statistics.document_ids[ix]: tf for ix, tf in zip(doc_indices.tolist(), tfs.tolist())} == {
+            term_vector['_id']: term_vector['term_vectors']['text']['terms'][term]['term_freq']
+            for term_vector in term_vectors if term in term_vector['term_vectors'].get('text', {}).get('terms', {})}
+
+
+def test_local_scores(documents, term_statistics, queries):
+    document_ids = list(documents)
+    total_documents = len(documents)
+    vocabulary_size = EsUtils.get_vocabulary_size('ap_data')
+    for query in queries:
+        assert_scores(hw1.calculate_okapi_tf_scores_locally(term_statistics, query),
+                      hw1.calculate_okapi_tf_scores(document_ids, query))
+        assert_scores(hw1.calculate_okapi_tf_idf_scores_locally(term_statistics, query),
+                      hw1.calculate_okapi_tf_idf_scores(document_ids, query, total_documents))
+        assert_scores(hw1.calculate_okapi_bm25_scores_locally(term_statistics, query),
+                      hw1.calculate_okapi_bm25_scores(document_ids, query, total_documents))
+        assert_scores(hw1.calculate_unigram_lm_with_laplace_smoothing_scores_locally(term_statistics, query),
+                      hw1.calculate_unigram_lm_with_laplace_smoothing_scores(document_ids, query, vocabulary_size))
+        assert_scores(hw1.calculate_unigram_lm_with_jelinek_mercer_smoothing_scores_locally(term_statistics, query),
+                      hw1.calculate_unigram_lm_with_jelinek_mercer_smoothing_scores(document_ids, query,
+                                                                                    vocabulary_size))
+
+
+def test_local_jelinek_mercer_scores_use_collection_ttf(documents, term_statistics):
+    """
+    Scored over Elasticsearch, the ttf of a term missing from a document is taken from the other documents of the same
+    chunk, a term missing from the whole chunk is not scored. The local scores use the ttf of the collection.
+    """
+    lam = 0.8
+    vocabulary_size = EsUtils.get_vocabulary_size('ap_data')
+    term = 'w59'
+    assert term_statistics.get_ttf(term) > 0
+    chunk_document_ids = [document_id for document_id, terms in documents.items() if terms and term not in terms][:10]
+    query = {'id': '1', 'tokens': ['w0', term]}
+
+    local_scores = dict((doc_id, score) for score, doc_id in
+                        hw1.calculate_unigram_lm_with_jelinek_mercer_smoothing_scores_locally(term_statistics, query,
+                                                                                              lam))
+    missing_term_score = math.log((1 - lam) * (term_statistics.get_ttf(term) / vocabulary_size))
+    for score, doc_id in hw1.calculate_unigram_lm_with_jelinek_mercer_smoothing_scores(chunk_document_ids, query,
+                                                                                         vocabulary_size, lam):
+        assert local_scores[doc_id] == pytest.approx(score + missing_term_score)
+
+
+@pytest.fixture
+def trec_file_paths(tmpdir):
+    """
+    TREC files with multi line heads, several text sections per document and trailing spaces after the end tags
+    """
+    rng = random.Random(11)
+    words = ['w{}'.format(i) for i in range(30)]
+    file_paths = []
+    for file_ix in range(5):
+        lines = []
+        for doc_ix in range(rng.randint(1, 20)):
+            lines.extend(['<DOC>', '<DOCNO> AP-{}-{} </DOCNO>'.format(file_ix, doc_ix), '<FILEID>AP</FILEID>'])
+            if doc_ix % 3 == 0:
+                lines.append('<HEAD>{}</HEAD>'.format(' '.join(rng.sample(words, 3))))
+            elif doc_ix % 3 == 1:
+                head_words = rng.sample(words, 3)
+                lines.extend(['<HEAD>{}'.format(head_words[0]), head_words[1], '{}</HEAD>  '.format(head_words[2])])
+            for _ in range(rng.randint(1, 2)):
+                lines.append('<TEXT>')
+                lines.extend(' '.join(rng.choices(words, k=rng.randint(0, 12))) for _ in range(rng.randint(0, 4)))
+                lines.append('</TEXT> ')
+            lines.append('</DOC>')
+
+        file_path = tmpdir.join('ap890{}'.format(file_ix))
+        file_path.write('\n'.join(lines) + '\n')
+        file_paths.append(str(file_path))
+    return file_paths
+
+
+def test_streaming_trec_parser(trec_file_paths):
+    trec_parser = TRECParser('utf-8')
+    expected_documents = [document for file_path in trec_file_paths for document in trec_parser.parse(file_path)]
+    assert len(expected_documents) > len(trec_file_paths)
+
+    # the small reads split the documents and their lines across the chunks
+    parser = StreamingTRECParser('utf-8', read_size=7)
+    assert [document for file_path in trec_file_paths for document in parser.parse(file_path)] == expected_documents
+
+    # the files are parsed by the workers in any order
+    documents = list(parser.parse_files(trec_file_paths, no_of_workers=2))
+    assert sorted(documents, key=lambda document: document['id']) == sorted(expected_documents,
+                                                                            key=lambda document: document['id'])
+
+
+if __name__ == '__main__':
+    Utils.configure_logging()
+    pytest.main()
@@ -0,0 +1,135 @@
+import logging
+import multiprocessing
+import os
+from array import array
+from collections import deque
+from itertools import islice
+
+import numpy as np
+
+from constants.constants import Constants
+from utils.decorators import timing
+from utils.utils import Utils
+
+
+class AnalysisCache:
+    """
+    Columnar file of the analyzed, unstemmed terms of the text and of the head of every document, stored as ids into
+    the vocabulary of the collection along with the stem of every term of the vocabulary.
+    The indexes with and without the head or stemming are all built from a single analysis of the collection, the
+    documents are neither tokenized nor stemmed again.
+    """
+    # analyzer of the worker process
+    _analyzer = None
+
+    def __init__(self, file_path: str) -> None:
+        self.file_path = file_path
+        with np.load(file_path) as cache:
+            self.document_ids = cache['document_ids'].tolist()
+            # offsets of the terms of the text and of the head of every document, one after the other
+            self.offsets = cache['offsets'].tolist()
+            self.term_ids = cache['term_ids']
+            self.terms = cache['terms'].tolist()
+            self.stemmed_terms = cache['stems'][cache['stem_ids']].tolist()
+
+    def __len__(self) -> int:
+        return len(self.document_ids)
+
+    def iterate_documents(self, enable_stemming: bool):
+        """
+        :return: generator of the analyzed documents, see CustomIndex.index_documents
+        """
+        vocabulary = self.stemmed_terms if enable_stemming else self.terms
+        offsets = self.offsets
+        for ix, document_id in enumerate(self.document_ids):
+            text_term_ids = self.term_ids[offsets[2 * ix]:offsets[(2 * ix) + 1]].tolist()
+            head_term_ids = self.term_ids[offsets[(2 * ix) + 1]:offsets[(2 * ix) + 2]].tolist()
+            yield {
+                'id': document_id,
+                'text_terms': [vocabulary[term_id] for term_id in text_term_ids],
+                'head_terms': [vocabulary[term_id] for term_id in head_term_ids]
+            }
+
+    @classmethod
+    def get_analysis_cache_dir(cls):
+        return '{}/{}/{}'.format(Utils.get_data_dir_abs_path(), 'custom-index', 'analysis-cache')
+
+    @classmethod
+    def get_new_analysis_cache_file_path(cls):
+        return '{}/{}.npz'.format(cls.get_analysis_cache_dir(), Utils.get_random_file_name_with_ts())
+
+    @classmethod
+    def _init_worker(cls, analyzer):
+        cls._analyzer = analyzer
+
+    @classmethod
+    def _analyze_documents(cls, documents):
+        """
+        :return: tuple of the ids of the documents, of the terms of the batch, of the ids of the terms of every
+        document into them and of the number of terms of the text and of the head of every document
+        """
+        term_ids = {}
+        batch_term_ids = array('I')
+        field_lengths = []
+        for document in documents:
+            for text in [document['text'], document.get('head', '')]:
+                terms = cls._analyzer.analyze_terms(text, False)
+                batch_term_ids.extend(term_ids.setdefault(term, len(term_ids)) for term in terms)
+                field_lengths.append(len(terms))
+
+        return [document['id'] for document in documents], list(term_ids), batch_term_ids, field_lengths
+
+    @classmethod
+    def _split_documents_into_batches(cls, documents, batch_size):
+        iterator = iter(documents)
+        while True:
+            batch = list(islice(iterator, batch_size))
+            if not batch:
+                return
+            yield batch
+
+    @classmethod
+    @timing
+    def build(cls, documents, analyzer, file_path: str, no_of_workers: int = Constants.NO_OF_PARALLEL_INDEXING_TASKS):
+        """
+        Analyzes the documents in parallel, the documents are not held in memory, only the ids of their terms
+        :param documents: iterable of parsed documents
+        :param analyzer: Analyzer, the terms are stemmed with its stemmer
+        :param file_path:
+        :param no_of_workers:
+        :return: AnalysisCache of the documents
+        """
+        document_ids = []
+        term_ids = {}
+        all_term_ids = array('I')
+        offsets = array('q', [0])
+
+        batches = cls._split_documents_into_batches(documents, Constants.INDEXING_BATCH_SIZE)
+        with multiprocessing.Pool(no_of_workers, initializer=cls._init_worker, initargs=(analyzer,)) as pool:
+            # the batches are analyzed in their order, at most two batches per worker ahead of the one being merged
+            async_results = deque(pool.apply_async(cls._analyze_documents, (batch,))
+                                  for batch in islice(batches, no_of_workers * 2))
+            while async_results:
+                batch_document_ids, batch_terms, batch_term_ids, field_lengths = async_results.popleft().get()
+                for batch in islice(batches, 1):
+                    async_results.append(pool.apply_async(cls._analyze_documents, (batch,)))
+
+                # the ids of the terms of the batch are mapped to the ids of the terms of the collection
+                batch_term_id_mapping = np.array([term_ids.setdefault(term, len(term_ids)) for term in batch_terms],
+                                                 dtype=np.uint32)
+                all_term_ids.extend(batch_term_id_mapping[np.frombuffer(batch_term_ids, dtype=np.uint32)].tolist())
+                document_ids.extend(batch_document_ids)
+                for field_length in field_lengths:
+                    offsets.append(offsets[-1] + field_length)
+
+        terms = list(term_ids)
+        stems = {}
+        stem_ids = [stems.setdefault(analyzer.stemmer.stem(term), len(stems)) for term in terms]
+        logging.info('Analysis cache of {} documents, {} terms and {} stems'.format(len(document_ids), len(terms),
+                                                                                    len(stems)))
+
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        np.savez(file_path, document_ids=np.array(document_ids), offsets=np.frombuffer(offsets, dtype=np.int64),
+                 term_ids=np.frombuffer(all_term_ids, dtype=np.uint32), terms=np.array(terms),
+                 stems=np.array(list(stems)), stem_ids=np.array(stem_ids, dtype=np.uint32))
+        return cls(file_path)
@@ -0,0 +1,58 @@
+from constants.constants import Constants
+
+
+class Analyzer:
+    """
+    Tokenization, stopwords removal and stemming of a text in a single pass, producing the same terms as the
+    tokenizer, the stopwords filter and the stemmer applied one after the other.
+    The terms are returned as a plain list, the position of a term is its index + 1. The stem of every word is
+    memoized, since the same few words make most of the occurrences of a collection.
+    """
+
+    def __init__(self, tokenizer, stopwords_filter, stemmer, stem_cache_size: int = Constants.STEM_CACHE_SIZE) -> None:
+        self.split_regex = tokenizer.split_regex
+        self.stop_words = stopwords_filter.stop_words
+        self.stemmer = stemmer
+        self.stem_cache_size = stem_cache_size
+        self.stems = {}
+
+    def _split(self, text: str) -> list:
+        try:
+            text.encode('ascii')
+        except UnicodeEncodeError:
+            return [token.lower() for token in self.split_regex.findall(text)]
+
+        # lowering the whole text at once, it cannot change the boundaries of the ascii tokens
+        return self.split_regex.findall(text.lower())
+
+    def _stem(self, terms: list) -> list:
+        stems = self.stems
+        stemmed_terms = []
+        for term in terms:
+            stem = stems.get(term)
+            if stem is None:
+                stem = self.stemmer.stem(term)
+                # once the cache is full the rare words are stemmed every time, the frequent ones are cached by then
+                if len(stems) < self.stem_cache_size:
+                    stems[term] = stem
+            stemmed_terms.append(stem)
+
+        return stemmed_terms
+
+    def analyze_terms(self, text: str, enable_stemming: bool) -> list:
+        """
+        :return: list of the terms of the text, the position of a term is its index + 1
+        """
+        stop_words = self.stop_words
+        terms = [token for token in self._split(text) if token not in stop_words]
+        if enable_stemming:
+            terms = self._stem(terms)
+
+        return terms
+
+    def analyze(self, text: str, enable_stemming: bool) -> list:
+        """
+        :return: list of (term, position) tuples
+        """
+        terms = self.analyze_terms(text, enable_stemming)
+        return list(zip(terms, range(1, len(terms) + 1)))
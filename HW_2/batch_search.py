@@ -0,0 +1,76 @@
+import logging
+import multiprocessing
+
+from HW_1.main import transform_scores_for_writing_to_file
+from HW_2.factory import Factory
+from HW_2.indexer import CustomIndex
+from constants.constants import Constants
+
+
+class BatchSearcher:
+    """
+    Runs a batch of queries over a pool of processes.
+    Every worker opens the same index read-only, memory mapped, so the postings pages are shared through the page
+    cache instead of being copied into every process.
+    """
+    # index opened by the worker process
+    _custom_index = None
+
+    @classmethod
+    def get_top_k(cls, scores, custom_index: CustomIndex, k: int = 1000) -> list:
+        """
+        :param scores: list of (score, internal doc id) tuples
+        :return: list of the top-k (score, external doc id) tuples, sorted by score in descending order
+        """
+        scores = sorted(scores, reverse=True)[:k]
+        # the scores are computed over the internal doc ids, the results are written with the external ids
+        return [(score, custom_index.get_external_document_id(doc_id)) for score, doc_id in scores]
+
+    @classmethod
+    def transform_scores_for_writing(cls, scores, query, custom_index: CustomIndex, k: int = 1000) -> list:
+        """
+        :param scores: list of (score, internal doc id) tuples
+        :return: top-k results of the query in the format of Utils.write_results_to_file
+        """
+        return transform_scores_for_writing_to_file(cls.get_top_k(scores, custom_index, k), query)
+
+    @classmethod
+    def _init_worker(cls, metadata_file_path):
+        cls._custom_index = Factory.open_index(metadata_file_path)
+
+    @classmethod
+    def _search(cls, args):
+        score_calculator, query, kwargs = args
+        scores = score_calculator(query, custom_index=cls._custom_index, **kwargs)
+        return cls.get_top_k(scores, cls._custom_index)
+
+    @classmethod
+    def search_top_k(cls, metadata_file_path, queries, score_calculator,
+                     no_of_workers=Constants.NO_OF_PARALLEL_SEARCH_TASKS, chunk_size=Constants.SEARCH_CHUNK_SIZE,
+                     **kwargs) -> list:
+        """
+        :param metadata_file_path: metadata file of the index to search, or manifest file of a segmented index
+        :param queries: analyzed queries
+        :param score_calculator: picklable function called as score_calculator(query, custom_index=..., **kwargs),
+        returning a list of (score, internal doc id) tuples, e.g. HW2.calculate_okapi_bm25_scores
+        :return: top-k (score, external doc id) tuples of every query, in the order of the queries
+        """
+        if not queries:
+            return []
+
+        logging.info('Searching {} queries with {} workers'.format(len(queries), no_of_workers))
+        with multiprocessing.Pool(no_of_workers, initializer=cls._init_worker,
+                                  initargs=(metadata_file_path,)) as pool:
+            return list(pool.imap(cls._search, ((score_calculator, query, kwargs) for query in queries),
+                                  chunksize=chunk_size))
+
+    @classmethod
+    def search(cls, metadata_file_path, queries, score_calculator, no_of_workers=Constants.NO_OF_PARALLEL_SEARCH_TASKS,
+               chunk_size=Constants.SEARCH_CHUNK_SIZE, **kwargs) -> list:
+        """
+        :return: results of all the queries, in the order of the queries, in the format of Utils.write_results_to_file
+        """
+        query_scores = cls.search_top_k(metadata_file_path, queries, score_calculator, no_of_workers, chunk_size,
+                                        **kwargs)
+        return [result for query, scores in zip(queries, query_scores)
+                for result in transform_scores_for_writing_to_file(scores, query)]
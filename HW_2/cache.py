@@ -0,0 +1,208 @@
+import hashlib
+import heapq
+import itertools
+import logging
+import os
+import pickle
+
+from constants.constants import Constants
+
+
+class CacheStatistics:
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.insertions = 0
+        self.evictions = 0
+        self.rejections = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hit_rate,
+            'insertions': self.insertions,
+            'evictions': self.evictions,
+            'rejections': self.rejections
+        }
+
+
+class _CacheEntry:
+    __slots__ = ['value', 'size', 'frequency', 'priority']
+
+    def __init__(self, value, size: int, priority: float) -> None:
+        self.value = value
+        self.size = size
+        self.frequency = 1
+        self.priority = priority
+
+
+class PostingsCache:
+    """
+    Cache of decoded postings bounded by their estimated size in bytes, with Greedy-Dual-Size-Frequency eviction.
+    Every entry gets the priority clock + frequency / size, the entry with the lowest priority is evicted first and its
+    priority becomes the new clock, so that entries which stopped being used age out even if they were hot once.
+    Small and frequently used postings are kept over large or rarely used ones.
+    """
+    # the heap is rebuilt once the outdated items outnumber the entries by this factor
+    _HEAP_COMPACTION_FACTOR = 4
+
+    def __init__(self, max_size_in_bytes: int) -> None:
+        self.max_size_in_bytes = max_size_in_bytes
+        self.size_in_bytes = 0
+        self.clock = 0.0
+        self.entries = {}
+        # (priority, insertion order, key), items whose priority is outdated are skipped when evicting
+        self.heap = []
+        self.counter = itertools.count()
+        self.statistics = CacheStatistics()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key) -> bool:
+        return key in self.entries
+
+    def _push(self, key, entry: _CacheEntry):
+        entry.priority = self.clock + (entry.frequency / entry.size)
+        heapq.heappush(self.heap, (entry.priority, next(self.counter), key))
+
+        if len(self.heap) > self._HEAP_COMPACTION_FACTOR * (len(self.entries) + 1):
+            self.heap = [(entry.priority, next(self.counter), key) for key, entry in self.entries.items()]
+            heapq.heapify(self.heap)
+
+    def _evict(self):
+        while self.heap:
+            priority, _, key = heapq.heappop(self.heap)
+            entry = self.entries.get(key)
+            if entry is not None and entry.priority == priority:
+                del self.entries[key]
+                self.size_in_bytes -= entry.size
+                self.clock = priority
+                self.statistics.evictions += 1
+                return
+
+    def get(self, key, default=None):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.statistics.misses += 1
+            return default
+
+        self.statistics.hits += 1
+        entry.frequency += 1
+        self._push(key, entry)
+        return entry.value
+
+    def put(self, key, value, size: int):
+        """
+        :param key:
+        :param value:
+        :param size: estimated size of the value in bytes
+        :return:
+        """
+        size = max(size, 1)
+        if size > self.max_size_in_bytes:
+            self.statistics.rejections += 1
+            return
+
+        self.remove(key)
+        while self.size_in_bytes + size > self.max_size_in_bytes:
+            self._evict()
+
+        entry = _CacheEntry(value, size, 0.0)
+        self.entries[key] = entry
+        self.size_in_bytes += size
+        self._push(key, entry)
+        self.statistics.insertions += 1
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size_in_bytes -= entry.size
+
+    def clear(self):
+        self.entries = {}
+        self.heap = []
+        self.size_in_bytes = 0
+        self.clock = 0.0
+
+    def get_statistics(self) -> dict:
+        statistics = self.statistics.to_dict()
+        statistics.update({
+            'entries': len(self.entries),
+            'size_in_bytes': self.size_in_bytes,
+            'max_size_in_bytes': self.max_size_in_bytes
+        })
+        return statistics
+
+
+class QueryResultCache:
+    """
+    Ranked top-k results of the analyzed queries, keyed by the index, the model, its parameters and the query.
+    The cache is persisted next to the metadata file of the index and is discarded as soon as the metadata file
+    changes, i.e. when its content, size or modification time differ from the ones the results were computed with.
+    """
+
+    def __init__(self, metadata_file_path: str) -> None:
+        self.metadata_file_path = metadata_file_path
+        self.file_path = '{}-query-results.pkl'.format(os.path.splitext(metadata_file_path)[0])
+        self.index_id = self._compute_index_id(metadata_file_path)
+        self.results = self._read_results_from_file()
+        self.statistics = CacheStatistics()
+
+    @classmethod
+    def _compute_index_id(cls, metadata_file_path):
+        file_stat = os.stat(metadata_file_path)
+        with open(metadata_file_path, 'rb') as file:
+            digest = hashlib.sha1(file.read()).hexdigest()
+        return '{}-{}-{}'.format(digest, file_stat.st_size, file_stat.st_mtime_ns)
+
+    def _read_results_from_file(self):
+        if not os.path.isfile(self.file_path):
+            return {}
+
+        with open(self.file_path, 'rb') as file:
+            cached = pickle.load(file)
+
+        if cached['index_id'] != self.index_id:
+            logging.info('Index changed, discarding the query results cached in {}'.format(self.file_path))
+            return {}
+        return cached['results']
+
+    def _create_key(self, model: str, parameters: dict, query: dict):
+        operators = tuple(repr(operator) for operator in query.get('operators', []))
+        return self.index_id, model, tuple(sorted(parameters.items())), tuple(query['tokens']), operators
+
+    def get(self, model: str, parameters: dict, query: dict):
+        """
+        :return: ranked top-k list of the query or None if it is not cached
+        """
+        results = self.results.get(self._create_key(model, parameters, query))
+        if results is None:
+            self.statistics.misses += 1
+        else:
+            self.statistics.hits += 1
+        return results
+
+    def put(self, model: str, parameters: dict, query: dict, results: list):
+        self.results[self._create_key(model, parameters, query)] = results
+        self.statistics.insertions += 1
+
+    def save(self):
+        # the file is replaced atomically, readers never see a partially written cache
+        temp_file_path = '{}.{}'.format(self.file_path, os.getpid())
+        with open(temp_file_path, 'wb') as file:
+            pickle.dump({'index_id': self.index_id, 'results': self.results}, file,
+                        protocol=Constants.PICKLE_PROTOCOL)
+        os.replace(temp_file_path, self.file_path)
+
+    def get_statistics(self) -> dict:
+        statistics = self.statistics.to_dict()
+        statistics['entries'] = len(self.results)
+        return statistics
@@ -1,5 +1,9 @@
+import base64
 import gzip
+import zlib
 from abc import abstractmethod
+from bisect import bisect_right
+from collections import Counter
 from io import BytesIO
 
 from constants.constants import Constants
@@ -20,6 +24,69 @@ class Compressor:
     def decompress_bytes(self, bytes_to_decompress: bytes) -> bytes:
         pass
 
+    def create_writer(self, file, samples=None):
+        """
+        :param file: index file opened for writing
+        :param samples: serialized termvectors representative of the ones to write, used by the compressors
+        which train a dictionary, see trains_dictionary
+        :return: writer of the termvectors into the index file
+        """
+        return RecordWriter(self, file)
+
+    def create_reader(self, file, buffer=None, compression_metadata=None):
+        """
+        :param file: index file opened for reading
+        :param buffer: memory mapped index file, the reads go through the file when absent
+        :param compression_metadata: returned by the writer of the index file
+        :return: reader of the termvectors of the index file
+        """
+        return RecordReader(self, file, buffer)
+
+    @property
+    def trains_dictionary(self) -> bool:
+        return False
+
+
+class RecordWriter:
+    """
+    Compresses every termvector on its own, the termvectors are separated by a new line
+    """
+
+    def __init__(self, compressor: Compressor, file) -> None:
+        self.compressor = compressor
+        self.file = file
+
+    def write(self, bytes_to_write: bytes):
+        """
+        :return: tuple of the position and of the size of the termvector, as stored in the catalog
+        """
+        pos = self.file.tell()
+        size = self.file.write(self.compressor.compress_bytes(bytes_to_write))
+        self.file.write(b'\n')
+        return pos, size
+
+    def close(self):
+        """
+        :return: compression metadata of the index file, stored in the metadata of the index
+        """
+        return None
+
+
+class RecordReader:
+
+    def __init__(self, compressor: Compressor, file, buffer=None) -> None:
+        self.compressor = compressor
+        self.file = file
+        self.buffer = buffer
+
+    def read(self, pos: int, size: int):
+        if self.buffer is not None:
+            compressed_bytes = self.buffer[pos:pos + size]
+        else:
+            self.file.seek(pos)
+            compressed_bytes = self.file.read(size)
+        return self.compressor.decompress_bytes(compressed_bytes)
+
 
 class GzipCompressor(Compressor):
 
@@ -68,3 +135,149 @@ class NoOpsCompressor(Compressor):
 
     def decompress_bytes(self, bytes_to_decompress: bytes) -> bytes:
         return bytes_to_decompress
+
+
+class ZlibBlockCompressor(Compressor):
+    """
+    Compresses the termvectors in blocks of about block_size bytes with a single zlib stream per block, so that the
+    small posting lists share the compression context of their neighbours instead of paying a header and a cold
+    start each. A termvector never spans two blocks, a termvector larger than block_size gets a block of its own.
+    The catalog stores the position of a termvector in the uncompressed stream, the block table maps it to the
+    compressed block holding it. With use_dictionary a preset dictionary is trained for every index out of sampled
+    termvectors and stored in its metadata, it primes the compression of every block.
+    """
+    # bytes of the byte strings counted to train the dictionary
+    _DICTIONARY_NGRAM_LENGTH = 8
+    _MAX_DICTIONARY_SAMPLE_SIZE = 1024 * 1024
+
+    def __init__(self, block_size: int = Constants.COMPRESSION_BLOCK_SIZE,
+                 level: int = Constants.ZLIB_COMPRESSION_LEVEL, use_dictionary: bool = True,
+                 dictionary_size: int = Constants.COMPRESSION_DICTIONARY_SIZE) -> None:
+        self.block_size = block_size
+        self.level = level
+        self.use_dictionary = use_dictionary
+        self.dictionary_size = dictionary_size
+
+    @property
+    def name(self) -> str:
+        return Constants.ZLIB_BLOCK_COMPRESSOR_NAME
+
+    @property
+    def trains_dictionary(self) -> bool:
+        return self.use_dictionary
+
+    def compress_bytes(self, bytes_to_compress: bytes, dictionary: bytes = b'') -> bytes:
+        compressor = zlib.compressobj(self.level, zdict=dictionary) if dictionary else zlib.compressobj(self.level)
+        return compressor.compress(bytes_to_compress) + compressor.flush()
+
+    def decompress_bytes(self, bytes_to_decompress: bytes, dictionary: bytes = b'') -> bytes:
+        decompressor = zlib.decompressobj(zdict=dictionary) if dictionary else zlib.decompressobj()
+        return decompressor.decompress(bytes_to_decompress) + decompressor.flush()
+
+    def train_dictionary(self, samples) -> bytes:
+        """
+        Most frequent byte strings of the samples, the most frequent ones last since zlib references the end of the
+        dictionary with the shortest distances
+        :param samples: serialized termvectors
+        :return: dictionary of at most dictionary_size bytes
+        """
+        ngram_length = self._DICTIONARY_NGRAM_LENGTH
+        ngram_counts = Counter()
+        sample_size = 0
+        for sample in samples:
+            sample = bytes(sample)
+            ngram_counts.update(sample[i:i + ngram_length] for i in range(0, len(sample) - ngram_length + 1))
+            sample_size += len(sample)
+            if sample_size >= self._MAX_DICTIONARY_SAMPLE_SIZE:
+                break
+
+        ngrams = [ngram for ngram, count in ngram_counts.most_common(self.dictionary_size // ngram_length)
+                  if count > 1]
+        return b''.join(reversed(ngrams))
+
+    def create_writer(self, file, samples=None):
+        dictionary = self.train_dictionary(samples) if self.use_dictionary and samples else b''
+        return BlockWriter(self, file, dictionary)
+
+    def create_reader(self, file, buffer=None, compression_metadata=None):
+        return BlockReader(self, file, buffer, compression_metadata)
+
+
+class BlockWriter:
+
+    def __init__(self, compressor: ZlibBlockCompressor, file, dictionary: bytes) -> None:
+        self.compressor = compressor
+        self.file = file
+        self.dictionary = dictionary
+        self.block = bytearray()
+        # position of the next termvector in the uncompressed stream
+        self.pos = 0
+        self.block_starts = []
+        self.block_offsets = []
+
+    def _flush_block(self):
+        if not self.block:
+            return
+
+        self.block_starts.append(self.pos - len(self.block))
+        self.block_offsets.append(self.file.tell())
+        self.file.write(self.compressor.compress_bytes(bytes(self.block), self.dictionary))
+        self.block = bytearray()
+
+    def write(self, bytes_to_write: bytes):
+        """
+        :return: tuple of the position of the termvector in the uncompressed stream and of its size
+        """
+        if self.block and len(self.block) + len(bytes_to_write) > self.compressor.block_size:
+            self._flush_block()
+
+        pos = self.pos
+        self.block.extend(bytes_to_write)
+        self.pos += len(bytes_to_write)
+        return pos, len(bytes_to_write)
+
+    def close(self):
+        self._flush_block()
+        return {
+            'block_starts': self.block_starts,
+            'block_offsets': self.block_offsets + [self.file.tell()],
+            'dictionary': base64.b64encode(self.dictionary).decode('ascii')
+        }
+
+
+class BlockReader:
+    """
+    Decompresses only the block holding the termvector, the last decompressed block is kept since the terms read
+    one after the other, e.g. while merging, are mostly in the same block
+    """
+
+    def __init__(self, compressor: ZlibBlockCompressor, file, buffer, compression_metadata) -> None:
+        self.compressor = compressor
+        self.file = file
+        self.buffer = buffer
+        self.block_starts = compression_metadata['block_starts']
+        self.block_offsets = compression_metadata['block_offsets']
+        self.dictionary = base64.b64decode(compression_metadata['dictionary'])
+        self.block_ix = -1
+        self.block = None
+
+    def _read_compressed_block(self, block_ix):
+        start, end = self.block_offsets[block_ix], self.block_offsets[block_ix + 1]
+        if self.buffer is not None:
+            return self.buffer[start:end]
+
+        self.file.seek(start)
+        return self.file.read(end - start)
+
+    def read(self, pos: int, size: int):
+        """
+        :return: memoryview over the decompressed block, the termvector is not copied
+        """
+        block_ix = bisect_right(self.block_starts, pos) - 1
+        if block_ix != self.block_ix:
+            self.block = memoryview(self.compressor.decompress_bytes(self._read_compressed_block(block_ix),
+                                                                     self.dictionary))
+            self.block_ix = block_ix
+
+        start = pos - self.block_starts[block_ix]
+        return self.block[start:start + size]
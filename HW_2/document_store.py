@@ -0,0 +1,109 @@
+import mmap
+import os
+
+import numpy as np
+
+from HW_2.compressor import ZlibBlockCompressor
+from constants.constants import Constants
+
+
+class DocumentStoreWriter:
+    """
+    Writes the head and the text of the documents into zlib compressed blocks, see ZlibBlockCompressor, and a table
+    holding the position of every document in the uncompressed stream, indexed by the internal doc id.
+    """
+    _ENCODING = 'utf-8'
+
+    def __init__(self, file_path: str, block_size: int = Constants.DOCUMENT_STORE_BLOCK_SIZE,
+                 level: int = Constants.ZLIB_COMPRESSION_LEVEL) -> None:
+        self.file_path = file_path
+        self.table_file_path = '{}-table.npz'.format(os.path.splitext(file_path)[0])
+        self.file = open(file_path, 'wb')
+        # documents share little with each other, a trained dictionary would not pay off
+        self.writer = ZlibBlockCompressor(block_size, level, use_dictionary=False).create_writer(self.file)
+        self.entries = {}
+
+    def add(self, doc_id: int, head: str, text: str):
+        head_bytes = head.encode(self._ENCODING)
+        text_bytes = text.encode(self._ENCODING)
+        pos, _ = self.writer.write(head_bytes + text_bytes)
+        self.entries[doc_id] = (pos, len(head_bytes), len(text_bytes))
+
+    def close(self) -> dict:
+        """
+        :return: paths of the files of the store, stored in the metadata of the index
+        """
+        compression_metadata = self.writer.close()
+        self.file.close()
+
+        # the rows of the absent documents have a negative position
+        documents = np.full((max(self.entries, default=-1) + 1, 3), -1, dtype=np.int64)
+        for doc_id, entry in self.entries.items():
+            documents[doc_id] = entry
+
+        np.savez(self.table_file_path, documents=documents,
+                 block_starts=np.array(compression_metadata['block_starts'], dtype=np.int64),
+                 block_offsets=np.array(compression_metadata['block_offsets'], dtype=np.int64))
+        return {'document_store_file_path': self.file_path, 'document_store_table_file_path': self.table_file_path}
+
+    def discard(self):
+        """
+        Closes the writer and deletes the files written so far
+        """
+        self.file.close()
+        for file_path in [self.file_path, self.table_file_path]:
+            if os.path.isfile(file_path):
+                os.remove(file_path)
+
+
+class DocumentStore:
+    """
+    Random access to the head and the text of the documents written by a DocumentStoreWriter, fetching a document
+    decompresses only the block holding it
+    """
+
+    def __init__(self, file_path: str, table_file_path: str) -> None:
+        self.file = open(file_path, 'rb')
+        self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(file_path) else None
+        with np.load(table_file_path) as table:
+            self.documents = table['documents']
+            compression_metadata = {
+                'block_starts': table['block_starts'].tolist(),
+                'block_offsets': table['block_offsets'].tolist(),
+                'dictionary': ''
+            }
+
+        self.buffer = memoryview(self.mmap) if self.mmap is not None else None
+        self.reader = ZlibBlockCompressor(use_dictionary=False).create_reader(self.file, self.buffer,
+                                                                              compression_metadata)
+
+    def __contains__(self, doc_id: int) -> bool:
+        return 0 <= doc_id < len(self.documents) and self.documents[doc_id, 0] >= 0
+
+    def get_document_ids(self) -> np.ndarray:
+        return np.flatnonzero(self.documents[:, 0] >= 0)
+
+    def get_document(self, doc_id: int):
+        """
+        :param doc_id: internal doc id
+        :return: dict of the head and of the text of the document or None if the document is not stored
+        """
+        if doc_id not in self:
+            return None
+
+        pos, head_size, text_size = self.documents[doc_id].tolist()
+        document_bytes = self.reader.read(pos, head_size + text_size)
+        return {
+            'head': str(document_bytes[:head_size], DocumentStoreWriter._ENCODING),
+            'text': str(document_bytes[head_size:], DocumentStoreWriter._ENCODING)
+        }
+
+    def close(self):
+        self.reader = None
+        if self.buffer is not None:
+            self.buffer.release()
+            self.buffer = None
+        if self.mmap is not None:
+            self.mmap.close()
+            self.mmap = None
+        self.file.close()
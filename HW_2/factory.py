@@ -1,8 +1,10 @@
 from nltk import SnowballStemmer
 
-from HW_2.compressor import GzipCompressor, NoOpsCompressor, Compressor
+from HW_2.analyzer import Analyzer
+from HW_2.compressor import GzipCompressor, NoOpsCompressor, Compressor, ZlibBlockCompressor
 from HW_2.indexer import CustomIndex
-from HW_2.serializer import JsonSerializer, Serializer, PickleSerializer, TermvectorSerializer
+from HW_2.segments import SegmentedIndex
+from HW_2.serializer import JsonSerializer, Serializer, PickleSerializer, TermvectorSerializer, VarByteSerializer
 from HW_2.stopwords import StopwordsFilter
 from HW_2.tokenizer import Tokenzier
 from constants.constants import Constants
@@ -17,6 +19,8 @@ class Factory:
             return GzipCompressor(Constants.BYES_TO_PROCESS_AT_ONCE_FOR_COMPRESSION)
         elif compressor_name == Constants.NO_OPS_COMPRESSOR_NAME:
             return NoOpsCompressor(Constants.AP_DATA_FILE_ENCODING)
+        elif compressor_name == Constants.ZLIB_BLOCK_COMPRESSOR_NAME:
+            return ZlibBlockCompressor(Constants.COMPRESSION_BLOCK_SIZE, Constants.ZLIB_COMPRESSION_LEVEL)
         else:
             raise ValueError('Compressor not found')
 
@@ -27,7 +31,9 @@ class Factory:
         elif serializer_name == Constants.PICKLE_SERIALIZER_NAME:
             return PickleSerializer()
         elif serializer_name == Constants.TERMVECTOR_SERIALIZER_NAME:
-            return TermvectorSerializer(Utils.get_document_id_mapping_path())
+            return TermvectorSerializer()
+        elif serializer_name == Constants.VARBYTE_SERIALIZER_NAME:
+            return VarByteSerializer()
         else:
             raise ValueError('Serializer not found')
 
@@ -55,16 +61,44 @@ class Factory:
             raise ValueError('Tokenizer not found')
 
     @classmethod
-    def create_custom_index(cls):
+    def create_analyzer(cls):
+        return Analyzer(cls.create_tokenizer(Constants.CUSTOM_TOKENIZER_NAME),
+                        cls.create_stopwords_filter(Constants.STOPWORDS_FILTER_NAME),
+                        cls.create_stemmer(Constants.SNOWBALL_STEMMER_NAME))
+
+    @classmethod
+    def create_custom_index(cls, postings_cache_size_in_bytes=Constants.POSTINGS_CACHE_SIZE_IN_BYTES):
         tokenizer = cls.create_tokenizer(Constants.CUSTOM_TOKENIZER_NAME)
         stopwords_filter = cls.create_stopwords_filter(Constants.STOPWORDS_FILTER_NAME)
         stemmer = cls.create_stemmer(Constants.SNOWBALL_STEMMER_NAME)
         # compressor = cls.create_compressor(Constants.GZIP_COMPRESSOR_NAME)
+        # compressor = cls.create_compressor(Constants.ZLIB_BLOCK_COMPRESSOR_NAME)
         compressor = cls.create_compressor(Constants.NO_OPS_COMPRESSOR_NAME)
 
+        # only the VarByte postings support the postings cursors, with the other serializers the top-k models score
+        # every document and the positional query operators are not available
         # serializer = cls.create_serializer(Constants.JSON_SERIALIZER_NAME)
-        serializer = cls.create_serializer(Constants.TERMVECTOR_SERIALIZER_NAME)
+        # serializer = cls.create_serializer(Constants.TERMVECTOR_SERIALIZER_NAME)
+        serializer = cls.create_serializer(Constants.VARBYTE_SERIALIZER_NAME)
 
         # serializer = cls.create_serializer(Constants.PICKLE_SERIALIZER_NAME)
 
-        return CustomIndex(tokenizer, stopwords_filter, stemmer, compressor, serializer)
+        return CustomIndex(tokenizer, stopwords_filter, stemmer, compressor, serializer,
+                           Utils.get_document_id_mapping_path(), postings_cache_size_in_bytes)
+
+    @classmethod
+    def create_segmented_index(cls, manifest_file_path, index_head=True, enable_stemming=True):
+        return SegmentedIndex(manifest_file_path, cls.create_custom_index, index_head, enable_stemming)
+
+    @classmethod
+    def open_index(cls, metadata_file_path):
+        """
+        :param metadata_file_path: metadata file of a CustomIndex or manifest file of a SegmentedIndex
+        :return: the index opened for reads
+        """
+        if SegmentedIndex.is_manifest_file(metadata_file_path):
+            return cls.create_segmented_index(metadata_file_path)
+
+        custom_index = cls.create_custom_index()
+        custom_index.init_index(metadata_file_path, use_mmap=True)
+        return custom_index
@@ -1,85 +1,124 @@
 import datetime
+import heapq
 import json
 import logging
+import mmap
+import multiprocessing
 import os
-from functools import lru_cache
+from contextlib import ExitStack
+from itertools import groupby, islice
+from operator import itemgetter
 
+import numpy as np
+
+from HW_2.analyzer import Analyzer
+from HW_2.cache import PostingsCache
 from HW_2.compressor import Compressor
+from HW_2.document_store import DocumentStore, DocumentStoreWriter
 from HW_2.serializer import Serializer
+from HW_2.term_dictionary import TermDictionary, TermDictionaryWriter
 from constants.constants import Constants
 from utils.decorators import timing
 from utils.utils import Utils
 
 
 class CustomIndex:
-    def __init__(self, tokenizer, stopwords_filter, stemmer, compressor: Compressor, serializer: Serializer) -> None:
+    # rough sizes of the CPython objects created while inverting the documents,
+    # used to estimate the memory held by the in-memory termvectors
+    _ESTIMATED_TERM_SIZE = 400
+    _ESTIMATED_POSTING_SIZE = 300
+    _ESTIMATED_POSITION_SIZE = 40
+    # columns of the term dictionary, see _create_catalog_entry
+    _CATALOG_COLUMNS = ['pos', 'size', 'max_tf', 'df', 'ttf']
+    _TERMVECTOR_CACHE_KEY = 'termvector'
+    _POSTINGS_ARRAYS_CACHE_KEY = 'postings_arrays'
+
+    def __init__(self, tokenizer, stopwords_filter, stemmer, compressor: Compressor, serializer: Serializer,
+                 document_id_mapping_file_path: str,
+                 postings_cache_size_in_bytes: int = Constants.POSTINGS_CACHE_SIZE_IN_BYTES) -> None:
         self.tokenizer = tokenizer
         self.stopwords_filter = stopwords_filter
         self.stemmer = stemmer
+        self.analyzer = Analyzer(tokenizer, stopwords_filter, stemmer)
         self.compressor = compressor
         self.serializer = serializer
 
+        self.document_id_mapping_file_path = document_id_mapping_file_path
+        with open(document_id_mapping_file_path, 'r') as file:
+            self.document_id_mapping = {doc_id: int(mapped_id) for doc_id, mapped_id in json.load(file).items()}
+        self.document_id_rev_mapping = {mapped_id: doc_id for doc_id, mapped_id in self.document_id_mapping.items()}
+
         self.catalog = None
         self.metadata = None
+        self.metadata_file_path = None
         self.index_file_handle = None
-        self.document_length = None
+        self.index_mmap = None
+        self.index_buffer = None
+        self.index_reader = None
+        self.document_store = None
+        self.document_lengths = None
+        self.indexed_document_ids = None
+        self.document_ids = None
+        self.document_ids_by_length = None
+        self.postings_cache = PostingsCache(postings_cache_size_in_bytes)
 
         self._create_dirs_if_absent()
 
     def _create_dirs_if_absent(self):
-        for path in [self.get_metadata_dir(), self._get_index_data_dir(), self._get_catalog_data_dir()]:
+        for path in [self.get_metadata_dir(), self._get_index_data_dir(), self._get_catalog_data_dir(),
+                     self._get_document_length_data_dir(), self._get_document_store_data_dir()]:
             if not os.path.isdir(path):
                 os.makedirs(path)
 
     @classmethod
-    def _calculate_and_update_termvectors(cls, document_id, tokens, termvectors):
-        for token in tokens:
-            term = token[0]
+    def _calculate_and_update_termvectors(cls, doc_id, terms, termvectors, first_position=1):
+        """
+        :param doc_id: internal (integer) id of the document
+        :param terms: analyzed terms, the position of a term is its index + first_position
+        :param first_position: position of the first term
+        :return: estimated number of bytes added to the termvectors
+        """
+        estimated_size = len(terms) * cls._ESTIMATED_POSITION_SIZE
+        for position, term in enumerate(terms, first_position):
             if term not in termvectors:
                 termvectors[term] = {'ttf': 0, 'tf': {}}
+                estimated_size += cls._ESTIMATED_TERM_SIZE + len(term)
 
             # updating the ttf
             termvectors[term]['ttf'] += 1
 
             tf_info_dict = termvectors[term]['tf']
-            if document_id not in tf_info_dict:
-                tf_info_dict[document_id] = {'tf': 0, 'pos': []}
+            if doc_id not in tf_info_dict:
+                tf_info_dict[doc_id] = {'tf': 0, 'pos': []}
+                estimated_size += cls._ESTIMATED_POSTING_SIZE
 
-            tf_info = tf_info_dict[document_id]
+            tf_info = tf_info_dict[doc_id]
             # updating the tf
             tf_info['tf'] += 1
 
             # updating the position information
-            tf_info['pos'].append(token[1])
+            tf_info['pos'].append(position)
+
+        return estimated_size
 
     @classmethod
-    def _merge_termvectors(cls, termvector_1, termvector_2):
+    def _merge_termvectors(cls, termvectors):
         # Merging the ttf
         merged_termvector = {
-            'ttf': termvector_1['ttf'] + termvector_2['ttf'],
+            'ttf': sum(termvector['ttf'] for termvector in termvectors),
             'tf': {}
         }
 
         # Merging the tf and positions
         merged_term_tf_info_dict = merged_termvector['tf']
-        for document_id, tf_info_1 in termvector_1['tf'].items():
-            if document_id not in merged_term_tf_info_dict:
-                merged_term_tf_info_dict[document_id] = {'tf': 0, 'pos': []}
+        for termvector in termvectors:
+            for document_id, tf_info in termvector['tf'].items():
+                if document_id not in merged_term_tf_info_dict:
+                    merged_term_tf_info_dict[document_id] = {'tf': 0, 'pos': []}
 
-            merged_tf_info = merged_term_tf_info_dict[document_id]
-            merged_tf_info['tf'] += tf_info_1['tf']
-            merged_tf_info['pos'].extend(tf_info_1['pos'])
-
-            tf_info_2 = termvector_2['tf'].get(document_id)
-            if tf_info_2:
-                merged_tf_info['tf'] += tf_info_2['tf']
-                merged_tf_info['pos'].extend(tf_info_2['pos'])
-
-        for document_id, tf_info_2 in termvector_2['tf'].items():
-            if document_id not in termvector_1['tf']:
-                merged_term_tf_info_dict[document_id] = {'tf': 0, 'pos': []}
-                merged_term_tf_info_dict[document_id]['tf'] += tf_info_2['tf']
-                merged_term_tf_info_dict[document_id]['pos'].extend(tf_info_2['pos'])
+                merged_tf_info = merged_term_tf_info_dict[document_id]
+                merged_tf_info['tf'] += tf_info['tf']
+                merged_tf_info['pos'].extend(tf_info['pos'])
 
         return merged_termvector
 
@@ -99,6 +138,21 @@ class CustomIndex:
     def _get_new_catalog_file_path(self):
         return '{}/{}.txt'.format(self._get_catalog_data_dir(), Utils.get_random_file_name_with_ts())
 
+    def _get_document_length_data_dir(self):
+        return '{}/{}/{}'.format(self._get_custom_index_dir(), 'data', 'document-length')
+
+    def _get_new_document_length_file_path(self):
+        return '{}/{}.npy'.format(self._get_document_length_data_dir(), Utils.get_random_file_name_with_ts())
+
+    def _get_new_document_id_file_path(self):
+        return '{}/{}-ids.npy'.format(self._get_document_length_data_dir(), Utils.get_random_file_name_with_ts())
+
+    def _get_document_store_data_dir(self):
+        return '{}/{}/{}'.format(self._get_custom_index_dir(), 'data', 'document-store')
+
+    def _get_new_document_store_file_path(self):
+        return '{}/{}.bin'.format(self._get_document_store_data_dir(), Utils.get_random_file_name_with_ts())
+
     @classmethod
     def get_metadata_dir(cls):
         return '{}/{}'.format(cls._get_custom_index_dir(), 'metadata')
@@ -106,35 +160,41 @@ class CustomIndex:
     def _get_new_metadata_file_path(self):
         return '{}/{}.txt'.format(self.get_metadata_dir(), Utils.get_random_file_name_with_ts())
 
+    @classmethod
+    def _create_catalog_entry(cls, pos, size, termvector):
+        # max tf is used to compute the upper bound score of the term for top-k query evaluation
+        max_tf = max(tf_info['tf'] for tf_info in termvector['tf'].values())
+        return {'pos': pos, 'size': size, 'max_tf': max_tf, 'df': len(termvector['tf']), 'ttf': termvector['ttf']}
+
+    def _create_catalog_data(self):
+        return TermDictionaryWriter(self._CATALOG_COLUMNS, Constants.TERM_DICTIONARY_BLOCK_SIZE)
+
     def _write_termvectors_to_index_file(self, termvectors):
-        catalog_data = {}
+        catalog_data = self._create_catalog_data()
         index_file_path = self._get_new_index_file_path()
 
+        # the terms are written in sorted order so that the partial indexes can be merged in a single pass
         with open(index_file_path, 'wb') as file:
-            for term, termvector in termvectors.items():
-                current_pos = file.tell()
-                size = self._write_termvector(file, termvector)
-
-                file.write(b"\n")
-
-                catalog_data[term] = {'pos': current_pos, 'size': size}
+            writer = self.compressor.create_writer(file)
+            for term, termvector in sorted(termvectors.items()):
+                pos, size = self._write_termvector(writer, termvector)
+                catalog_data.add(term, self._create_catalog_entry(pos, size, termvector))
+            compression_metadata = writer.close()
 
-        return catalog_data, index_file_path
+        return catalog_data, index_file_path, compression_metadata
 
     def _write_catalog_to_file(self, catalog):
         catalog_file_path = self._get_new_catalog_file_path()
-        with open(catalog_file_path, 'wb') as file:
-            catalog_bytes = json.dumps(catalog).encode(Constants.AP_DATA_FILE_ENCODING)
-            self._write_bytes(file, catalog_bytes)
-
+        catalog['data'].write(catalog_file_path, catalog['metadata'])
         return catalog_file_path
 
-    def _read_catalog_to_file(self, catalog_file_path):
-        with open(catalog_file_path, 'rb') as file:
-            catalog_bytes = self._read_bytes(file)
-            catalog = json.loads(catalog_bytes.decode(Constants.AP_DATA_FILE_ENCODING))
-
-        return catalog
+    @classmethod
+    def _read_catalog_to_file(cls, catalog_file_path):
+        term_dictionary = TermDictionary(catalog_file_path)
+        return {
+            'metadata': term_dictionary.metadata,
+            'data': term_dictionary
+        }
 
     @classmethod
     def _read_metadata_from_file(cls, metadata_file_path):
@@ -150,216 +210,726 @@ class CustomIndex:
             json.dump(metadata, file, indent=True)
         return metadata_file_path
 
-    def _create_metadata(self, catalog_file_path, index_file_path):
+    def _create_metadata(self, catalog_file_path, index_file_path, document_length_file_path,
+                         compression_metadata=None):
         return {
             'index_file_path': index_file_path,
             'catalog_file_path': catalog_file_path,
+            'document_length_file_path': document_length_file_path,
             'tokenizer': self.tokenizer.name,
             'stopwords_filter': self.stopwords_filter.name,
             'stemmer': self.stemmer.name,
             'serializer': self.serializer.name,
             'compressor': self.compressor.name,
+            'compression': compression_metadata,
             'timestamp': str(datetime.datetime.now())
         }
 
-    def _create_documents_index_and_catalog(self, documents, index_head, enable_stemming):
-
-        termvectors = {}
-        for document in documents:
-
-            tokens = self.analyze(document['text'], enable_stemming)
-            if index_head:
-                head_tokens = self.analyze(document.get('head', ''), enable_stemming)
-                tokens.extend(head_tokens)
+    def _write_document_lengths_to_file(self, document_lengths):
+        document_length_file_path = self._get_new_document_length_file_path()
+        np.save(document_length_file_path, document_lengths)
+        return document_length_file_path
 
-            self._calculate_and_update_termvectors(document['id'], tokens, termvectors)
+    def _write_document_ids_to_file(self, document_ids):
+        document_id_file_path = self._get_new_document_id_file_path()
+        np.save(document_id_file_path, document_ids)
+        return document_id_file_path
 
-        catalog_data, index_file_path = self._write_termvectors_to_index_file(termvectors)
+    def _write_partial_index(self, termvectors, document_lengths):
+        catalog_data, index_file_path, compression_metadata = self._write_termvectors_to_index_file(termvectors)
         catalog = {
             'metadata': {
-                'total_docs': len(documents)
+                'total_docs': len(document_lengths)
             },
             'data': catalog_data
         }
         catalog_file_path = self._write_catalog_to_file(catalog)
-        metadata = self._create_metadata(catalog_file_path, index_file_path)
-        return metadata
-
-    def _read_bytes(self, file, start=0, size=-1):
-        file.seek(start)
-        compressed_bytes = file.read(size)
-        decompressed_bytes = self.compressor.decompress_bytes(compressed_bytes)
-        return decompressed_bytes
 
-    def _read_termvector(self, file, start, size):
-        termvector_bytes = self._read_bytes(file, start, size)
-        return self.serializer.deserialize(termvector_bytes)
+        # the document lengths of a partial index are stored as (internal doc id, length) pairs
+        document_length_pairs = np.array(list(document_lengths.items()), dtype=np.uint32).reshape(-1, 2)
+        document_length_file_path = self._write_document_lengths_to_file(document_length_pairs)
 
-    def _write_bytes(self, file, bytes_to_write):
-        compressed_bytes = self.compressor.compress_bytes(bytes_to_write)
-        return file.write(compressed_bytes)
+        metadata = self._create_metadata(catalog_file_path, index_file_path, document_length_file_path,
+                                         compression_metadata)
+        return metadata
 
-    def _write_termvector(self, file, termvector):
-        serialized_bytes = self.serializer.serialize(termvector)
-        return self._write_bytes(file, serialized_bytes)
+    def _analyze_document_field(self, document, field, enable_stemming):
+        # the documents read from an AnalysisCache hold their terms instead of their text
+        terms = document.get('{}_terms'.format(field))
+        if terms is None:
+            terms = self.analyzer.analyze_terms(document.get(field, ''), enable_stemming)
+        return terms
+
+    def _create_documents_index_and_catalog(self, document_batches, index_head, enable_stemming, memory_budget):
+        """
+        Single pass in-memory indexing (SPIMI) of the documents batches. The termvectors are flushed to a sorted
+        partial index whenever their estimated size reaches the memory budget.
+        :param document_batches: iterable of lists of documents
+        :param index_head:
+        :param enable_stemming:
+        :param memory_budget: max estimated bytes of termvectors to hold in memory
+        :return: list of metadata of the partial indexes
+        """
+        metadata_list = []
+        termvectors = {}
+        document_lengths = {}
+        estimated_size = 0
+        for documents in document_batches:
+            for document in documents:
+
+                doc_id = self.document_id_mapping[document['id']]
+                terms = self._analyze_document_field(document, 'text', enable_stemming)
+                estimated_size += self._calculate_and_update_termvectors(doc_id, terms, termvectors)
+                document_length = len(terms)
+                if index_head:
+                    # the positions of the head follow the ones of the text after a gap, so that the phrases and the
+                    # windows shorter than the gap do not span the text and the head
+                    head_terms = self._analyze_document_field(document, 'head', enable_stemming)
+                    estimated_size += self._calculate_and_update_termvectors(
+                        doc_id, head_terms, termvectors, len(terms) + Constants.HEAD_POSITION_GAP + 1)
+                    document_length += len(head_terms)
+
+                document_lengths[doc_id] = document_length
+
+                if estimated_size >= memory_budget:
+                    logging.info("Flushing {} termvectors, estimated size: {}".format(len(termvectors),
+                                                                                       estimated_size))
+                    metadata_list.append(self._write_partial_index(termvectors, document_lengths))
+                    termvectors = {}
+                    document_lengths = {}
+                    estimated_size = 0
+
+        if document_lengths:
+            metadata_list.append(self._write_partial_index(termvectors, document_lengths))
+
+        return metadata_list
 
     @classmethod
-    def _delete_index_and_catalog_files(cls, metadata):
-        os.remove(metadata['index_file_path'])
-        os.remove(metadata['catalog_file_path'])
+    def _get_document_batches(cls, document_batches_queue):
+        while True:
+            documents = document_batches_queue.get()
+            if documents is None:
+                return
+            yield documents
+
+    def _run_indexing_worker(self, document_batches_queue, results_queue, index_head, enable_stemming,
+                             memory_budget):
+        try:
+            metadata_list = self._create_documents_index_and_catalog(self._get_document_batches(document_batches_queue),
+                                                                     index_head, enable_stemming, memory_budget)
+            results_queue.put((None, metadata_list))
+        except Exception as e:
+            logging.exception("Indexing worker failed")
+            results_queue.put((repr(e), None))
+            # draining the queue so that the producer is not blocked forever
+            for _ in self._get_document_batches(document_batches_queue):
+                pass
 
     @classmethod
-    def _delete_catalog_file(cls, metadata):
-        os.remove(metadata['catalog_file_path'])
-
-    def _merge_2_index_and_catalog(self, metadata_list):
-        metadata_1 = metadata_list[0]
-        catalog_1 = self._read_catalog_to_file(metadata_1['catalog_file_path'])
-
-        if len(metadata_list) == 1:
-            self._delete_catalog_file(metadata_1)
-            return catalog_1, metadata_1['index_file_path']
-
-        metadata_2 = metadata_list[1]
-        catalog_2 = self._read_catalog_to_file(metadata_2['catalog_file_path'])
-
-        merged_index_path = self._get_new_index_file_path()
-        merged_catalog_data = {}
-        with open(merged_index_path, 'wb') as merged_index_file, \
-                open(metadata_1['index_file_path'], 'rb') as index_file_1, \
-                open(metadata_2['index_file_path'], 'rb') as index_file_2:
-
-            for term, read_metadata_1 in catalog_1['data'].items():
-                termvector_1 = self._read_termvector(index_file_1, read_metadata_1['pos'], read_metadata_1['size'])
-                if term in catalog_2['data']:
-                    read_metadata_2 = catalog_2['data'][term]
-                    termvector_2 = self._read_termvector(index_file_2, read_metadata_2['pos'], read_metadata_2['size'])
-                    merged_termvector = self._merge_termvectors(termvector_1, termvector_2)
-                else:
-                    merged_termvector = termvector_1
+    def _split_documents_into_batches(cls, documents, batch_size):
+        iterator = iter(documents)
+        while True:
+            batch = list(islice(iterator, batch_size))
+            if not batch:
+                return
+            yield batch
 
-                pos = merged_index_file.tell()
-                size = self._write_termvector(merged_index_file, merged_termvector)
-                merged_index_file.write(b'\n')
-
-                merged_catalog_data[term] = {'pos': pos, 'size': size}
-
-            for term, read_metadata_2 in catalog_2['data'].items():
-                if term not in catalog_1['data']:
-                    termvector_2 = self._read_termvector(index_file_2, read_metadata_2['pos'], read_metadata_2['size'])
-
-                    pos = merged_index_file.tell()
-                    size = self._write_termvector(merged_index_file, termvector_2)
-                    merged_index_file.write(b'\n')
+    @timing
+    def _create_partial_indexes(self, documents, index_head, enable_stemming, no_of_workers, memory_budget):
+        # bounded queue, the producer blocks instead of materializing the documents when the workers fall behind
+        document_batches_queue = multiprocessing.Queue(maxsize=no_of_workers * 2)
+        results_queue = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=self._run_indexing_worker,
+                                           args=(document_batches_queue, results_queue, index_head, enable_stemming,
+                                                 memory_budget))
+                   for _ in range(no_of_workers)]
+        for worker in workers:
+            worker.start()
+
+        try:
+            for batch in self._split_documents_into_batches(documents, Constants.INDEXING_BATCH_SIZE):
+                document_batches_queue.put(batch)
+        finally:
+            # the workers stop once the documents are consumed, or once reading them failed
+            for _ in workers:
+                document_batches_queue.put(None)
+
+        errors = []
+        metadata_list = []
+        for _ in workers:
+            error, worker_metadata_list = results_queue.get()
+            if error:
+                errors.append(error)
+            else:
+                metadata_list.extend(worker_metadata_list)
+
+        for worker in workers:
+            worker.join()
+
+        if errors:
+            raise RuntimeError('Indexing failed: {}'.format(errors))
+
+        return metadata_list
+
+    def _read_termvector(self, reader, pos, size):
+        return self.serializer.deserialize(reader.read(pos, size))
+
+    def _write_termvector(self, writer, termvector):
+        """
+        :return: tuple of the position and of the size of the termvector, as stored in the catalog
+        """
+        return writer.write(self.serializer.serialize(termvector))
 
-                    merged_catalog_data[term] = {'pos': pos, 'size': size}
+    @classmethod
+    def get_data_file_paths(cls, metadata) -> list:
+        """
+        :return: paths of all the files of the index, except the metadata file
+        """
+        file_paths = [metadata['index_file_path'], metadata['catalog_file_path'], metadata['document_length_file_path']]
+        if metadata.get('document_id_file_path'):
+            file_paths.append(metadata['document_id_file_path'])
+        if metadata.get('document_store_file_path'):
+            file_paths.extend([metadata['document_store_file_path'], metadata['document_store_table_file_path']])
+        return file_paths
 
-        self._delete_index_and_catalog_files(metadata_1)
-        self._delete_index_and_catalog_files(metadata_2)
+    @classmethod
+    def _delete_index_and_catalog_files(cls, metadata):
+        for file in cls.get_data_file_paths(metadata):
+            os.remove(file)
 
-        merged_catalog = {
-            'metadata': {
-                'total_docs': catalog_1['metadata']['total_docs'] + catalog_2['metadata']['total_docs']
-            },
-            'data': merged_catalog_data
-        }
-        return merged_catalog, merged_index_path
+    @classmethod
+    def _delete_files_if_present(cls, file_paths):
+        for file_path in file_paths:
+            if file_path and os.path.isfile(file_path):
+                os.remove(file_path)
 
     @classmethod
     def _make_files_readonly(cls, metadata_file_path, metadata):
-        for file in [metadata_file_path, metadata['catalog_file_path'], metadata['index_file_path']]:
+        for file in [metadata_file_path] + cls.get_data_file_paths(metadata):
             os.chmod(file, 0o444)
 
+    @classmethod
+    def _get_sorted_catalog_entries(cls, catalog, index_no):
+        for term, read_metadata in catalog['data'].items():
+            yield term, index_no, read_metadata
+
+    @timing
     def _merge_indexes_and_catalogs(self, metadata_list: list):
+        while len(metadata_list) > Constants.MAX_INDEXES_TO_MERGE_AT_ONCE:
+            metadata_list = [self._merge_partial_indexes(sub_list) for sub_list in
+                             Utils.split_list_into_sub_lists(metadata_list,
+                                                             sub_list_size=Constants.MAX_INDEXES_TO_MERGE_AT_ONCE)]
 
-        while len(metadata_list) > 1:
-            logging.info("Metadata list size: {}".format(len(metadata_list)))
-            tasks = list(Utils.split_list_into_sub_lists(metadata_list, sub_list_size=2))
-            results = Utils.run_tasks_parallelly(self._merge_2_index_and_catalog, tasks, 8)
-            metadata_list = []
-            for merged_catalog, merged_index_path in results:
-                merged_catalog_file_path = self._write_catalog_to_file(merged_catalog)
-                merged_metadata = self._create_metadata(merged_catalog_file_path, merged_index_path)
-                metadata_list.append(merged_metadata)
+        return self._merge_partial_indexes(metadata_list)
 
-        if len(metadata_list) != 1:
-            raise RuntimeError("More than 1 metadata after merging")
+    @classmethod
+    def _remove_deleted_documents(cls, termvector, deleted_document_ids):
+        tf_info_dict = {doc_id: tf_info for doc_id, tf_info in termvector['tf'].items()
+                        if doc_id not in deleted_document_ids}
+        return {'ttf': sum(tf_info['tf'] for tf_info in tf_info_dict.values()), 'tf': tf_info_dict}
 
-        merged_metadata = metadata_list[0]
-        return merged_metadata
+    @classmethod
+    def _read_document_ids(cls, metadata, document_lengths):
+        """
+        :return: sorted internal ids of all the documents of a complete index, including the ones without any token
+        """
+        if metadata.get('document_id_file_path'):
+            return np.load(metadata['document_id_file_path'])
+        # the indexes written before the ids were stored know only the documents having at least one token
+        return np.flatnonzero(document_lengths)
 
-    @timing
-    def _compute_document_length(self):
-        document_length = {}
+    @classmethod
+    def _read_document_length_pairs(cls, metadata, deleted_document_ids=None):
+        """
+        :return: (internal doc id, length) pairs of the documents of a partial index or of a complete index
+        """
+        document_lengths = np.load(metadata['document_length_file_path'])
+        if document_lengths.ndim == 1:
+            # complete index, the documents without any token are told apart from the absent ones by the stored ids
+            document_ids = cls._read_document_ids(metadata, document_lengths)
+            document_lengths = np.column_stack((document_ids, document_lengths[document_ids])).astype(np.uint32)
+
+        if deleted_document_ids:
+            deleted_document_ids = np.fromiter(deleted_document_ids, dtype=np.uint32)
+            document_lengths = document_lengths[~np.isin(document_lengths[:, 0], deleted_document_ids)]
+        return document_lengths
+
+    @classmethod
+    def _sample_serialized_termvectors(cls, catalogs, readers):
+        """
+        :return: serialized termvectors of terms spread evenly over the catalogs, to train the compression dictionary
+        """
+        samples = []
+        for catalog, reader in zip(catalogs, readers):
+            term_dictionary = catalog['data']
+            step = max(1, len(term_dictionary) // (Constants.COMPRESSION_DICTIONARY_SAMPLES // len(catalogs) + 1))
+            for rank in range(0, len(term_dictionary), step):
+                entry = term_dictionary.get_entry(rank)
+                samples.append(bytes(reader.read(entry['pos'], entry['size'])))
+        return samples
+
+    def _merge_partial_indexes(self, metadata_list: list, deleted_document_ids_list=None, delete_merged_files=True):
+        """
+        k-way merge of the partial indexes, the partial catalogs are walked in term order through a heap hence
+        every partial index is read exactly once and the merged index is written exactly once.
+        :param metadata_list: metadata of the partial indexes
+        :param deleted_document_ids_list: set of the internal ids of the documents to leave out, for every index
+        :param delete_merged_files: deletes the files of the partial indexes once they are merged
+        :return: metadata of the merged index
+        """
+        logging.info("Merging {} indexes".format(len(metadata_list)))
+        if deleted_document_ids_list is None:
+            deleted_document_ids_list = [None] * len(metadata_list)
+        catalogs = [self._read_catalog_to_file(metadata['catalog_file_path']) for metadata in metadata_list]
 
-        for term in self.catalog['data'].keys():
-            termvector = self.get_termvector(term)
-            for doc_id, tf_info in termvector['tf'].items():
-                document_length[doc_id] = document_length.get(doc_id, 0) + tf_info['tf']
+        merged_index_path = self._get_new_index_file_path()
+        merged_catalog_data = self._create_catalog_data()
+        merged_document_length_file_path = None
+        try:
+            with ExitStack() as stack:
+                readers = [self.compressor.create_reader(
+                    stack.enter_context(open(metadata['index_file_path'], 'rb')),
+                    compression_metadata=metadata.get('compression')) for metadata in metadata_list]
+                merged_index_file = stack.enter_context(open(merged_index_path, 'wb'))
+                samples = self._sample_serialized_termvectors(catalogs, readers) \
+                    if self.compressor.trains_dictionary else None
+                writer = self.compressor.create_writer(merged_index_file, samples)
+
+                sorted_catalog_entries = heapq.merge(*[self._get_sorted_catalog_entries(catalog, index_no)
+                                                       for index_no, catalog in enumerate(catalogs)])
+
+                for term, catalog_entries in groupby(sorted_catalog_entries, key=itemgetter(0)):
+                    termvectors = []
+                    for _, index_no, read_metadata in catalog_entries:
+                        termvector = self._read_termvector(readers[index_no], read_metadata['pos'],
+                                                           read_metadata['size'])
+                        if deleted_document_ids_list[index_no]:
+                            termvector = self._remove_deleted_documents(termvector,
+                                                                        deleted_document_ids_list[index_no])
+                        if termvector['tf']:
+                            termvectors.append(termvector)
+
+                    if not termvectors:
+                        continue
+                    merged_termvector = self._merge_termvectors(termvectors) if len(termvectors) > 1 \
+                        else termvectors[0]
+
+                    pos, size = self._write_termvector(writer, merged_termvector)
+                    merged_catalog_data.add(term, self._create_catalog_entry(pos, size, merged_termvector))
+
+                compression_metadata = writer.close()
+
+            for catalog in catalogs:
+                catalog['data'].close()
+
+            document_length_pairs_list = [self._read_document_length_pairs(metadata, deleted_document_ids)
+                                          for metadata, deleted_document_ids in zip(metadata_list,
+                                                                                    deleted_document_ids_list)]
+            merged_document_length_pairs = np.concatenate(document_length_pairs_list)
+            merged_document_length_file_path = self._write_document_lengths_to_file(merged_document_length_pairs)
+
+            merged_catalog = {
+                'metadata': {
+                    'total_docs': len(merged_document_length_pairs)
+                },
+                'data': merged_catalog_data
+            }
+            merged_catalog_file_path = self._write_catalog_to_file(merged_catalog)
+        except Exception:
+            # the files of the merged index written so far are not part of any index
+            self._delete_files_if_present([merged_index_path, merged_document_length_file_path])
+            raise
+
+        if delete_merged_files:
+            for metadata in metadata_list:
+                self._delete_index_and_catalog_files(metadata)
+
+        return self._create_metadata(merged_catalog_file_path, merged_index_path, merged_document_length_file_path,
+                                     compression_metadata)
+
+    def _add_document_lengths_and_statistics(self, metadata):
+        """
+        Replaces the (internal doc id, length) pairs of the merged index by a dense array indexed by the internal doc id
+        and adds the collection statistics to the metadata, so that opening the index does not touch the postings.
+        :param metadata: metadata of the merged index
+        :return:
+        """
+        document_length_pairs = np.load(metadata['document_length_file_path'])
+        # the internal ids are not necessarily contiguous
+        no_of_document_ids = max(self.document_id_mapping.values(), default=-1) + 1
+        document_lengths = np.zeros(no_of_document_ids, dtype=np.uint32)
+        document_lengths[document_length_pairs[:, 0]] = document_length_pairs[:, 1]
+
+        os.remove(metadata['document_length_file_path'])
+        metadata['document_length_file_path'] = self._write_document_lengths_to_file(document_lengths)
+        # the length of a document without any token does not tell it apart from an absent document
+        metadata['document_id_file_path'] = self._write_document_ids_to_file(
+            np.sort(document_length_pairs[:, 0]).astype(np.int64))
+
+        total_docs = len(document_length_pairs)
+        total_tokens = int(document_lengths.sum(dtype=np.uint64))
+        non_empty_document_lengths = document_lengths[document_lengths > 0]
+        metadata['statistics'] = {
+            'total_docs': total_docs,
+            'total_tokens': total_tokens,
+            'average_doc_length': total_tokens / total_docs,
+            'min_doc_length': int(non_empty_document_lengths.min()) if len(non_empty_document_lengths) else 0
+        }
 
-        self.document_length = document_length
+    def _open_index_file(self, use_mmap):
+        self.index_file_handle = open(self.metadata['index_file_path'], 'rb')
+        if use_mmap and os.path.getsize(self.metadata['index_file_path']) > 0:
+            # the mapping is read only and backed by the page cache, hence every process which maps the same index
+            # shares a single copy of it
+            self.index_mmap = mmap.mmap(self.index_file_handle.fileno(), 0, access=mmap.ACCESS_READ)
+            self.index_buffer = memoryview(self.index_mmap)
+        self.index_reader = self.compressor.create_reader(self.index_file_handle, self.index_buffer,
+                                                          self.metadata.get('compression'))
+
+    def close(self):
+        self.postings_cache.clear()
+
+        if self.catalog is not None:
+            self.catalog['data'].close()
+            self.catalog = None
+
+        self.index_reader = None
+        if self.document_store is not None:
+            self.document_store.close()
+            self.document_store = None
+
+        # the postings cursors hold slices of the mapping, while a cursor is alive the mapping cannot be closed, it
+        # is then unmapped by the gc once the last cursor is gone
+        if self.index_buffer is not None:
+            try:
+                self.index_buffer.release()
+            except BufferError:
+                pass
+            self.index_buffer = None
+
+        if self.index_mmap is not None:
+            try:
+                self.index_mmap.close()
+            except BufferError:
+                pass
+            self.index_mmap = None
+
+        if self.index_file_handle is not None:
+            self.index_file_handle.close()
+            self.index_file_handle = None
 
     @timing
-    def init_index(self, metadata_file_path=None):
+    def init_index(self, metadata_file_path=None, use_mmap=Constants.USE_MMAP_FOR_INDEX_READS):
         logging.info("Initializing Index")
         if metadata_file_path:
             self.metadata = self._read_metadata_from_file(metadata_file_path)
+            self.metadata_file_path = metadata_file_path
 
         if not self.metadata:
             raise RuntimeError('Metadata cannot be none while initializing the index')
 
+        self.close()
         self.catalog = self._read_catalog_to_file(self.metadata['catalog_file_path'])
-        self.index_file_handle = open(self.metadata['index_file_path'], 'rb')
-        self._compute_document_length()
+        self._open_index_file(use_mmap)
+        if self.metadata.get('document_store_file_path'):
+            self.document_store = DocumentStore(self.metadata['document_store_file_path'],
+                                                self.metadata['document_store_table_file_path'])
+        self.document_lengths = np.load(self.metadata['document_length_file_path'], mmap_mode='r')
+        self.indexed_document_ids = self._read_document_ids(self.metadata, self.document_lengths)
+        self.document_ids = None
+        self.document_ids_by_length = None
         logging.info("Index initialized")
 
-    def index_documents(self, documents, index_head, enable_stemming):
-        metadata_list = Utils.run_tasks_parallelly_in_chunks(self._create_documents_index_and_catalog, documents,
-                                                             Constants.NO_OF_PARALLEL_INDEXING_TASKS,
-                                                             index_head=index_head,
-                                                             enable_stemming=enable_stemming)
+    def _store_documents(self, documents, document_store_writer):
+        for document in documents:
+            if 'text' not in document:
+                raise ValueError('Analyzed documents cannot be stored, they are indexed with store_documents=False')
+            document_store_writer.add(self.document_id_mapping[document['id']], document.get('head', ''),
+                                      document['text'])
+            yield document
+
+    def _merge_document_stores(self, metadata_list, deleted_document_ids_list):
+        """
+        :return: paths of the files of the merged document store
+        """
+        document_store_writer = DocumentStoreWriter(self._get_new_document_store_file_path())
+        try:
+            for metadata, deleted_document_ids in zip(metadata_list, deleted_document_ids_list):
+                document_store = DocumentStore(metadata['document_store_file_path'],
+                                               metadata['document_store_table_file_path'])
+                for doc_id in document_store.get_document_ids().tolist():
+                    if not deleted_document_ids or doc_id not in deleted_document_ids:
+                        document = document_store.get_document(doc_id)
+                        document_store_writer.add(doc_id, document['head'], document['text'])
+                document_store.close()
+
+            return document_store_writer.close()
+        except Exception:
+            document_store_writer.discard()
+            raise
+
+    def index_documents(self, documents, index_head, enable_stemming,
+                        no_of_workers=Constants.NO_OF_PARALLEL_INDEXING_TASKS,
+                        memory_budget=Constants.INDEXING_MEMORY_BUDGET_PER_WORKER, store_documents=True):
+        """
+        :param documents: iterable of parsed documents, e.g. a generator, it is consumed only once, or of analyzed
+        documents, see AnalysisCache.iterate_documents
+        :param index_head:
+        :param enable_stemming:
+        :param no_of_workers:
+        :param memory_budget: max estimated bytes of termvectors every worker holds in memory before spilling to disk
+        :param store_documents: writes the head and the text of the documents to a document store, see get_document,
+        it must be False for analyzed documents
+        :return:
+        """
+        document_store_writer = None
+        if store_documents:
+            # the documents are stored as they are handed to the indexing workers
+            document_store_writer = DocumentStoreWriter(self._get_new_document_store_file_path())
+            documents = self._store_documents(documents, document_store_writer)
+
+        try:
+            metadata_list = self._create_partial_indexes(documents, index_head, enable_stemming, no_of_workers,
+                                                         memory_budget)
+            if not metadata_list:
+                raise ValueError('No documents to index')
+        except Exception:
+            if document_store_writer:
+                document_store_writer.discard()
+            raise
 
         merged_metadata = self._merge_indexes_and_catalogs(metadata_list)
+        if document_store_writer:
+            merged_metadata.update(document_store_writer.close())
+        self._add_document_lengths_and_statistics(merged_metadata)
         merged_metadata_file_path = self._write_metadata_to_file(merged_metadata)
         self._make_files_readonly(merged_metadata_file_path, merged_metadata)
         self.metadata = merged_metadata
+        self.metadata_file_path = merged_metadata_file_path
         self.init_index()
         return merged_metadata, merged_metadata_file_path
 
-    @lru_cache(maxsize=Constants.TERMVECTOR_CACHE_SIZE)
-    def get_termvector(self, term):
+    @timing
+    def merge_indexes(self, metadata_list: list, deleted_document_ids_list: list):
+        """
+        Merges complete indexes, e.g. the segments of a SegmentedIndex, into a new index. The merged indexes are left
+        untouched.
+        :param metadata_list: metadata of the indexes to merge
+        :param deleted_document_ids_list: set of the internal ids of the documents to leave out, for every index
+        :return: tuple of the metadata of the merged index and of its file path
+        """
+        merged_metadata = self._merge_partial_indexes(metadata_list, deleted_document_ids_list,
+                                                      delete_merged_files=False)
+        merged_metadata_file_path = None
+        try:
+            if all(metadata.get('document_store_file_path') for metadata in metadata_list):
+                merged_metadata.update(self._merge_document_stores(metadata_list, deleted_document_ids_list))
+            self._add_document_lengths_and_statistics(merged_metadata)
+            merged_metadata_file_path = self._write_metadata_to_file(merged_metadata)
+            self._make_files_readonly(merged_metadata_file_path, merged_metadata)
+        except Exception:
+            # the files of the merged index written so far are not part of any index
+            self._delete_files_if_present(self.get_data_file_paths(merged_metadata) + [merged_metadata_file_path])
+            raise
+
+        return merged_metadata, merged_metadata_file_path
+
+    def add_document_ids(self, document_ids):
+        """
+        Assigns an internal id to every new document and rewrites the document id mapping file, the documents which
+        are already mapped keep their internal id.
+        :param document_ids: external ids of the documents
+        :return:
+        """
+        new_document_ids = [doc_id for doc_id in dict.fromkeys(document_ids) if doc_id not in self.document_id_mapping]
+        if not new_document_ids:
+            return
+
+        next_mapped_id = max(self.document_id_mapping.values(), default=-1) + 1
+        for mapped_id, doc_id in enumerate(new_document_ids, next_mapped_id):
+            self.document_id_mapping[doc_id] = mapped_id
+            self.document_id_rev_mapping[mapped_id] = doc_id
+
+        # the mapping file is replaced atomically, the other processes read either the old or the new mapping
+        temp_file_path = '{}.{}'.format(self.document_id_mapping_file_path, os.getpid())
+        with open(temp_file_path, 'w') as file:
+            json.dump(self.document_id_mapping, file)
+        os.replace(temp_file_path, self.document_id_mapping_file_path)
+
+    def _estimate_termvector_size(self, tf_metadata):
+        return self._ESTIMATED_TERM_SIZE + (tf_metadata['df'] * self._ESTIMATED_POSTING_SIZE) + (
+                tf_metadata['ttf'] * self._ESTIMATED_POSITION_SIZE)
+
+    def get_termvector_bytes(self, term):
+        """
+        Returns the serialized termvector of the given term as a slice of the memory mapped index.
+        The slice is zero-copy when the index is not compressed.
+        :param term:
+        :return: memoryview over the serialized termvector or None if the term is not present in the index
+        """
+        if self.index_buffer is None:
+            raise RuntimeError('Index is not memory mapped')
+
         tf_metadata = self.catalog['data'].get(term)
         if tf_metadata:
-            return self._read_termvector(self.index_file_handle, tf_metadata['pos'], tf_metadata['size'])
+            return self._read_term_bytes(tf_metadata)
         else:
+            return None
+
+    def get_termvector(self, term):
+        """
+        The decoded termvectors are cached, they must not be modified by the caller
+        :param term:
+        :return: termvector of the term or an empty dict if the term is not present in the index
+        """
+        cache_key = (self._TERMVECTOR_CACHE_KEY, term)
+        termvector = self.postings_cache.get(cache_key)
+        if termvector is not None:
+            return termvector
+
+        tf_metadata = self.catalog['data'].get(term)
+        if not tf_metadata:
             return {}
 
-    def get_total_documents(self):
-        return self.catalog['metadata']['total_docs']
+        termvector = self.serializer.deserialize(self._read_term_bytes(tf_metadata))
+        self.postings_cache.put(cache_key, termvector, self._estimate_termvector_size(tf_metadata))
+        return termvector
 
-    def get_vocabulary_size(self) -> int:
-        return len(self.catalog['data'])
+    def _read_term_bytes(self, tf_metadata):
+        return self.index_reader.read(tf_metadata['pos'], tf_metadata['size'])
 
-    def get_average_doc_length(self) -> float:
-        tf_sum = 0
-        for term in self.catalog['data'].keys():
-            termvector = self.get_termvector(term)
-            for doc_id, tf_info in termvector['tf'].items():
-                tf_sum += tf_info['tf']
+    def get_postings_cursor(self, term):
+        """
+        Creates a document at a time cursor over the postings of the term, the cursor uses the skip table stored with
+        the postings to jump to a target document without decoding the blocks in between.
+        :param term:
+        :return: PostingsCursor or None if the term is not present in the index
+        """
+        if not hasattr(self.serializer, 'create_postings_cursor'):
+            raise RuntimeError('{} does not support postings cursors'.format(self.serializer.name))
 
-        return tf_sum / self.get_total_documents()
+        tf_metadata = self.catalog['data'].get(term)
+        if not tf_metadata:
+            return None
+
+        return self.serializer.create_postings_cursor(self._read_term_bytes(tf_metadata))
+
+    def get_postings_arrays(self, term):
+        """
+        :param term:
+        :return: tuple of the int64 arrays of the doc ids and of the tfs of the term, sorted by the doc id,
+        or None if the term is not present in the index
+        """
+        cache_key = (self._POSTINGS_ARRAYS_CACHE_KEY, term)
+        postings = self.postings_cache.get(cache_key)
+        if postings is not None:
+            return postings
 
-    def analyze(self, text: str, enable_stemming: bool) -> list:
-        tokens = self.tokenizer.tokenize(text)
-        tokens = self.stopwords_filter.filter(tokens)
+        tf_metadata = self.catalog['data'].get(term)
+        if not tf_metadata:
+            return None
+
+        if hasattr(self.serializer, 'deserialize_postings'):
+            doc_ids, tfs = self.serializer.deserialize_postings(self._read_term_bytes(tf_metadata))
+        else:
+            tf_info_dict = self.get_termvector(term)['tf']
+            doc_ids = np.fromiter(tf_info_dict.keys(), dtype=np.int64, count=len(tf_info_dict))
+            tfs = np.fromiter((tf_info['tf'] for tf_info in tf_info_dict.values()), dtype=np.int64,
+                              count=len(tf_info_dict))
+            order = np.argsort(doc_ids)
+            doc_ids, tfs = doc_ids[order], tfs[order]
+
+        # the cached arrays are shared by all the callers
+        doc_ids.flags.writeable = False
+        tfs.flags.writeable = False
+        self.postings_cache.put(cache_key, (doc_ids, tfs), doc_ids.nbytes + tfs.nbytes)
+        return doc_ids, tfs
+
+    def get_postings_cache_statistics(self) -> dict:
+        return self.postings_cache.get_statistics()
+
+    def get_term_max_tf(self, term) -> int:
+        tf_metadata = self.catalog['data'].get(term)
+        return tf_metadata['max_tf'] if tf_metadata else 0
 
-        if enable_stemming:
-            tokens = [(self.stemmer.stem(token[0]), token[1]) for token in tokens]
+    def get_doc_freq(self, term) -> int:
+        tf_metadata = self.catalog['data'].get(term)
+        return tf_metadata['df'] if tf_metadata else 0
+
+    def get_ttf(self, term) -> int:
+        tf_metadata = self.catalog['data'].get(term)
+        return tf_metadata['ttf'] if tf_metadata else 0
 
-        return tokens
+    def get_min_doc_length(self) -> int:
+        return self.metadata['statistics']['min_doc_length']
 
-    def get_doc_length(self, document_id) -> int:
-        return self.document_length.get(document_id)
+    def get_total_documents(self):
+        return self.metadata['statistics']['total_docs']
+
+    def get_total_tokens(self) -> int:
+        return self.metadata['statistics']['total_tokens']
 
-    def get_all_document_ids(self):
-        return self.document_length.keys()
+    def get_vocabulary_size(self) -> int:
+        return len(self.catalog['data'])
+
+    def get_average_doc_length(self) -> float:
+        return self.metadata['statistics']['average_doc_length']
+
+    def analyze(self, text: str, enable_stemming: bool) -> list:
+        return self.analyzer.analyze(text, enable_stemming)
+
+    def analyze_terms(self, text: str, enable_stemming: bool) -> list:
+        return self.analyzer.analyze_terms(text, enable_stemming)
+
+    def get_doc_length(self, doc_id: int) -> int:
+        return int(self.document_lengths[doc_id])
+
+    def get_document_lengths(self) -> np.ndarray:
+        """
+        :return: lengths of all the documents, indexed by the internal doc id
+        """
+        return self.document_lengths
+
+    def get_indexed_document_ids(self) -> np.ndarray:
+        """
+        :return: sorted internal ids of all the documents of the index, including the ones without any token
+        """
+        return self.indexed_document_ids
+
+    def get_all_document_ids(self) -> np.ndarray:
+        """
+        :return: sorted internal ids of all the documents having at least one token
+        """
+        if self.document_ids is None:
+            self.document_ids = self.indexed_document_ids[self.document_lengths[self.indexed_document_ids] > 0]
+        return self.document_ids
+
+    def get_document_ids_by_length(self) -> np.ndarray:
+        """
+        :return: internal ids of all the documents having at least one token, sorted by the doc length in ascending
+        order and then by the doc id in descending order
+        """
+        if self.document_ids_by_length is None:
+            document_ids = self.get_all_document_ids()
+            order = np.lexsort((-document_ids, self.document_lengths[document_ids]))
+            self.document_ids_by_length = document_ids[order]
+        return self.document_ids_by_length
+
+    def get_external_document_id(self, doc_id: int) -> str:
+        return self.document_id_rev_mapping[doc_id]
+
+    def get_document(self, doc_id: int):
+        """
+        :param doc_id: internal doc id
+        :return: dict of the external id, the head and the text of the document or None if it is not stored
+        """
+        if self.document_store is None:
+            raise RuntimeError('Index does not have a document store')
+
+        document = self.document_store.get_document(doc_id)
+        if document is not None:
+            document['id'] = self.get_external_document_id(doc_id)
+        return document
+
+    def get_internal_document_id(self, document_id: str) -> int:
+        return self.document_id_mapping[document_id]
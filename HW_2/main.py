@@ -1,13 +1,24 @@
 import gc
+import heapq
 import logging
 import math
 import sys
 from collections import Counter, defaultdict
 
-from HW_1.main import get_file_paths_to_parse, get_parsed_documents, parse_queries, \
+import numpy as np
+
+from HW_1.main import get_file_paths_to_parse, iterate_parsed_documents, parse_queries, \
     transform_scores_for_writing_to_file
+from HW_2.analysis_cache import AnalysisCache
+from HW_2.batch_search import BatchSearcher
+from HW_2.cache import QueryResultCache
 from HW_2.factory import Factory
 from HW_2.indexer import CustomIndex
+from HW_2.proximity import ProximitySearchEngine
+from HW_2.query_operators import PositionalQueryEvaluator
+from HW_2.scoring import ScoringKernels, LaplaceLanguageModelScorer, JelinekMercerLanguageModelScorer
+from HW_2.wand import BlockMaxWand, OkapiBm25TermScorer, OkapiTfIdfTermScorer
+from constants.constants import Constants
 from utils.decorators import timing
 from utils.utils import Utils
 
@@ -22,121 +33,201 @@ class HW2:
         return Utils.split_list_into_sub_lists(file_paths, no_of_sub_lists=8)
 
     @classmethod
-    def add_documents_to_index(cls, index_head, enable_stemming):
+    def create_analysis_cache(cls):
         dir_path = Utils.get_ap89_collection_abs_path()
         file_paths = get_file_paths_to_parse(dir_path)
         logging.info("Total File to read: {}".format(len(file_paths)))
-        parsed_documents = get_parsed_documents(file_paths)
+        return AnalysisCache.build(iterate_parsed_documents(file_paths), Factory.create_analyzer(),
+                                   AnalysisCache.get_new_analysis_cache_file_path())
 
+    @classmethod
+    def add_documents_to_index(cls, index_head, enable_stemming, analysis_cache=None):
+        """
+        :param analysis_cache: AnalysisCache of the collection, the collection is parsed and analyzed when absent
+        """
         custom_index = Factory.create_custom_index()
+        if analysis_cache:
+            # the analysis cache holds the terms only, the documents cannot be stored
+            metadata, metadata_file_path = custom_index.index_documents(
+                analysis_cache.iterate_documents(enable_stemming), index_head, enable_stemming, store_documents=False)
+            return custom_index, metadata_file_path
+
+        dir_path = Utils.get_ap89_collection_abs_path()
+        file_paths = get_file_paths_to_parse(dir_path)
+        logging.info("Total File to read: {}".format(len(file_paths)))
+        # the documents are indexed while the files are being parsed
+        parsed_documents = iterate_parsed_documents(file_paths)
+
         metadata, metadata_file_path = custom_index.index_documents(parsed_documents, index_head, enable_stemming)
         return custom_index, metadata_file_path
 
     @classmethod
-    def calculate_okapi_bm25_scores(cls, query, custom_index, avg_doc_len, total_documents, k_1=1.2, k_2=500, b=0.75):
-        document_score = defaultdict(float)
+    def add_documents_to_segmented_index(cls, manifest_file_path, file_paths, index_head=True, enable_stemming=True):
+        """
+        Indexes the documents of the files into a new segment of the index, e.g. the documents of a day
+        :param manifest_file_path: manifest of the segmented index, the index is created when it is absent
+        """
+        segmented_index = Factory.create_segmented_index(manifest_file_path, index_head, enable_stemming)
+        segmented_index.add_documents(iterate_parsed_documents(file_paths))
+        return segmented_index
+
+    @classmethod
+    def _create_score_accumulator(cls, custom_index):
+        """
+        :return: tuple of the scores and of the flags of the scored documents, both indexed by the internal doc id
+        """
+        no_of_documents = len(custom_index.get_document_lengths())
+        return np.zeros(no_of_documents, dtype=np.float64), np.zeros(no_of_documents, dtype=bool)
+
+    @classmethod
+    def _get_scores_from_accumulator(cls, document_score, is_scored):
+        doc_ids = np.flatnonzero(is_scored)
+        return list(zip(document_score[doc_ids].tolist(), doc_ids.tolist()))
+
+    @classmethod
+    def _get_query_postings(cls, query, custom_index):
+        """
+        :return: dict of the query tokens to the (doc ids, tfs) arrays of their postings, None for the missing tokens
+        """
+        return {query_token: custom_index.get_postings_arrays(query_token) for query_token in set(query['tokens'])}
+
+    @classmethod
+    def _accumulate_okapi_bm25_scores(cls, query, custom_index, avg_doc_len, total_documents, k_1, k_2, b,
+                                      document_score, is_scored):
+        document_lengths = custom_index.get_document_lengths()
+        query_postings = cls._get_query_postings(query, custom_index)
         query_term_freq = Counter(query['tokens'])
 
         for query_token in query['tokens']:
-            termvector = custom_index.get_termvector(query_token)
-            if termvector:
-                doc_freq = len(termvector['tf'])
-                for doc_id, tf_info in termvector['tf'].items():
-                    score = 0.0
-                    tf = tf_info['tf']
-                    query_tf = query_term_freq.get(query_token)
-                    doc_length = custom_index.get_doc_length(doc_id)
-                    temp_1 = math.log((total_documents + 0.5) / (doc_freq + 0.5))
-                    temp_2 = (tf + (k_1 * tf)) / (tf + (k_1 * ((1 - b) + (b * (doc_length / avg_doc_len)))))
-                    temp_3 = (query_tf + (k_2 * query_tf)) / (query_tf + k_2)
-                    score += (temp_1 * temp_2 * temp_3)
+            postings = query_postings[query_token]
+            if postings is not None:
+                doc_ids, tfs = postings
+                document_score[doc_ids] += ScoringKernels.okapi_bm25(tfs, document_lengths[doc_ids], avg_doc_len,
+                                                                     total_documents, len(doc_ids),
+                                                                     query_term_freq[query_token], k_1, k_2, b)
+                is_scored[doc_ids] = True
 
-                    document_score[doc_id] += score
+    @classmethod
+    def calculate_okapi_bm25_scores(cls, query, custom_index, avg_doc_len, total_documents, k_1=1.2, k_2=500, b=0.75):
+        document_score, is_scored = cls._create_score_accumulator(custom_index)
+        cls._accumulate_okapi_bm25_scores(query, custom_index, avg_doc_len, total_documents, k_1, k_2, b,
+                                          document_score, is_scored)
+        return cls._get_scores_from_accumulator(document_score, is_scored)
 
-        scores = [(score, doc_id) for doc_id, score in document_score.items()]
-        return scores
+    @classmethod
+    def calculate_okapi_bm25_with_operators_scores(cls, query, custom_index, avg_doc_len, total_documents, k_1=1.2,
+                                                   k_2=500, b=0.75, use_skip_pointers=True):
+        """
+        BM25 of the bag of words 'tokens' of the query plus BM25 of its positional 'operators', the number of matches
+        of an operator in a document being its tf
+        """
+        document_score, is_scored = cls._create_score_accumulator(custom_index)
+        cls._accumulate_okapi_bm25_scores(query, custom_index, avg_doc_len, total_documents, k_1, k_2, b,
+                                          document_score, is_scored)
+
+        document_lengths = custom_index.get_document_lengths()
+        evaluator = PositionalQueryEvaluator(custom_index, use_skip_pointers)
+        for operator in query.get('operators', []):
+            doc_ids, counts = evaluator.evaluate(operator)
+            if len(doc_ids):
+                document_score[doc_ids] += ScoringKernels.okapi_bm25(counts, document_lengths[doc_ids], avg_doc_len,
+                                                                     total_documents, len(doc_ids), 1, k_1, k_2, b)
+                is_scored[doc_ids] = True
+
+        return cls._get_scores_from_accumulator(document_score, is_scored)
 
     @classmethod
     def calculate_okapi_tf_idf_scores(cls, query, custom_index, avg_doc_len, total_documents):
-        document_score = defaultdict(float)
+        document_score, is_scored = cls._create_score_accumulator(custom_index)
+        document_lengths = custom_index.get_document_lengths()
+        query_postings = cls._get_query_postings(query, custom_index)
 
         for query_token in query['tokens']:
-            termvector = custom_index.get_termvector(query_token)
-            if termvector:
-                doc_freq = len(termvector['tf'])
-                for doc_id, tf_info in termvector['tf'].items():
-                    score = 0.0
-                    tf = tf_info['tf']
-                    doc_length = custom_index.get_doc_length(doc_id)
-                    temp = tf / (tf + 0.5 + (1.5 * (doc_length / avg_doc_len)))
-                    score += (temp * math.log(total_documents / doc_freq))
+            postings = query_postings[query_token]
+            if postings is not None:
+                doc_ids, tfs = postings
+                document_score[doc_ids] += ScoringKernels.okapi_tf_idf(tfs, document_lengths[doc_ids], avg_doc_len,
+                                                                       total_documents, len(doc_ids))
+                is_scored[doc_ids] = True
 
-                    document_score[doc_id] += score
+        return cls._get_scores_from_accumulator(document_score, is_scored)
 
-        scores = [(score, doc_id) for doc_id, score in document_score.items()]
-        return scores
+    @classmethod
+    def _supports_postings_cursors(cls, custom_index) -> bool:
+        # only the VarByte postings have the skip tables the top-k evaluation relies on
+        return hasattr(custom_index.serializer, 'create_postings_cursor')
 
     @classmethod
-    def calculate_unigram_lm_with_laplace_smoothing_scores(cls, query, custom_index, vocabulary_size):
+    def calculate_okapi_bm25_top_k_scores(cls, query, custom_index, avg_doc_len, total_documents, k_1=1.2, k_2=500,
+                                          b=0.75, k=1000):
+        if not cls._supports_postings_cursors(custom_index):
+            return heapq.nlargest(k, cls.calculate_okapi_bm25_scores(query, custom_index, avg_doc_len,
+                                                                     total_documents, k_1, k_2, b))
 
-        def _calculate_score(_tf, _doc_id):
-            _doc_length = custom_index.get_doc_length(_doc_id)
-            _temp = (_tf + 1.0) / (_doc_length + vocabulary_size)
-            _score = math.log(_temp)
-            return _score
+        term_scorer = OkapiBm25TermScorer(avg_doc_len, total_documents, k_1, k_2, b)
+        return BlockMaxWand(custom_index, term_scorer, k).search(query['tokens'])
 
-        document_score = defaultdict(float)
-        document_ids = custom_index.get_all_document_ids()
+    @classmethod
+    def calculate_okapi_tf_idf_top_k_scores(cls, query, custom_index, avg_doc_len, total_documents, k=1000):
+        if not cls._supports_postings_cursors(custom_index):
+            return heapq.nlargest(k, cls.calculate_okapi_tf_idf_scores(query, custom_index, avg_doc_len,
+                                                                       total_documents))
+
+        term_scorer = OkapiTfIdfTermScorer(avg_doc_len, total_documents)
+        return BlockMaxWand(custom_index, term_scorer, k).search(query['tokens'])
+
+    @classmethod
+    def calculate_unigram_lm_with_laplace_smoothing_scores(cls, query, custom_index, vocabulary_size):
+        document_score, is_scored = cls._create_score_accumulator(custom_index)
+        document_lengths = custom_index.get_document_lengths()
+        query_postings = cls._get_query_postings(query, custom_index)
+
+        # score of every document for a term it does not contain
+        missing_term_score = ScoringKernels.unigram_lm_with_laplace_smoothing(0, document_lengths, vocabulary_size)
         for query_token in query['tokens']:
-            termvector = custom_index.get_termvector(query_token)
-            if termvector:
-                for doc_id, tf_info in termvector['tf'].items():
-                    document_score[doc_id] += _calculate_score(tf_info['tf'], doc_id)
+            term_score = missing_term_score.copy()
+            postings = query_postings[query_token]
+            if postings is not None:
+                doc_ids, tfs = postings
+                term_score[doc_ids] = ScoringKernels.unigram_lm_with_laplace_smoothing(tfs, document_lengths[doc_ids],
+                                                                                       vocabulary_size)
+            document_score += term_score
 
-                for doc_id in document_ids:
-                    if doc_id not in termvector['tf']:
-                        document_score[doc_id] += _calculate_score(0, doc_id)
-            else:
-                for doc_id in document_ids:
-                    document_score[doc_id] += _calculate_score(0, doc_id)
+        if query['tokens']:
+            is_scored[custom_index.get_all_document_ids()] = True
 
-        scores = [(score, doc_id) for doc_id, score in document_score.items()]
-        return scores
+        return cls._get_scores_from_accumulator(document_score, is_scored)
 
     @classmethod
     def calculate_unigram_lm_with_jelinek_mercer_smoothing_scores(cls, query, custom_index, vocabulary_size, lam=0.9):
+        document_score, is_scored = cls._create_score_accumulator(custom_index)
+        document_lengths = custom_index.get_document_lengths()
+        query_postings = cls._get_query_postings(query, custom_index)
 
-        def _calculate(_tf, _ttf, _doc_id):
-            _doc_length = custom_index.get_doc_length(_doc_id)
-            _score = 0.0
-            _temp_1 = lam * (_tf / _doc_length)
-            _temp_2 = (1 - lam) * (_ttf / vocabulary_size)
-            try:
-                _score += math.log(_temp_1 + _temp_2)
-                return _score
-            except:
-                return 0
+        for query_token in query['tokens']:
+            ttf = custom_index.get_ttf(query_token)
+            term_score = ScoringKernels.unigram_lm_with_jelinek_mercer_smoothing(0, document_lengths, ttf,
+                                                                                 vocabulary_size, lam)
+            postings = query_postings[query_token]
+            if postings is not None:
+                doc_ids, tfs = postings
+                term_score[doc_ids] = ScoringKernels.unigram_lm_with_jelinek_mercer_smoothing(
+                    tfs, document_lengths[doc_ids], ttf, vocabulary_size, lam)
+            document_score += term_score
 
-        document_score = defaultdict(float)
-        document_ids = custom_index.get_all_document_ids()
+        if query['tokens']:
+            is_scored[custom_index.get_all_document_ids()] = True
 
-        for query_token in query['tokens']:
-            termvector = custom_index.get_termvector(query_token)
-            if termvector:
-                token_ttf = termvector['ttf']
-                for doc_id, tf_info in termvector['tf'].items():
-                    tf = tf_info['tf']
-                    document_score[doc_id] += _calculate(tf, token_ttf, doc_id)
+        return cls._get_scores_from_accumulator(document_score, is_scored)
 
-                for doc_id in document_ids:
-                    if doc_id not in termvector['tf']:
-                        document_score[doc_id] += _calculate(0, token_ttf, doc_id)
-            else:
-                for doc_id in document_ids:
-                    document_score[doc_id] += _calculate(0, 0, doc_id)
+    @classmethod
+    def calculate_unigram_lm_with_laplace_smoothing_top_k_scores(cls, query, custom_index, vocabulary_size, k=1000):
+        return LaplaceLanguageModelScorer(custom_index, vocabulary_size, k).search(query['tokens'])
 
-        scores = [(score, doc_id) for doc_id, score in document_score.items()]
-        return scores
+    @classmethod
+    def calculate_unigram_lm_with_jelinek_mercer_smoothing_top_k_scores(cls, query, custom_index, vocabulary_size,
+                                                                        lam=0.9, k=1000):
+        return JelinekMercerLanguageModelScorer(custom_index, vocabulary_size, lam, k).search(query['tokens'])
 
     @classmethod
     def compute_minimum_span(cls, ngram_tokens, positions):
@@ -235,33 +326,96 @@ class HW2:
         scores = [(score, doc_id) for doc_id, score in document_score.items()]
         return scores
 
+    @classmethod
+    def calculate_proximity_top_k_scores(cls, query, custom_index, avg_doc_len, total_documents, ngram_length=2,
+                                         alpha=1.3, k=1000):
+        if not cls._supports_postings_cursors(custom_index):
+            return heapq.nlargest(k, cls.calculate_scores_using_proximity_search(query, custom_index, avg_doc_len,
+                                                                                 total_documents, ngram_length, alpha))
+
+        return ProximitySearchEngine(custom_index, avg_doc_len, total_documents, ngram_length, alpha, k).search(
+            query['tokens'])
+
+    @classmethod
+    def _search_with_result_cache(cls, queries, score_calculator, parameters, metadata_file_path, search,
+                                  use_result_cache):
+        """
+        :param parameters: parameters of the score calculator, part of the key of the cached results
+        :param search: function returning the top-k (score, external doc id) tuples of every given query
+        :return: top-k (score, external doc id) tuples of every query, in the order of the queries
+        """
+        if not use_result_cache or not metadata_file_path:
+            return search(queries)
+
+        result_cache = QueryResultCache(metadata_file_path)
+        model = score_calculator.__qualname__
+        query_scores = [result_cache.get(model, parameters, query) for query in queries]
+        missing_query_ixs = [ix for ix, scores in enumerate(query_scores) if scores is None]
+        if missing_query_ixs:
+            missing_query_scores = search([queries[ix] for ix in missing_query_ixs])
+            for ix, scores in zip(missing_query_ixs, missing_query_scores):
+                query_scores[ix] = scores
+                result_cache.put(model, parameters, queries[ix], scores)
+            result_cache.save()
+
+        logging.info('Query result cache: {}'.format(result_cache.get_statistics()))
+        return query_scores
+
+    @classmethod
+    def _write_query_scores_to_file(cls, queries, query_scores, file_name, result_sub_dir=None):
+        results_to_write = [result for query, scores in zip(queries, query_scores)
+                            for result in transform_scores_for_writing_to_file(scores, query)]
+        Utils.write_results_to_file(cls._get_results_file_path(file_name, result_sub_dir), results_to_write)
+
     @classmethod
     @timing
     def find_scores_and_write_to_file(cls, queries,
                                       score_calculator,
                                       file_name,
                                       result_sub_dir=None,
+                                      use_result_cache=True,
                                       **kwargs):
-        results_to_write = []
-        for query in queries:
-            scores = score_calculator(query, **kwargs)
-            scores.sort(reverse=True)
+        custom_index = kwargs['custom_index']
+        parameters = {key: value for key, value in kwargs.items() if key != 'custom_index'}
+
+        def search(queries_to_search):
+            return [BatchSearcher.get_top_k(score_calculator(query, **kwargs), custom_index)
+                    for query in queries_to_search]
 
-            results_to_write.extend(transform_scores_for_writing_to_file(scores, query))
+        query_scores = cls._search_with_result_cache(queries, score_calculator, parameters,
+                                                     custom_index.metadata_file_path, search, use_result_cache)
+        cls._write_query_scores_to_file(queries, query_scores, file_name, result_sub_dir)
 
+    @classmethod
+    @timing
+    def find_scores_in_parallel_and_write_to_file(cls, queries,
+                                                  score_calculator,
+                                                  file_name,
+                                                  metadata_file_path,
+                                                  result_sub_dir=None,
+                                                  use_result_cache=True,
+                                                  no_of_workers=Constants.NO_OF_PARALLEL_SEARCH_TASKS,
+                                                  **kwargs):
+        def search(queries_to_search):
+            return BatchSearcher.search_top_k(metadata_file_path, queries_to_search, score_calculator, no_of_workers,
+                                              **kwargs)
+
+        query_scores = cls._search_with_result_cache(queries, score_calculator, kwargs, metadata_file_path, search,
+                                                     use_result_cache)
+        cls._write_query_scores_to_file(queries, query_scores, file_name, result_sub_dir)
+
+    @classmethod
+    def _get_results_file_path(cls, file_name, result_sub_dir=None):
         file_path = 'results'
         if result_sub_dir:
             file_path = '{}/{}'.format(file_path, result_sub_dir)
-        file_path = '{}/{}.txt'.format(file_path, file_name)
-
-        Utils.write_results_to_file(file_path, results_to_write)
+        return '{}/{}.txt'.format(file_path, file_name)
 
     @classmethod
     def clean_queries(cls, queries, custom_index):
         for query in queries:
             raw_query = query['raw']
-            tokens = custom_index.analyze(raw_query, True)
-            query['tokens'] = [token[0] for token in tokens]
+            query['tokens'] = custom_index.analyze_terms(raw_query, True)
             analyzed_query = " ".join(query['tokens'])
             query['cleaned'] = analyzed_query.strip()
 
@@ -281,49 +435,54 @@ class HW2:
         custom_index.init_index(metadata_file_path)
 
         queries = cls.get_queries(custom_index)
-        cls.find_scores_and_write_to_file(queries, cls.calculate_okapi_tf_idf_scores, 'okapi_tf_idf',
-                                          results_sub_dir,
-                                          custom_index=custom_index,
-                                          avg_doc_len=custom_index.get_average_doc_length(),
-                                          total_documents=custom_index.get_total_documents()
-                                          )
-
-        cls.find_scores_and_write_to_file(queries, cls.calculate_okapi_bm25_scores, 'okapi_bm25',
-                                          results_sub_dir,
-                                          custom_index=custom_index,
-                                          avg_doc_len=custom_index.get_average_doc_length(),
-                                          total_documents=custom_index.get_total_documents()
-                                          )
-
-        # cls.find_scores_and_write_to_file(queries, cls.calculate_unigram_lm_with_laplace_smoothing_scores,
-        #                                   'unigram_lm_with_laplace_smoothing',
-        #                                   results_sub_dir,
-        #                                   custom_index=custom_index,
-        #                                   vocabulary_size=custom_index.get_vocabulary_size()
-        #                                   )
-
-        cls.find_scores_and_write_to_file(queries, cls.calculate_unigram_lm_with_jelinek_mercer_smoothing_scores,
-                                          'unigram_lm_with_jelinek_mercer_smoothing',
-                                          results_sub_dir,
-                                          custom_index=custom_index,
-                                          vocabulary_size=custom_index.get_vocabulary_size()
-                                          )
-
-        cls.find_scores_and_write_to_file(queries, cls.calculate_scores_using_proximity_search,
-                                          'proximity_search',
-                                          results_sub_dir,
-                                          custom_index=custom_index,
-                                          avg_doc_len=281.71925743100417,
-                                          total_documents=custom_index.get_total_documents()
-                                          )
+        cls.find_scores_in_parallel_and_write_to_file(queries, cls.calculate_okapi_tf_idf_top_k_scores, 'okapi_tf_idf',
+                                                      metadata_file_path,
+                                                      results_sub_dir,
+                                                      avg_doc_len=custom_index.get_average_doc_length(),
+                                                      total_documents=custom_index.get_total_documents()
+                                                      )
+
+        cls.find_scores_in_parallel_and_write_to_file(queries, cls.calculate_okapi_bm25_top_k_scores, 'okapi_bm25',
+                                                      metadata_file_path,
+                                                      results_sub_dir,
+                                                      avg_doc_len=custom_index.get_average_doc_length(),
+                                                      total_documents=custom_index.get_total_documents()
+                                                      )
+
+        # cls.find_scores_in_parallel_and_write_to_file(queries,
+        #                                               cls.calculate_unigram_lm_with_laplace_smoothing_top_k_scores,
+        #                                               'unigram_lm_with_laplace_smoothing',
+        #                                               metadata_file_path,
+        #                                               results_sub_dir,
+        #                                               vocabulary_size=custom_index.get_vocabulary_size()
+        #                                               )
+
+        jelinek_mercer_score_calculator = cls.calculate_unigram_lm_with_jelinek_mercer_smoothing_top_k_scores
+        cls.find_scores_in_parallel_and_write_to_file(queries, jelinek_mercer_score_calculator,
+                                                      'unigram_lm_with_jelinek_mercer_smoothing',
+                                                      metadata_file_path,
+                                                      results_sub_dir,
+                                                      vocabulary_size=custom_index.get_vocabulary_size()
+                                                      )
+
+        cls.find_scores_in_parallel_and_write_to_file(queries, cls.calculate_proximity_top_k_scores,
+                                                      'proximity_search',
+                                                      metadata_file_path,
+                                                      results_sub_dir,
+                                                      avg_doc_len=281.71925743100417,
+                                                      total_documents=custom_index.get_total_documents()
+                                                      )
 
     @classmethod
     @timing
     def generate_indexes(cls):
+        # the collection is parsed and analyzed once for the four indexes
+        analysis_cache = cls.create_analysis_cache()
         for index_head in [True, False]:
             for stemming_enabled in [True, False]:
                 gc.collect()
-                custom_index, metadata_file_path = cls.add_documents_to_index(index_head, stemming_enabled)
+                custom_index, metadata_file_path = cls.add_documents_to_index(index_head, stemming_enabled,
+                                                                              analysis_cache)
                 logging.info(
                     'Index Head: {}, Stemming Enabled: {}, Metadata file: {}'.format(index_head, stemming_enabled,
                                                                                      metadata_file_path))
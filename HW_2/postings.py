@@ -0,0 +1,136 @@
+import sys
+from bisect import bisect_left
+
+import numpy as np
+
+from HW_2.varbyte import VarByte
+
+
+class PostingsBlock:
+    """
+    Doc ids and tfs of a block of postings, the positions of the block are decoded on the first call to get_positions
+    """
+
+    def __init__(self, doc_ids: list, tfs: list, position_buffer) -> None:
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.position_buffer = position_buffer
+        self.positions = None
+        self.position_offsets = None
+
+    @classmethod
+    def decode(cls, buffer, position_buffer, previous_doc_id: int, no_of_docs: int):
+        numbers = VarByte.decode(buffer)
+        doc_ids = (np.cumsum(numbers[:no_of_docs]) + np.uint64(previous_doc_id)).tolist()
+        return cls(doc_ids, numbers[no_of_docs:2 * no_of_docs].tolist(), position_buffer)
+
+    def get_positions(self, ix: int) -> list:
+        if self.positions is None:
+            self.positions = VarByte.decode(self.position_buffer)
+            self.position_offsets = [0] + np.cumsum(self.tfs).tolist()
+
+        position_gaps = self.positions[self.position_offsets[ix]:self.position_offsets[ix + 1]]
+        return np.cumsum(position_gaps).tolist()
+
+
+class PostingsCursor:
+    """
+    Document at a time iterator over the block structured postings written by the VarByteSerializer.
+    Blocks are decoded only when the cursor lands inside them, the skip table (last doc id and max tf of every block)
+    lets advance() and the block-max methods step over whole blocks without decoding them. The positions are stored
+    apart from the doc ids and tfs, they are decoded only for the blocks whose positions are asked for.
+    """
+    END = sys.maxsize
+
+    def __init__(self, buffer, ttf: int, df: int, block_size: int, block_last_doc_ids: list, block_max_tfs: list,
+                 block_offsets: list, position_block_offsets: list) -> None:
+        self.buffer = buffer
+        self.ttf = ttf
+        self.df = df
+        self.block_size = block_size
+        self.block_last_doc_ids = block_last_doc_ids
+        self.block_max_tfs = block_max_tfs
+        self.block_offsets = block_offsets
+        self.position_block_offsets = position_block_offsets
+        self.max_tf = max(block_max_tfs) if block_max_tfs else 0
+
+        self.block_ix = -1
+        self.block = None
+        self.ix = 0
+        self.doc_id = -1
+        self._load_block(0)
+
+    def _load_block(self, block_ix: int):
+        if block_ix >= len(self.block_last_doc_ids):
+            self.block_ix = len(self.block_last_doc_ids)
+            self.block = None
+            self.doc_id = self.END
+            return
+
+        previous_doc_id = self.block_last_doc_ids[block_ix - 1] if block_ix > 0 else 0
+        no_of_docs = min(self.block_size, self.df - (block_ix * self.block_size))
+        block_buffer = self.buffer[self.block_offsets[block_ix]:self.block_offsets[block_ix + 1]]
+        position_buffer = self.buffer[self.position_block_offsets[block_ix]:self.position_block_offsets[block_ix + 1]]
+
+        self.block_ix = block_ix
+        self.block = PostingsBlock.decode(block_buffer, position_buffer, previous_doc_id, no_of_docs)
+        self.ix = 0
+        self.doc_id = self.block.doc_ids[0]
+
+    def is_exhausted(self) -> bool:
+        return self.doc_id == self.END
+
+    @property
+    def tf(self) -> int:
+        return self.block.tfs[self.ix]
+
+    @property
+    def positions(self) -> list:
+        return self.block.get_positions(self.ix)
+
+    def next(self) -> int:
+        if self.doc_id == self.END:
+            return self.END
+
+        self.ix += 1
+        if self.ix < len(self.block.doc_ids):
+            self.doc_id = self.block.doc_ids[self.ix]
+        else:
+            self._load_block(self.block_ix + 1)
+
+        return self.doc_id
+
+    def advance(self, target: int) -> int:
+        """
+        Moves the cursor to the first document whose id is greater than or equal to the target
+        :param target:
+        :return: the id of the document the cursor is on
+        """
+        if target <= self.doc_id:
+            return self.doc_id
+
+        block_ix = self.shallow_advance(target)
+        if block_ix != self.block_ix:
+            self._load_block(block_ix)
+            if self.doc_id == self.END:
+                return self.END
+
+        self.ix = bisect_left(self.block.doc_ids, target, self.ix)
+        self.doc_id = self.block.doc_ids[self.ix]
+        return self.doc_id
+
+    def shallow_advance(self, target: int) -> int:
+        """
+        Finds the block which may contain the target using only the skip table
+        :param target:
+        :return: index of the block, equal to the number of blocks when the target is beyond the last document
+        """
+        return bisect_left(self.block_last_doc_ids, target, max(self.block_ix, 0))
+
+    def get_block_max_tf(self, block_ix: int) -> int:
+        return self.block_max_tfs[block_ix]
+
+    def get_block_last_doc_id(self, block_ix: int) -> int:
+        if block_ix >= len(self.block_last_doc_ids):
+            return self.END
+        return self.block_last_doc_ids[block_ix]
@@ -0,0 +1,113 @@
+import heapq
+import math
+from collections import Counter
+
+from HW_2.indexer import CustomIndex
+from HW_2.wand import BlockMaxWand, OkapiBm25TermScorer, OkapiTfIdfTermScorer
+from constants.constants import Constants
+
+
+class ProximitySearchEngine:
+    """
+    Two stage proximity search.
+    The first stage selects the candidate documents with BM25 top-k (Block-Max WAND), the second stage streams the
+    positions of the candidates from the postings cursors, in doc id order, and rescores them with the minimum span of
+    every query n-gram plus the Okapi TF-IDF of the query terms.
+    """
+    MAX_SPAN = 500
+    # span of an n-gram whose tokens are not all present in the document
+    MISSING_TOKEN_SPAN = 287
+
+    def __init__(self, custom_index: CustomIndex, avg_doc_len, total_documents, ngram_length=2, alpha=1.3,
+                 k: int = 1000, no_of_candidates: int = Constants.PROXIMITY_SEARCH_NO_OF_CANDIDATES) -> None:
+        self.custom_index = custom_index
+        self.ngram_length = ngram_length
+        self.alpha = alpha
+        self.k = k
+        self.no_of_candidates = no_of_candidates
+        self.bm25_term_scorer = OkapiBm25TermScorer(avg_doc_len, total_documents)
+        self.tf_idf_term_scorer = OkapiTfIdfTermScorer(avg_doc_len, total_documents)
+
+    @classmethod
+    def compute_minimum_span(cls, positions_lists) -> int:
+        """
+        Smallest window covering one position from every list, using a single linear merge of the sorted lists
+        :param positions_lists: list of sorted positions, one list per token
+        :return: max position - min position of the smallest window
+        """
+        heap = [(positions[0], ix, 0) for ix, positions in enumerate(positions_lists)]
+        heapq.heapify(heap)
+        max_pos = max(positions[0] for positions in positions_lists)
+        min_span = max_pos - heap[0][0]
+
+        while True:
+            # moving the minimum position forward is the only way to shrink the window
+            _, ix, pointer = heapq.heappop(heap)
+            pointer += 1
+            if pointer >= len(positions_lists[ix]) or min_span == 0:
+                return min_span
+
+            next_pos = positions_lists[ix][pointer]
+            max_pos = max(max_pos, next_pos)
+            heapq.heappush(heap, (next_pos, ix, pointer))
+            min_span = min(min_span, max_pos - heap[0][0])
+
+    def _compute_ngram_span(self, ngram_tokens, term_positions) -> int:
+        distinct_tokens = list(dict.fromkeys(ngram_tokens))
+        if any(token not in term_positions for token in distinct_tokens):
+            return self.MISSING_TOKEN_SPAN
+
+        min_span = self.compute_minimum_span([term_positions[token] for token in distinct_tokens])
+        return min_span if 0 < min_span < self.MAX_SPAN else self.MAX_SPAN
+
+    def _generate_query_ngrams(self, query_tokens):
+        return [query_tokens[i:i + self.ngram_length] for i in range(len(query_tokens) - self.ngram_length + 1)]
+
+    def _score_candidate(self, doc_id, query_tokens, query_ngrams, query_term_freq, term_postings):
+        """
+        :param term_postings: dict of the terms present in the document to their (tf, positions, doc freq)
+        """
+        term_positions = {term: positions for term, (_, positions, _) in term_postings.items()}
+
+        score = 0.0
+        for ngram_tokens in query_ngrams:
+            min_span = self._compute_ngram_span(ngram_tokens, term_positions)
+            score += math.log(self.alpha + math.exp(-min_span))
+
+        doc_length = self.custom_index.get_doc_length(doc_id)
+        for query_token in query_tokens:
+            if query_token in term_postings:
+                tf, _, doc_freq = term_postings[query_token]
+                score += self.tf_idf_term_scorer.score(tf, doc_length, doc_freq, query_term_freq[query_token])
+
+        return score
+
+    def search(self, query_tokens) -> list:
+        """
+        :param query_tokens: analyzed query tokens
+        :return: list of (score, doc_id) tuples of the top-k documents, sorted by score in descending order
+        """
+        candidates = BlockMaxWand(self.custom_index, self.bm25_term_scorer, self.no_of_candidates).search(query_tokens)
+        candidate_doc_ids = sorted(doc_id for _, doc_id in candidates)
+
+        query_term_freq = Counter(query_tokens)
+        cursors = {}
+        for term in query_term_freq:
+            cursor = self.custom_index.get_postings_cursor(term)
+            if cursor:
+                cursors[term] = cursor
+
+        query_ngrams = self._generate_query_ngrams(query_tokens)
+        scores = []
+        for doc_id in candidate_doc_ids:
+            # the candidates are visited in doc id order, hence every cursor only moves forward
+            term_postings = {}
+            for term, cursor in cursors.items():
+                if cursor.advance(doc_id) == doc_id:
+                    term_postings[term] = (cursor.tf, cursor.positions, cursor.df)
+
+            scores.append((self._score_candidate(doc_id, query_tokens, query_ngrams, query_term_freq, term_postings),
+                           doc_id))
+
+        scores.sort(reverse=True)
+        return scores[:self.k]
@@ -0,0 +1,190 @@
+import re
+from abc import abstractmethod
+from bisect import bisect_right
+
+import numpy as np
+
+from HW_2.indexer import CustomIndex
+from HW_2.postings import PostingsCursor
+
+
+class PositionalOperator:
+    """
+    Query clause matching its terms by their positions inside a document, the number of matches in a document is used
+    as the tf of the clause.
+    """
+
+    def __init__(self, terms: list, window_size: int) -> None:
+        self.terms = terms
+        self.window_size = window_size
+
+    @property
+    @abstractmethod
+    def name(self) -> str:
+        pass
+
+    @abstractmethod
+    def count_matches(self, positions_lists) -> int:
+        """
+        :param positions_lists: sorted positions of every term of the operator, in the order of the terms
+        :return: number of non overlapping matches
+        """
+        pass
+
+    def __repr__(self) -> str:
+        return '#{}{}({})'.format(self.name, self.window_size, ' '.join(self.terms))
+
+
+class OrderedWindow(PositionalOperator):
+    """
+    #odN, the terms appear in the given order and every term is at most N positions after the previous one.
+    """
+
+    @property
+    def name(self) -> str:
+        return 'od'
+
+    def count_matches(self, positions_lists) -> int:
+        pointers = [0] * len(positions_lists)
+        matches = 0
+        match_end = -1
+        for start in positions_lists[0]:
+            if start <= match_end:
+                continue
+
+            previous = start
+            for ix in range(1, len(positions_lists)):
+                # the closest next position leaves the most room for the following terms
+                positions = positions_lists[ix]
+                pointers[ix] = bisect_right(positions, previous, pointers[ix])
+                if pointers[ix] == len(positions):
+                    return matches
+
+                if positions[pointers[ix]] - previous > self.window_size:
+                    break
+                previous = positions[pointers[ix]]
+            else:
+                matches += 1
+                match_end = previous
+
+        return matches
+
+
+class Phrase(OrderedWindow):
+    """
+    Exact phrase, i.e. #od1
+    """
+
+    def __init__(self, terms: list) -> None:
+        super().__init__(terms, 1)
+
+
+class UnorderedWindow(PositionalOperator):
+    """
+    #uwN, all the terms appear, in any order, inside a window of N positions.
+    """
+
+    @property
+    def name(self) -> str:
+        return 'uw'
+
+    def count_matches(self, positions_lists) -> int:
+        # a repeated term matches at a single position
+        positions_lists = list({term: positions for term, positions in zip(self.terms, positions_lists)}.values())
+        pointers = [0] * len(positions_lists)
+        matches = 0
+        while True:
+            current = [positions[pointer] for positions, pointer in zip(positions_lists, pointers)]
+            max_pos = max(current)
+            if max_pos - min(current) < self.window_size:
+                matches += 1
+                for ix, positions in enumerate(positions_lists):
+                    pointers[ix] = bisect_right(positions, max_pos, pointers[ix])
+            else:
+                pointers[current.index(min(current))] += 1
+
+            if any(pointer >= len(positions) for positions, pointer in zip(positions_lists, pointers)):
+                return matches
+
+
+class PositionalQueryEvaluator:
+    """
+    Document at a time evaluation of the positional operators over the postings cursors.
+    The documents containing all the terms of an operator are found by intersecting the cursors, advancing them with
+    the skip tables when use_skip_pointers is set, or one posting at a time otherwise.
+    """
+
+    def __init__(self, custom_index: CustomIndex, use_skip_pointers: bool = True) -> None:
+        self.custom_index = custom_index
+        self.use_skip_pointers = use_skip_pointers
+
+    def _advance(self, cursor: PostingsCursor, target: int) -> int:
+        if self.use_skip_pointers:
+            return cursor.advance(target)
+
+        while cursor.doc_id < target:
+            cursor.next()
+        return cursor.doc_id
+
+    def evaluate(self, operator: PositionalOperator):
+        """
+        :param operator:
+        :return: tuple of the int64 arrays of the ids of the matching documents and of their number of matches
+        """
+        doc_ids, counts = [], []
+        cursors = {}
+        for term in operator.terms:
+            cursor = self.custom_index.get_postings_cursor(term)
+            if not cursor:
+                return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+            cursors[term] = cursor
+
+        target = max(cursor.doc_id for cursor in cursors.values())
+        while target != PostingsCursor.END:
+            doc_id = max(self._advance(cursor, target) for cursor in cursors.values())
+            if doc_id == target:
+                # every cursor is on the target document
+                count = operator.count_matches([cursors[term].positions for term in operator.terms])
+                if count:
+                    doc_ids.append(doc_id)
+                    counts.append(count)
+                doc_id += 1
+
+            target = doc_id
+
+        return np.array(doc_ids, dtype=np.int64), np.array(counts, dtype=np.int64)
+
+
+class StructuredQueryParser:
+    """
+    Parses the operators out of a raw query, e.g. 'oil #uw8(price increase) "united states"'.
+    Supported operators are #odN(...), #uwN(...) and "..." for an exact phrase, the rest of the query is a bag of
+    words. The text inside the operators is analyzed the same way as the documents.
+    """
+    _OPERATOR_REGEX = re.compile(r'#(od|uw)(\d+)\(([^)]*)\)|"([^"]*)"')
+
+    @classmethod
+    def _create_operator(cls, match, terms):
+        operator_name, window_size, _, _ = match.groups()
+        if operator_name == 'od':
+            return OrderedWindow(terms, int(window_size))
+        elif operator_name == 'uw':
+            return UnorderedWindow(terms, int(window_size))
+        else:
+            return Phrase(terms)
+
+    @classmethod
+    def parse(cls, raw_query: str, custom_index: CustomIndex, enable_stemming: bool = True) -> dict:
+        """
+        :return: dict of the analyzed bag of words 'tokens' and of the positional 'operators'
+        """
+        operators = []
+        for match in cls._OPERATOR_REGEX.finditer(raw_query):
+            text = match.group(3) if match.group(3) is not None else match.group(4)
+            terms = custom_index.analyze_terms(text, enable_stemming)
+            if terms:
+                operators.append(cls._create_operator(match, terms))
+
+        text = cls._OPERATOR_REGEX.sub(' ', raw_query)
+        tokens = custom_index.analyze_terms(text, enable_stemming)
+        return {'tokens': tokens, 'operators': operators}
@@ -0,0 +1,161 @@
+import math
+from abc import abstractmethod
+
+import numpy as np
+
+
+class ScoringKernels:
+    """
+    Whole array versions of the score contributions of a query term to the documents.
+    The tfs and the doc lengths are parallel arrays, one entry per scored document.
+    """
+
+    @classmethod
+    def okapi_tf_idf(cls, tfs: np.ndarray, doc_lengths: np.ndarray, avg_doc_len: float, total_documents: int,
+                     doc_freq: int) -> np.ndarray:
+        temp = tfs / (tfs + 0.5 + (1.5 * (doc_lengths / avg_doc_len)))
+        return temp * math.log(total_documents / doc_freq)
+
+    @classmethod
+    def okapi_bm25(cls, tfs: np.ndarray, doc_lengths: np.ndarray, avg_doc_len: float, total_documents: int,
+                   doc_freq: int, query_tf: int, k_1=1.2, k_2=500, b=0.75) -> np.ndarray:
+        temp_1 = math.log((total_documents + 0.5) / (doc_freq + 0.5))
+        temp_2 = (tfs + (k_1 * tfs)) / (tfs + (k_1 * ((1 - b) + (b * (doc_lengths / avg_doc_len)))))
+        temp_3 = (query_tf + (k_2 * query_tf)) / (query_tf + k_2)
+        return temp_1 * temp_2 * temp_3
+
+    @classmethod
+    def unigram_lm_with_laplace_smoothing(cls, tfs, doc_lengths: np.ndarray, vocabulary_size: int) -> np.ndarray:
+        return np.log((tfs + 1.0) / (doc_lengths + vocabulary_size))
+
+    @classmethod
+    def unigram_lm_with_jelinek_mercer_smoothing(cls, tfs, doc_lengths: np.ndarray, ttf: int, vocabulary_size: int,
+                                                 lam=0.9) -> np.ndarray:
+        """
+        The contribution is 0 wherever the probability is 0 or undefined, i.e. for a term missing from the collection
+        :return:
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores = np.log((lam * (tfs / doc_lengths)) + ((1 - lam) * (ttf / vocabulary_size)))
+
+        scores[~np.isfinite(scores)] = 0.0
+        return scores
+
+
+class SparseLanguageModelScorer:
+    """
+    Top-k scoring of the smoothed unigram language models which touches only the postings of the query terms.
+    A document missing every query term gets a baseline score which only depends on its length, hence the documents
+    outside the postings are ranked without being scored and only the documents in the postings are scored term by
+    term. The returned top-k is the same as the top-k of scoring every document of the collection.
+    """
+
+    def __init__(self, custom_index, k: int = 1000) -> None:
+        self.custom_index = custom_index
+        self.k = k
+
+    @abstractmethod
+    def score_missing_term(self, query_token: str, doc_lengths: np.ndarray) -> np.ndarray:
+        pass
+
+    @abstractmethod
+    def score_present_term(self, query_token: str, tfs: np.ndarray, doc_lengths: np.ndarray) -> np.ndarray:
+        pass
+
+    @abstractmethod
+    def get_document_ids_by_baseline(self) -> np.ndarray:
+        """
+        :return: ids of all the scored documents, sorted by their baseline score and then by the doc id, both in
+        descending order
+        """
+        pass
+
+    def _score_candidates(self, query_tokens, query_postings, candidate_doc_ids):
+        doc_lengths = self.custom_index.get_document_lengths()
+        candidate_doc_lengths = doc_lengths[candidate_doc_ids]
+
+        # summing in the query token order keeps the scores identical to the exhaustive scoring
+        scores = np.zeros(len(candidate_doc_ids), dtype=np.float64)
+        for query_token in query_tokens:
+            term_scores = self.score_missing_term(query_token, candidate_doc_lengths)
+            postings = query_postings[query_token]
+            if postings is not None:
+                doc_ids, tfs = postings
+                term_scores[np.searchsorted(candidate_doc_ids, doc_ids)] = self.score_present_term(
+                    query_token, tfs, doc_lengths[doc_ids])
+            scores += term_scores
+
+        return scores
+
+    def _score_top_baseline_documents(self, query_tokens, candidate_doc_ids):
+        # only the first k documents which are not candidates can make it to the top-k
+        document_ids = self.get_document_ids_by_baseline()[:self.k + len(candidate_doc_ids)]
+        document_ids = document_ids[~np.isin(document_ids, candidate_doc_ids, assume_unique=True)][:self.k]
+        doc_lengths = self.custom_index.get_document_lengths()[document_ids]
+
+        scores = np.zeros(len(document_ids), dtype=np.float64)
+        for query_token in query_tokens:
+            scores += self.score_missing_term(query_token, doc_lengths)
+
+        return document_ids, scores
+
+    def search(self, query_tokens) -> list:
+        """
+        :param query_tokens: analyzed query tokens
+        :return: list of (score, doc_id) tuples of the top-k documents, sorted by score in descending order
+        """
+        if not query_tokens:
+            return []
+
+        query_postings = {query_token: self.custom_index.get_postings_arrays(query_token)
+                          for query_token in set(query_tokens)}
+        postings_doc_ids = [postings[0] for postings in query_postings.values() if postings is not None]
+        candidate_doc_ids = np.unique(np.concatenate(postings_doc_ids)) if postings_doc_ids else np.zeros(
+            0, dtype=np.int64)
+
+        candidate_scores = self._score_candidates(query_tokens, query_postings, candidate_doc_ids)
+        baseline_doc_ids, baseline_scores = self._score_top_baseline_documents(query_tokens, candidate_doc_ids)
+
+        scores = list(zip(candidate_scores.tolist(), candidate_doc_ids.tolist()))
+        scores.extend(zip(baseline_scores.tolist(), baseline_doc_ids.tolist()))
+        scores.sort(reverse=True)
+        return scores[:self.k]
+
+
+class LaplaceLanguageModelScorer(SparseLanguageModelScorer):
+
+    def __init__(self, custom_index, vocabulary_size: int, k: int = 1000) -> None:
+        super().__init__(custom_index, k)
+        self.vocabulary_size = vocabulary_size
+
+    def score_missing_term(self, query_token: str, doc_lengths: np.ndarray) -> np.ndarray:
+        return ScoringKernels.unigram_lm_with_laplace_smoothing(0, doc_lengths, self.vocabulary_size)
+
+    def score_present_term(self, query_token: str, tfs: np.ndarray, doc_lengths: np.ndarray) -> np.ndarray:
+        return ScoringKernels.unigram_lm_with_laplace_smoothing(tfs, doc_lengths, self.vocabulary_size)
+
+    def get_document_ids_by_baseline(self) -> np.ndarray:
+        # the missing term score decreases with the doc length
+        return self.custom_index.get_document_ids_by_length()
+
+
+class JelinekMercerLanguageModelScorer(SparseLanguageModelScorer):
+
+    def __init__(self, custom_index, vocabulary_size: int, lam=0.9, k: int = 1000) -> None:
+        super().__init__(custom_index, k)
+        self.vocabulary_size = vocabulary_size
+        self.lam = lam
+
+    def score_missing_term(self, query_token: str, doc_lengths: np.ndarray) -> np.ndarray:
+        ttf = self.custom_index.get_ttf(query_token)
+        return ScoringKernels.unigram_lm_with_jelinek_mercer_smoothing(0, doc_lengths, ttf, self.vocabulary_size,
+                                                                       self.lam)
+
+    def score_present_term(self, query_token: str, tfs: np.ndarray, doc_lengths: np.ndarray) -> np.ndarray:
+        ttf = self.custom_index.get_ttf(query_token)
+        return ScoringKernels.unigram_lm_with_jelinek_mercer_smoothing(tfs, doc_lengths, ttf, self.vocabulary_size,
+                                                                       self.lam)
+
+    def get_document_ids_by_baseline(self) -> np.ndarray:
+        # the missing term score does not depend on the doc length, every document has the same baseline
+        return self.custom_index.get_all_document_ids()[::-1]
@@ -0,0 +1,643 @@
+import concurrent.futures
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+
+from HW_2.cache import PostingsCache
+from HW_2.indexer import CustomIndex
+from constants.constants import Constants
+from utils.utils import Utils
+
+
+class TieredMergePolicy:
+    """
+    Groups the segments into tiers of exponentially growing number of documents, merge_factor segments of the same
+    tier are merged into a single segment of the next tier. Every document is hence rewritten about
+    log(no of documents) times. A segment whose documents are mostly deleted is rewritten on its own.
+    """
+
+    def __init__(self, merge_factor: int = Constants.SEGMENT_MERGE_FACTOR,
+                 min_segment_size: int = Constants.MIN_SEGMENT_SIZE,
+                 max_deleted_documents_ratio: float = Constants.MAX_DELETED_DOCUMENTS_RATIO) -> None:
+        self.merge_factor = merge_factor
+        self.min_segment_size = min_segment_size
+        self.max_deleted_documents_ratio = max_deleted_documents_ratio
+
+    def _get_tier(self, no_of_documents: int) -> int:
+        tier = 0
+        tier_size = self.min_segment_size * self.merge_factor
+        while no_of_documents >= tier_size:
+            tier += 1
+            tier_size *= self.merge_factor
+        return tier
+
+    def find_merges(self, segments: list) -> list:
+        """
+        :param segments: manifest entries of the segments which are not being merged, from the oldest to the newest
+        :return: list of the lists of the names of the segments to merge together
+        """
+        merges = []
+        tiers = {}
+        for segment in segments:
+            if segment['no_of_deleted_documents'] > self.max_deleted_documents_ratio * segment['no_of_documents']:
+                merges.append([segment['name']])
+            else:
+                no_of_live_documents = segment['no_of_documents'] - segment['no_of_deleted_documents']
+                tiers.setdefault(self._get_tier(no_of_live_documents), []).append(segment['name'])
+
+        for tier in sorted(tiers):
+            names = tiers[tier]
+            for i in range(0, len(names) - self.merge_factor + 1, self.merge_factor):
+                merges.append(names[i:i + self.merge_factor])
+
+        return merges
+
+
+class SegmentedIndex:
+    """
+    Index made of immutable segments, every segment being a complete CustomIndex.
+    New documents are indexed into a new small segment, deleted documents are marked in a per segment bitmap and a
+    document added again replaces its previous version. The live segments and their delete bitmaps are listed in a
+    JSON manifest which is replaced atomically on every change, the segments are merged in the background according
+    to the merge policy.
+    Reads go through all the live segments and expose the same interface as CustomIndex, so that every score
+    calculator works on a SegmentedIndex as well. The merged segments are deleted once the readers are refreshed.
+    """
+    MANIFEST_FILE_EXTENSION = '.manifest'
+    _TERMVECTOR_CACHE_KEY = 'termvector'
+    _POSTINGS_ARRAYS_CACHE_KEY = 'postings_arrays'
+    _POSTINGS_BYTES_CACHE_KEY = 'postings_bytes'
+    # estimated bytes of a decoded posting, see CustomIndex._estimate_termvector_size
+    _ESTIMATED_POSTING_SIZE = 300
+    _ESTIMATED_POSITION_SIZE = 40
+
+    def __init__(self, manifest_file_path: str, custom_index_factory, index_head: bool = True,
+                 enable_stemming: bool = True, merge_policy: TieredMergePolicy = None,
+                 postings_cache_size_in_bytes: int = Constants.POSTINGS_CACHE_SIZE_IN_BYTES) -> None:
+        """
+        :param manifest_file_path: manifest of the index, it is created when absent
+        :param custom_index_factory: function called as custom_index_factory(postings_cache_size_in_bytes), returning
+        a new CustomIndex
+        :param index_head: used only when the index is created
+        :param enable_stemming: used only when the index is created
+        """
+        self.manifest_file_path = manifest_file_path
+        self.custom_index_factory = custom_index_factory
+        self.merge_policy = merge_policy or TieredMergePolicy()
+        # analyzes the text, maps the document ids and writes the new segments
+        self.custom_index = custom_index_factory()
+        self.serializer = self.custom_index.serializer
+
+        # guards the manifest, which is updated by the merge thread as well
+        self.lock = threading.RLock()
+        self.merge_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.merge_futures = []
+        self.merging_segment_names = set()
+        # files which are not part of the index anymore, they are deleted when the readers are refreshed
+        self.obsolete_file_paths = []
+
+        self.segments = {}
+        self.deleted_documents = {}
+        self.document_lengths = None
+        self.document_ids = None
+        self.document_ids_by_length = None
+        self.statistics = None
+        self.vocabulary_size = None
+        self.postings_cache = PostingsCache(postings_cache_size_in_bytes)
+
+        os.makedirs(self._get_deleted_documents_dir(), exist_ok=True)
+        if os.path.isfile(manifest_file_path):
+            self.manifest = self._read_manifest_from_file(manifest_file_path)
+        else:
+            self.manifest = {
+                'index_head': index_head,
+                'enable_stemming': enable_stemming,
+                'generation': 0,
+                'segments': []
+            }
+            self._write_manifest_to_file()
+
+        self.refresh()
+
+    @classmethod
+    def get_segments_dir(cls):
+        return '{}/{}/{}'.format(Utils.get_data_dir_abs_path(), 'custom-index', 'segments')
+
+    @classmethod
+    def get_new_manifest_file_path(cls):
+        return '{}/{}{}'.format(cls.get_segments_dir(), Utils.get_random_file_name_with_ts(),
+                                cls.MANIFEST_FILE_EXTENSION)
+
+    @classmethod
+    def is_manifest_file(cls, file_path: str) -> bool:
+        return file_path.endswith(cls.MANIFEST_FILE_EXTENSION)
+
+    @classmethod
+    def _get_deleted_documents_dir(cls):
+        return '{}/{}'.format(cls.get_segments_dir(), 'deleted-documents')
+
+    @property
+    def metadata_file_path(self):
+        # the manifest identifies the index, e.g. for the query result cache
+        return self.manifest_file_path
+
+    @classmethod
+    def _read_manifest_from_file(cls, manifest_file_path):
+        with open(manifest_file_path, 'r') as file:
+            return json.load(file)
+
+    def _write_manifest_to_file(self):
+        self.manifest['generation'] += 1
+        # the manifest is replaced atomically, the readers see either the old or the new list of segments
+        temp_file_path = '{}.{}'.format(self.manifest_file_path, os.getpid())
+        with open(temp_file_path, 'w') as file:
+            json.dump(self.manifest, file, indent=True)
+        os.replace(temp_file_path, self.manifest_file_path)
+
+    def _write_deleted_documents_to_file(self, deleted_documents: np.ndarray) -> str:
+        file_path = '{}/{}.npy'.format(self._get_deleted_documents_dir(), Utils.get_random_file_name_with_ts())
+        np.save(file_path, np.packbits(deleted_documents))
+        return file_path
+
+    @classmethod
+    def _read_deleted_documents_from_file(cls, segment):
+        """
+        :return: bitmap of the deleted documents of the segment indexed by the internal doc id, or None
+        """
+        if not segment['deleted_documents_file_path']:
+            return None
+        return np.unpackbits(np.load(segment['deleted_documents_file_path'])).astype(bool)
+
+    @classmethod
+    def _create_segment(cls, metadata, metadata_file_path):
+        return {
+            'name': os.path.splitext(os.path.basename(metadata_file_path))[0],
+            'metadata_file_path': metadata_file_path,
+            'deleted_documents_file_path': None,
+            'no_of_documents': metadata['statistics']['total_docs'],
+            'no_of_deleted_documents': 0
+        }
+
+    @classmethod
+    def _read_segment_metadata(cls, segment):
+        with open(segment['metadata_file_path'], 'r') as file:
+            return json.load(file)
+
+    @classmethod
+    def _get_segment_file_paths(cls, segment):
+        file_paths = [segment['metadata_file_path']] + CustomIndex.get_data_file_paths(
+            cls._read_segment_metadata(segment))
+        if segment['deleted_documents_file_path']:
+            file_paths.append(segment['deleted_documents_file_path'])
+        return file_paths
+
+    def refresh(self):
+        """
+        Opens the segments added or merged since the last refresh and closes the ones which are not live anymore
+        """
+        with self.lock:
+            segments = {}
+            for segment in self.manifest['segments']:
+                custom_index = self.segments.pop(segment['name'], None)
+                if custom_index is None:
+                    # the postings are cached once for all the segments, see get_postings_arrays
+                    custom_index = self.custom_index_factory(0)
+                    custom_index.init_index(segment['metadata_file_path'])
+                segments[segment['name']] = custom_index
+
+            closed_segments = self.segments
+            self.segments = segments
+            self.deleted_documents = {segment['name']: self._read_deleted_documents_from_file(segment)
+                                      for segment in self.manifest['segments']}
+            self._compute_statistics()
+            self.postings_cache.clear()
+
+            # the readers are switched before the segments merged away are closed, a segment still read through a
+            # postings cursor is unmapped once the cursor is gone, see CustomIndex.close
+            for custom_index in closed_segments.values():
+                custom_index.close()
+
+            for file_path in self.obsolete_file_paths:
+                os.remove(file_path)
+            self.obsolete_file_paths = []
+
+    def _get_live_document_lengths(self, name):
+        document_lengths = np.array(self.segments[name].get_document_lengths())
+        deleted_documents = self.deleted_documents[name]
+        if deleted_documents is not None:
+            document_lengths[deleted_documents[:len(document_lengths)]] = 0
+        return document_lengths
+
+    def _get_live_document_ids(self, name):
+        """
+        :return: sorted internal ids of the documents of the segment which are not deleted, including the ones without
+        any token
+        """
+        document_ids = self.segments[name].get_indexed_document_ids()
+        deleted_documents = self.deleted_documents[name]
+        if deleted_documents is not None:
+            document_ids = document_ids[~deleted_documents[document_ids]]
+        return document_ids
+
+    def _compute_statistics(self):
+        no_of_documents = max((len(custom_index.get_document_lengths()) for custom_index in self.segments.values()),
+                              default=0)
+        self.document_lengths = np.zeros(no_of_documents, dtype=np.uint32)
+        total_docs = 0
+        for segment in self.manifest['segments']:
+            # a document is live in at most one segment
+            document_lengths = self._get_live_document_lengths(segment['name'])
+            self.document_lengths[:len(document_lengths)] += document_lengths
+            total_docs += segment['no_of_documents'] - segment['no_of_deleted_documents']
+
+        total_tokens = int(self.document_lengths.sum(dtype=np.uint64))
+        non_empty_document_lengths = self.document_lengths[self.document_lengths > 0]
+        self.statistics = {
+            'total_docs': total_docs,
+            'total_tokens': total_tokens,
+            'average_doc_length': total_tokens / total_docs if total_docs else 0.0,
+            'min_doc_length': int(non_empty_document_lengths.min()) if len(non_empty_document_lengths) else 0
+        }
+        self.document_ids = None
+        self.document_ids_by_length = None
+        self.vocabulary_size = None
+
+    def add_documents(self, documents, no_of_workers=Constants.NO_OF_PARALLEL_INDEXING_TASKS):
+        """
+        Indexes the documents into a new segment, the previous versions of the documents are deleted
+        :param documents: iterable of parsed documents
+        :param no_of_workers:
+        :return:
+        """
+        documents = list(documents)
+        if not documents:
+            return
+
+        with self.lock:
+            self.refresh()
+            self.custom_index.add_document_ids(document['id'] for document in documents)
+            self._delete_internal_documents(
+                [self.custom_index.get_internal_document_id(document['id']) for document in documents])
+
+            metadata, metadata_file_path = self.custom_index.index_documents(
+                documents, self.manifest['index_head'], self.manifest['enable_stemming'], no_of_workers)
+            self.custom_index.close()
+
+            self.manifest['segments'].append(self._create_segment(metadata, metadata_file_path))
+            self._write_manifest_to_file()
+            self.refresh()
+            self._schedule_merges()
+
+    def delete_documents(self, document_ids):
+        """
+        :param document_ids: external ids of the documents to delete, the unknown ones are ignored
+        :return:
+        """
+        with self.lock:
+            self.refresh()
+            internal_document_ids = [self.custom_index.document_id_mapping[doc_id] for doc_id in document_ids
+                                     if doc_id in self.custom_index.document_id_mapping]
+            if self._delete_internal_documents(internal_document_ids):
+                self._write_manifest_to_file()
+                self.refresh()
+                self._schedule_merges()
+
+    def _delete_internal_documents(self, internal_document_ids) -> int:
+        """
+        Marks the documents as deleted in every segment containing them, the manifest is not written
+        :return: number of documents deleted
+        """
+        internal_document_ids = np.array(internal_document_ids, dtype=np.int64)
+        no_of_deleted_documents = 0
+        for segment in self.manifest['segments']:
+            # a document made only of stopwords has no token but is still part of the segment
+            doc_ids = np.intersect1d(internal_document_ids, self._get_live_document_ids(segment['name']))
+            if not len(doc_ids):
+                continue
+
+            deleted_documents = self.deleted_documents[segment['name']]
+            if deleted_documents is None:
+                deleted_documents = np.zeros(len(self.segments[segment['name']].get_document_lengths()), dtype=bool)
+            else:
+                deleted_documents = deleted_documents.copy()
+                self.obsolete_file_paths.append(segment['deleted_documents_file_path'])
+
+            deleted_documents[doc_ids] = True
+            segment['deleted_documents_file_path'] = self._write_deleted_documents_to_file(deleted_documents)
+            segment['no_of_deleted_documents'] += len(doc_ids)
+            no_of_deleted_documents += len(doc_ids)
+
+        return no_of_deleted_documents
+
+    def _schedule_merges(self):
+        with self.lock:
+            segments = [segment for segment in self.manifest['segments']
+                        if segment['name'] not in self.merging_segment_names]
+            for names in self.merge_policy.find_merges(segments):
+                logging.info('Scheduling the merge of the segments {}'.format(names))
+                self.merging_segment_names.update(names)
+                self.merge_futures.append(self.merge_executor.submit(self._merge_segments, names))
+
+    @classmethod
+    def _get_deleted_document_ids(cls, segment) -> set:
+        deleted_documents = cls._read_deleted_documents_from_file(segment)
+        return set(np.flatnonzero(deleted_documents).tolist()) if deleted_documents is not None else set()
+
+    def _merge_segments(self, names):
+        merged_segment = None
+        try:
+            with self.lock:
+                segments = [dict(segment) for segment in self.manifest['segments'] if segment['name'] in names]
+                # the delete bitmaps are read under the lock, a concurrent delete replaces them and removes the old
+                # ones on the next refresh
+                deleted_document_ids_list = [self._get_deleted_document_ids(segment) for segment in segments]
+
+            if any(segment['no_of_documents'] > segment['no_of_deleted_documents'] for segment in segments):
+                custom_index = self.custom_index_factory(0)
+                metadata_list = [self._read_segment_metadata(segment) for segment in segments]
+                metadata, metadata_file_path = custom_index.merge_indexes(metadata_list, deleted_document_ids_list)
+                merged_segment = self._create_segment(metadata, metadata_file_path)
+
+            with self.lock:
+                self._commit_merge(segments, deleted_document_ids_list, merged_segment)
+                self.merging_segment_names.difference_update(names)
+        except Exception:
+            logging.exception('Merging the segments {} failed'.format(names))
+            with self.lock:
+                self.merging_segment_names.difference_update(names)
+                # the merged segment is not part of the index unless the manifest lists it
+                if merged_segment is not None and merged_segment not in self.manifest['segments']:
+                    for file_path in self._get_segment_file_paths(merged_segment):
+                        os.remove(file_path)
+            raise
+
+        # the merged segment may complete a tier
+        self._schedule_merges()
+
+    def _commit_merge(self, segments, deleted_document_ids_list, merged_segment):
+        live_segments = {segment['name']: segment for segment in self.manifest['segments']}
+        if merged_segment is not None:
+            # the documents deleted while the segments were being merged are deleted from the merged segment
+            deleted_document_ids = set()
+            for segment, merged_deleted_document_ids in zip(segments, deleted_document_ids_list):
+                deleted_document_ids.update(self._get_deleted_document_ids(live_segments[segment['name']]) -
+                                            merged_deleted_document_ids)
+
+            if deleted_document_ids:
+                metadata = self._read_segment_metadata(merged_segment)
+                document_lengths = np.load(metadata['document_length_file_path'], mmap_mode='r')
+                deleted_documents = np.zeros(len(document_lengths), dtype=bool)
+                deleted_documents[list(deleted_document_ids)] = True
+                is_indexed = np.zeros(len(document_lengths), dtype=bool)
+                is_indexed[np.load(metadata['document_id_file_path'])] = True
+                deleted_documents &= is_indexed
+                merged_segment['deleted_documents_file_path'] = self._write_deleted_documents_to_file(
+                    deleted_documents)
+                merged_segment['no_of_deleted_documents'] = int(deleted_documents.sum())
+
+        names = {segment['name'] for segment in segments}
+        merged_segments = []
+        for segment in self.manifest['segments']:
+            if segment['name'] not in names:
+                merged_segments.append(segment)
+            elif merged_segment is not None:
+                # the merged segment takes the place of the oldest segment it replaces
+                merged_segments.append(merged_segment)
+                merged_segment = None
+
+        self.manifest['segments'] = merged_segments
+        self._write_manifest_to_file()
+        for name in names:
+            self.obsolete_file_paths.extend(self._get_segment_file_paths(live_segments[name]))
+        logging.info('Merged the segments {}'.format(sorted(names)))
+
+    def wait_for_merges(self):
+        """
+        Waits for the scheduled merges, including the ones they trigger, and refreshes the readers
+        """
+        while True:
+            with self.lock:
+                merge_futures = self.merge_futures
+                self.merge_futures = []
+            if not merge_futures:
+                break
+
+            for merge_future in merge_futures:
+                merge_future.result()
+
+        self.refresh()
+
+    def close(self):
+        self.merge_executor.shutdown(wait=True)
+        self.postings_cache.clear()
+        for custom_index in self.segments.values():
+            custom_index.close()
+        self.segments = {}
+        self.custom_index.close()
+
+    def _get_live_termvectors(self, term) -> list:
+        termvectors = []
+        for name, custom_index in self.segments.items():
+            termvector = custom_index.get_termvector(term)
+            if not termvector:
+                continue
+
+            deleted_documents = self.deleted_documents[name]
+            if deleted_documents is not None:
+                tf_info_dict = {doc_id: tf_info for doc_id, tf_info in termvector['tf'].items()
+                                if not deleted_documents[doc_id]}
+                termvector = {'ttf': sum(tf_info['tf'] for tf_info in tf_info_dict.values()), 'tf': tf_info_dict}
+
+            if termvector['tf']:
+                termvectors.append(termvector)
+        return termvectors
+
+    def get_termvector(self, term):
+        """
+        The decoded termvectors are cached, they must not be modified by the caller
+        :param term:
+        :return: termvector of the term over the live documents or an empty dict if the term is not present
+        """
+        cache_key = (self._TERMVECTOR_CACHE_KEY, term)
+        termvector = self.postings_cache.get(cache_key)
+        if termvector is not None:
+            return termvector
+
+        termvectors = self._get_live_termvectors(term)
+        if not termvectors:
+            return {}
+
+        termvector = {'ttf': 0, 'tf': {}}
+        for segment_termvector in termvectors:
+            termvector['ttf'] += segment_termvector['ttf']
+            termvector['tf'].update(segment_termvector['tf'])
+
+        estimated_size = (len(termvector['tf']) * self._ESTIMATED_POSTING_SIZE) + (
+                termvector['ttf'] * self._ESTIMATED_POSITION_SIZE)
+        self.postings_cache.put(cache_key, termvector, estimated_size)
+        return termvector
+
+    def get_postings_arrays(self, term):
+        """
+        :param term:
+        :return: tuple of the int64 arrays of the doc ids and of the tfs of the live documents containing the term,
+        sorted by the doc id, or None if the term is not present in any live document
+        """
+        cache_key = (self._POSTINGS_ARRAYS_CACHE_KEY, term)
+        postings = self.postings_cache.get(cache_key)
+        if postings is not None:
+            return postings
+
+        doc_ids_list, tfs_list = [], []
+        for name, custom_index in self.segments.items():
+            postings = custom_index.get_postings_arrays(term)
+            if postings is None:
+                continue
+
+            doc_ids, tfs = postings
+            deleted_documents = self.deleted_documents[name]
+            if deleted_documents is not None:
+                is_live = ~deleted_documents[doc_ids]
+                doc_ids, tfs = doc_ids[is_live], tfs[is_live]
+            doc_ids_list.append(doc_ids)
+            tfs_list.append(tfs)
+
+        if not doc_ids_list:
+            return None
+
+        doc_ids, tfs = np.concatenate(doc_ids_list), np.concatenate(tfs_list)
+        if not len(doc_ids):
+            return None
+
+        if len(doc_ids_list) > 1:
+            order = np.argsort(doc_ids, kind='stable')
+            doc_ids, tfs = doc_ids[order], tfs[order]
+
+        doc_ids.flags.writeable = False
+        tfs.flags.writeable = False
+        postings = (doc_ids, tfs)
+        self.postings_cache.put(cache_key, postings, doc_ids.nbytes + tfs.nbytes)
+        return postings
+
+    def get_postings_cursor(self, term):
+        """
+        Cursor over the postings of the term of the live documents. The postings of a term present in a single segment
+        without deletes are read in place, the others are merged and encoded again.
+        :param term:
+        :return: PostingsCursor or None if the term is not present in any live document
+        """
+        names = [name for name, custom_index in self.segments.items() if term in custom_index.catalog['data']]
+        if len(names) == 1 and self.deleted_documents[names[0]] is None:
+            return self.segments[names[0]].get_postings_cursor(term)
+
+        cache_key = (self._POSTINGS_BYTES_CACHE_KEY, term)
+        buffer = self.postings_cache.get(cache_key)
+        if buffer is None:
+            termvector = self.get_termvector(term)
+            if not termvector:
+                return None
+
+            buffer = bytes(self.serializer.serialize(termvector))
+            self.postings_cache.put(cache_key, buffer, len(buffer))
+
+        return self.serializer.create_postings_cursor(buffer)
+
+    def _has_deleted_postings(self, term) -> bool:
+        return any(deleted_documents is not None and term in self.segments[name].catalog['data']
+                   for name, deleted_documents in self.deleted_documents.items())
+
+    def get_term_max_tf(self, term) -> int:
+        # upper bound, the max tf may belong to a deleted document
+        return max((custom_index.get_term_max_tf(term) for custom_index in self.segments.values()), default=0)
+
+    def get_doc_freq(self, term) -> int:
+        if self._has_deleted_postings(term):
+            postings = self.get_postings_arrays(term)
+            return len(postings[0]) if postings is not None else 0
+        return sum(custom_index.get_doc_freq(term) for custom_index in self.segments.values())
+
+    def get_ttf(self, term) -> int:
+        if self._has_deleted_postings(term):
+            postings = self.get_postings_arrays(term)
+            return int(postings[1].sum()) if postings is not None else 0
+        return sum(custom_index.get_ttf(term) for custom_index in self.segments.values())
+
+    def get_min_doc_length(self) -> int:
+        return self.statistics['min_doc_length']
+
+    def get_total_documents(self):
+        return self.statistics['total_docs']
+
+    def get_total_tokens(self) -> int:
+        return self.statistics['total_tokens']
+
+    def get_average_doc_length(self) -> float:
+        return self.statistics['average_doc_length']
+
+    def get_vocabulary_size(self) -> int:
+        if self.vocabulary_size is None:
+            if len(self.segments) == 1:
+                self.vocabulary_size = next(iter(self.segments.values())).get_vocabulary_size()
+            else:
+                self.vocabulary_size = len(set().union(*[custom_index.catalog['data'].keys()
+                                                         for custom_index in self.segments.values()]))
+        return self.vocabulary_size
+
+    def analyze(self, text: str, enable_stemming: bool) -> list:
+        return self.custom_index.analyze(text, enable_stemming)
+
+    def analyze_terms(self, text: str, enable_stemming: bool) -> list:
+        return self.custom_index.analyze_terms(text, enable_stemming)
+
+    def get_doc_length(self, doc_id: int) -> int:
+        return int(self.document_lengths[doc_id]) if doc_id < len(self.document_lengths) else 0
+
+    def get_document_lengths(self) -> np.ndarray:
+        """
+        :return: lengths of all the live documents, indexed by the internal doc id
+        """
+        return self.document_lengths
+
+    def get_all_document_ids(self) -> np.ndarray:
+        """
+        :return: sorted internal ids of all the live documents having at least one token
+        """
+        if self.document_ids is None:
+            self.document_ids = np.flatnonzero(self.document_lengths)
+        return self.document_ids
+
+    def get_document_ids_by_length(self) -> np.ndarray:
+        """
+        :return: internal ids of all the live documents having at least one token, sorted by the doc length in
+        ascending order and then by the doc id in descending order
+        """
+        if self.document_ids_by_length is None:
+            document_ids = self.get_all_document_ids()
+            order = np.lexsort((-document_ids, self.document_lengths[document_ids]))
+            self.document_ids_by_length = document_ids[order]
+        return self.document_ids_by_length
+
+    def get_external_document_id(self, doc_id: int) -> str:
+        return self.custom_index.get_external_document_id(doc_id)
+
+    def get_document(self, doc_id: int):
+        """
+        :param doc_id: internal doc id
+        :return: dict of the external id, the head and the text of the live version of the document or None
+        """
+        for name, custom_index in self.segments.items():
+            deleted_documents = self.deleted_documents[name]
+            if deleted_documents is not None and doc_id < len(deleted_documents) and deleted_documents[doc_id]:
+                continue
+
+            document = custom_index.get_document(doc_id)
+            if document is not None:
+                return document
+
+        return None
+
+    def get_internal_document_id(self, document_id: str) -> int:
+        return self.custom_index.get_internal_document_id(document_id)
@@ -2,6 +2,10 @@ import json
 import pickle
 from abc import abstractmethod
 
+import numpy as np
+
+from HW_2.postings import PostingsCursor
+from HW_2.varbyte import VarByte
 from constants.constants import Constants
 
 
@@ -31,7 +35,10 @@ class JsonSerializer(Serializer):
         return json.dumps(obj_to_serialize).encode(Constants.AP_DATA_FILE_ENCODING)
 
     def deserialize(self, bytes_to_deserialize: bytes):
-        return json.loads(bytes_to_deserialize.decode(Constants.AP_DATA_FILE_ENCODING))
+        termvector = json.loads(str(bytes_to_deserialize, Constants.AP_DATA_FILE_ENCODING))
+        # json stores the integer doc ids as strings
+        termvector['tf'] = {int(doc_id): tf_info for doc_id, tf_info in termvector['tf'].items()}
+        return termvector
 
 
 class PickleSerializer(Serializer):
@@ -52,12 +59,6 @@ class TermvectorSerializer(Serializer):
     _TF_INFO_SEPARATOR = ','
     _POSITION_SEPARATOR = '@'
 
-    def __init__(self, document_id_mapping_file_path) -> None:
-        with open(document_id_mapping_file_path, 'r') as file:
-            self.document_id_mapping = json.load(file)
-
-        self.document_id_rev_mapping = {mapped_id: doc_id for doc_id, mapped_id in self.document_id_mapping.items()}
-
     @property
     def name(self) -> str:
         return Constants.TERMVECTOR_SERIALIZER_NAME
@@ -71,8 +72,7 @@ class TermvectorSerializer(Serializer):
         str_list = [str(termvector['ttf'])]
         for doc_id, tf_info in termvector['tf'].items():
             positions_str = self._POSITION_SEPARATOR.join(map(str, tf_info['pos']))
-            mapped_id = self.document_id_mapping[doc_id]
-            tf_info_str = self._TF_INFO_SEPARATOR.join([str(mapped_id), str(tf_info['tf']), positions_str])
+            tf_info_str = self._TF_INFO_SEPARATOR.join([str(doc_id), str(tf_info['tf']), positions_str])
             str_list.append(tf_info_str)
 
         serialized_str = self._TERMVECTOR_SEPARATOR.join(str_list)
@@ -80,17 +80,154 @@ class TermvectorSerializer(Serializer):
 
     def deserialize(self, bytes_to_deserialize: bytes):
         termvector = {}
-        deserialized_str = bytes_to_deserialize.decode(Constants.AP_DATA_FILE_ENCODING)
+        deserialized_str = str(bytes_to_deserialize, Constants.AP_DATA_FILE_ENCODING)
         termvector_splits = deserialized_str.split(self._TERMVECTOR_SEPARATOR)
         termvector['ttf'] = int(termvector_splits[0])
         termvector['tf'] = {}
 
         for termvector_split in termvector_splits[1:]:
             tf_info_splits = termvector_split.split(self._TF_INFO_SEPARATOR)
-            mapped_id = tf_info_splits[0]
-            doc_id = self.document_id_rev_mapping[mapped_id]
+            doc_id = int(tf_info_splits[0])
             tf = int(tf_info_splits[1])
             positions = list(map(int, tf_info_splits[2].split(self._POSITION_SEPARATOR)))
             termvector['tf'][doc_id] = {'tf': tf, 'pos': positions}
 
         return termvector
+
+
+class VarByteSerializer(Serializer):
+
+    def __init__(self, block_size: int = Constants.POSTINGS_BLOCK_SIZE) -> None:
+        self.block_size = block_size
+
+    @property
+    def name(self) -> str:
+        return Constants.VARBYTE_SERIALIZER_NAME
+
+    @classmethod
+    def _serialize_block(cls, postings, previous_doc_id):
+        block = VarByte.encode_gaps([doc_id for doc_id, _ in postings], previous=previous_doc_id)
+        VarByte.encode([tf_info['tf'] for _, tf_info in postings], block)
+        return block
+
+    @classmethod
+    def _serialize_position_block(cls, postings):
+        position_block = bytearray()
+        for _, tf_info in postings:
+            VarByte.encode_gaps(sorted(tf_info['pos']), position_block)
+        return position_block
+
+    def serialize(self, termvector) -> bytes:
+        """
+        All the numbers are VarByte encoded, the postings are sorted by the doc id and split into blocks
+        <ttf><df><block_size><skip table length in bytes><skip table><block 1>...<block n><position block 1>...
+        <position block n>
+
+        skip table: <last doc id gap><max tf><block length in bytes><position block length in bytes> for every block,
+        the last doc id gap is relative to the last doc id of the previous block
+
+        block: <doc_id gaps...><tfs...>
+        the first doc id gap is relative to the last doc id of the previous block
+
+        position block: <position gaps of doc 1...><position gaps of doc 2...>...
+        the positions of a document are stored in ascending order and their gaps restart from 0 for every document.
+        The positions follow all the doc ids and tfs, hence the models which need only the tfs do not read them.
+        :param termvector:
+        :return:
+        """
+        postings = sorted(termvector['tf'].items())
+
+        skip_table = []
+        blocks = bytearray()
+        position_blocks = bytearray()
+        previous_doc_id = 0
+        for i in range(0, len(postings), self.block_size):
+            block_postings = postings[i:i + self.block_size]
+            block = self._serialize_block(block_postings, previous_doc_id)
+            position_block = self._serialize_position_block(block_postings)
+
+            last_doc_id = block_postings[-1][0]
+            max_tf = max(tf_info['tf'] for _, tf_info in block_postings)
+            skip_table.extend([last_doc_id - previous_doc_id, max_tf, len(block), len(position_block)])
+
+            blocks.extend(block)
+            position_blocks.extend(position_block)
+            previous_doc_id = last_doc_id
+
+        encoded_skip_table = VarByte.encode(skip_table)
+        output = VarByte.encode([termvector['ttf'], len(postings), self.block_size, len(encoded_skip_table)])
+        output.extend(encoded_skip_table)
+        output.extend(blocks)
+        output.extend(position_blocks)
+        return bytes(output)
+
+    @classmethod
+    def _deserialize_header(cls, buffer):
+        """
+        :return: tuple of the ttf, the df, the block size, the last doc id and the max tf of every block, the offsets
+        of the blocks and the offsets of the position blocks, both followed by the offset of their end
+        """
+        header = []
+        offset = 0
+        for _ in range(4):
+            number, offset = VarByte.decode_one(buffer, offset)
+            header.append(number)
+
+        ttf, df, block_size, skip_table_length = header
+        skip_table = VarByte.decode(buffer[offset:offset + skip_table_length]).reshape(-1, 4)
+        block_last_doc_ids = np.cumsum(skip_table[:, 0]).tolist()
+        block_max_tfs = skip_table[:, 1].tolist()
+        block_offsets = [offset + skip_table_length] + (np.cumsum(skip_table[:, 2]) + np.uint64(
+            offset + skip_table_length)).tolist()
+        position_block_offsets = [block_offsets[-1]] + (np.cumsum(skip_table[:, 3]) + np.uint64(
+            block_offsets[-1])).tolist()
+        return ttf, df, block_size, block_last_doc_ids, block_max_tfs, block_offsets, position_block_offsets
+
+    def create_postings_cursor(self, buffer) -> PostingsCursor:
+        return PostingsCursor(buffer, *self._deserialize_header(buffer))
+
+    @classmethod
+    def _decode_blocks(cls, buffer):
+        """
+        :return: tuple of the ttf, the doc id gaps and the tfs of all the blocks and the offset of the positions
+        """
+        ttf, df, block_size, _, _, block_offsets, position_block_offsets = cls._deserialize_header(buffer)
+        numbers = VarByte.decode(buffer[block_offsets[0]:block_offsets[-1]])
+
+        # every block holds the doc id gaps of its documents followed by their tfs
+        doc_id_gaps, tfs = [], []
+        for start in range(0, df, block_size):
+            no_of_docs = min(block_size, df - start)
+            doc_id_gaps.append(numbers[2 * start:(2 * start) + no_of_docs])
+            tfs.append(numbers[(2 * start) + no_of_docs:2 * (start + no_of_docs)])
+
+        return ttf, np.concatenate(doc_id_gaps), np.concatenate(tfs), position_block_offsets[0]
+
+    def deserialize_postings(self, bytes_to_deserialize: bytes):
+        """
+        Decodes only the doc ids and the tfs of the postings, the positions are not read
+        :param bytes_to_deserialize:
+        :return: tuple of the int64 arrays of the doc ids and of the tfs
+        """
+        _, doc_id_gaps, tfs, _ = self._decode_blocks(bytes_to_deserialize)
+        return np.cumsum(doc_id_gaps).astype(np.int64), tfs.astype(np.int64)
+
+    def deserialize(self, bytes_to_deserialize: bytes):
+        ttf, doc_id_gaps, tfs, positions_offset = self._decode_blocks(bytes_to_deserialize)
+        position_gaps = VarByte.decode(bytes_to_deserialize[positions_offset:])
+        df = len(tfs)
+        doc_ids = np.cumsum(doc_id_gaps).tolist()
+
+        # positions are delta encoded within a document, hence the running sum is rebased at every document boundary
+        running_positions = np.cumsum(position_gaps)
+        doc_ends = np.cumsum(tfs).astype(np.int64)
+        doc_bases = np.zeros(df, dtype=np.uint64)
+        doc_bases[1:] = running_positions[doc_ends[:-1] - 1]
+        positions = (running_positions - np.repeat(doc_bases, tfs.astype(np.int64))).tolist()
+
+        doc_ends = doc_ends.tolist()
+        doc_starts = [0] + doc_ends[:-1]
+        tf_info_dict = {doc_id: {'tf': tf, 'pos': positions[start:end]}
+                        for doc_id, tf, start, end in zip(doc_ids, tfs.tolist(), doc_starts, doc_ends)}
+
+        return {'ttf': ttf, 'tf': tf_info_dict}
@@ -0,0 +1,213 @@
+import json
+import mmap
+import struct
+
+import numpy as np
+
+from HW_2.varbyte import VarByte
+
+
+class TermDictionaryWriter:
+    """
+    Collects the terms, which must be added in sorted order, along with their integer columns
+    and writes them as a TermDictionary file.
+    """
+
+    def __init__(self, column_names: list, block_size: int) -> None:
+        self.column_names = column_names
+        self.block_size = block_size
+        self.columns = {column_name: [] for column_name in column_names}
+        self.term_bytes = bytearray()
+        self.block_offsets = []
+        self.last_term = None
+        self.last_encoded_term = b''
+        self.term_count = 0
+
+    def add(self, term: str, entry: dict):
+        if self.last_term is not None and term <= self.last_term:
+            raise ValueError('Terms must be added in sorted order, "{}" added after "{}"'.format(term, self.last_term))
+
+        encoded_term = term.encode(TermDictionary.TERM_ENCODING)
+        if self.term_count % self.block_size == 0:
+            # the first term of a block is stored completely, it is used for the binary search
+            self.block_offsets.append(len(self.term_bytes))
+            VarByte.encode([len(encoded_term)], self.term_bytes)
+            self.term_bytes.extend(encoded_term)
+        else:
+            # front coding, length of the prefix shared with the previous term followed by the remaining suffix
+            prefix_length = 0
+            max_prefix_length = min(len(encoded_term), len(self.last_encoded_term))
+            while prefix_length < max_prefix_length and \
+                    encoded_term[prefix_length] == self.last_encoded_term[prefix_length]:
+                prefix_length += 1
+
+            VarByte.encode([prefix_length, len(encoded_term) - prefix_length], self.term_bytes)
+            self.term_bytes.extend(encoded_term[prefix_length:])
+
+        for column_name in self.column_names:
+            self.columns[column_name].append(entry[column_name])
+
+        self.last_term = term
+        self.last_encoded_term = encoded_term
+        self.term_count += 1
+
+    def __len__(self):
+        return self.term_count
+
+    def write(self, file_path: str, metadata: dict):
+        arrays = [np.array(self.columns[column_name], dtype=TermDictionary.COLUMN_DTYPE)
+                  for column_name in self.column_names]
+        block_offsets = np.array(self.block_offsets + [len(self.term_bytes)], dtype=TermDictionary.COLUMN_DTYPE)
+
+        header = {
+            'term_count': self.term_count,
+            'block_size': self.block_size,
+            'column_names': self.column_names,
+            'block_count': len(self.block_offsets),
+            'metadata': metadata
+        }
+        header_bytes = json.dumps(header).encode(TermDictionary.TERM_ENCODING)
+        # the arrays are aligned to 8 bytes so that they can be viewed in place from the memory mapped file
+        padding = -(TermDictionary.HEADER_LENGTH_STRUCT.size + len(header_bytes)) % 8
+
+        with open(file_path, 'wb') as file:
+            file.write(TermDictionary.HEADER_LENGTH_STRUCT.pack(len(header_bytes)))
+            file.write(header_bytes)
+            file.write(b'\0' * padding)
+            for array in arrays:
+                file.write(array.tobytes())
+            file.write(block_offsets.tobytes())
+            file.write(self.term_bytes)
+
+
+class TermDictionary:
+    """
+    Read only, memory mapped term dictionary.
+    The sorted terms are front coded in blocks of block_size terms, the integer columns (e.g. the postings offset and
+    size) are stored as parallel arrays indexed by the rank of the term.
+    Lookups binary search the first terms of the blocks and then scan a single block.
+    """
+    TERM_ENCODING = 'utf-8'
+    COLUMN_DTYPE = np.dtype('<i8')
+    HEADER_LENGTH_STRUCT = struct.Struct('<Q')
+
+    def __init__(self, file_path: str) -> None:
+        self.file_path = file_path
+        self.file = open(file_path, 'rb')
+        self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        header_length = self.HEADER_LENGTH_STRUCT.unpack_from(self.mmap, 0)[0]
+        offset = self.HEADER_LENGTH_STRUCT.size
+        header = json.loads(self.mmap[offset:offset + header_length].decode(self.TERM_ENCODING))
+        offset += header_length
+        offset += -offset % 8
+
+        self.term_count = header['term_count']
+        self.block_size = header['block_size']
+        self.block_count = header['block_count']
+        self.column_names = header['column_names']
+        self.metadata = header['metadata']
+
+        self.columns = {}
+        for column_name in self.column_names:
+            self.columns[column_name] = np.frombuffer(self.mmap, dtype=self.COLUMN_DTYPE, count=self.term_count,
+                                                      offset=offset)
+            offset += self.term_count * self.COLUMN_DTYPE.itemsize
+
+        self.block_offsets = np.frombuffer(self.mmap, dtype=self.COLUMN_DTYPE, count=self.block_count + 1,
+                                           offset=offset) + (offset + ((self.block_count + 1) *
+                                                                       self.COLUMN_DTYPE.itemsize))
+
+    def close(self):
+        # the column arrays are views over the mapping, they must be dropped before the mapping can be closed
+        self.columns = {}
+        self.block_offsets = None
+        self.mmap.close()
+        self.file.close()
+
+    def _get_block_first_term(self, block_ix: int) -> str:
+        length, offset = VarByte.decode_one(self.mmap, int(self.block_offsets[block_ix]))
+        return self.mmap[offset:offset + length].decode(self.TERM_ENCODING)
+
+    def _get_block_terms(self, block_ix: int) -> list:
+        block = self.mmap[int(self.block_offsets[block_ix]):int(self.block_offsets[block_ix + 1])]
+        no_of_terms = min(self.block_size, self.term_count - (block_ix * self.block_size))
+
+        length, offset = VarByte.decode_one(block, 0)
+        encoded_term = block[offset:offset + length]
+        offset += length
+        terms = [encoded_term.decode(self.TERM_ENCODING)]
+        for _ in range(no_of_terms - 1):
+            prefix_length, offset = VarByte.decode_one(block, offset)
+            suffix_length, offset = VarByte.decode_one(block, offset)
+            encoded_term = encoded_term[:prefix_length] + block[offset:offset + suffix_length]
+            offset += suffix_length
+            terms.append(encoded_term.decode(self.TERM_ENCODING))
+
+        return terms
+
+    def _find_block(self, term: str) -> int:
+        """
+        :return: index of the last block whose first term is less than or equal to the term, -1 if there is none
+        """
+        low, high = 0, self.block_count
+        while low < high:
+            mid = (low + high) // 2
+            if self._get_block_first_term(mid) <= term:
+                low = mid + 1
+            else:
+                high = mid
+        return low - 1
+
+    def get_rank(self, term: str) -> int:
+        """
+        :return: rank of the term in the sorted dictionary, -1 if the term is not present
+        """
+        block_ix = self._find_block(term)
+        if block_ix < 0:
+            return -1
+
+        terms = self._get_block_terms(block_ix)
+        for ix, block_term in enumerate(terms):
+            if block_term == term:
+                return (block_ix * self.block_size) + ix
+        return -1
+
+    def get_entry(self, rank: int) -> dict:
+        return {column_name: int(column[rank]) for column_name, column in self.columns.items()}
+
+    def get(self, term: str, default=None):
+        rank = self.get_rank(term)
+        if rank < 0:
+            return default
+        return self.get_entry(rank)
+
+    def __contains__(self, term) -> bool:
+        return self.get_rank(term) >= 0
+
+    def __len__(self) -> int:
+        return self.term_count
+
+    def keys(self):
+        for block_ix in range(self.block_count):
+            yield from self._get_block_terms(block_ix)
+
+    def __iter__(self):
+        return self.keys()
+
+    def items(self):
+        for rank, term in enumerate(self.keys()):
+            yield term, self.get_entry(rank)
+
+    def get_terms_with_prefix(self, prefix: str):
+        """
+        :return: generator of the terms starting with the prefix, in sorted order
+        """
+        block_ix = max(self._find_block(prefix), 0)
+        for ix in range(block_ix, self.block_count):
+            for term in self._get_block_terms(ix):
+                if term < prefix:
+                    continue
+                if not term.startswith(prefix):
+                    return
+                yield term
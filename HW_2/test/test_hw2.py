@@ -0,0 +1,539 @@
+import itertools
+import json
+import math
+import random
+from io import BytesIO
+
+import numpy as np
+import pytest
+from nltk import SnowballStemmer
+
+from HW_2.analysis_cache import AnalysisCache
+from HW_2.analyzer import Analyzer
+from HW_2.batch_search import BatchSearcher
+from HW_2.cache import PostingsCache, QueryResultCache
+from HW_2.compressor import ZlibBlockCompressor
+from HW_2.document_store import DocumentStore, DocumentStoreWriter
+from HW_2.factory import Factory
+from HW_2.indexer import CustomIndex
+from HW_2.main import HW2
+from HW_2.proximity import ProximitySearchEngine
+from HW_2.query_operators import Phrase, OrderedWindow, UnorderedWindow, PositionalQueryEvaluator
+from HW_2.scoring import ScoringKernels
+from HW_2.segments import SegmentedIndex, TieredMergePolicy
+from HW_2.serializer import VarByteSerializer, TermvectorSerializer, JsonSerializer, PickleSerializer
+from HW_2.stopwords import StopwordsFilter
+from HW_2.term_dictionary import TermDictionary, TermDictionaryWriter
+from HW_2.tokenizer import Tokenzier
+from HW_2.varbyte import VarByte
+from constants.constants import Constants
+from utils.utils import Utils
+
+
+@pytest.fixture(scope='module')
+def termvector():
+    return {
+        'ttf': 9,
+        'tf': {
+            999: {'tf': 2, 'pos': [3, 700]},
+            5: {'tf': 1, 'pos': [129]},
+            10: {'tf': 6, 'pos': [1, 2, 3, 16384, 16385, 2097152]},
+        }
+    }
+
+
+@pytest.fixture
+def documents():
+    # zipf distributed words, the frequent ones span several postings blocks, some documents have only stop words
+    rng = random.Random(7)
+    words = ['w{}'.format(i) for i in range(50)]
+    weights = [1 / (i + 1) for i in range(len(words))]
+    return [{'id': 'AP-{}'.format(i), 'head': ' '.join(rng.choices(words, weights, k=3)),
+             'text': ' '.join(rng.choices(words, weights, k=rng.randint(1, 40))) if i % 50 else 'the of'}
+            for i in range(400)]
+
+
+@pytest.fixture
+def data_dir(tmpdir, monkeypatch):
+    monkeypatch.setattr(Constants, 'PROJECT_ROOT', str(tmpdir))
+    ap_data_dir = tmpdir.mkdir(Constants.DATA_DIR).mkdir(Constants.AP_DATA_PATH)
+    ap_data_dir.join('stoplist.txt').write('the\nof\n')
+    ap_data_dir.join(Constants.DOCUMENT_ID_MAPPING_FILE_NAME).write(json.dumps({}))
+    return tmpdir
+
+
+def create_custom_index(documents, serializer, index_head=True):
+    custom_index = Factory.create_custom_index()
+    custom_index.serializer = serializer
+    custom_index.add_document_ids(document['id'] for document in documents)
+    custom_index.index_documents(documents, index_head, True, no_of_workers=2)
+    return custom_index
+
+
+@pytest.fixture
+def custom_index(data_dir, documents):
+    # small postings blocks, so that the top-k evaluation skips blocks
+    custom_index = create_custom_index(documents, VarByteSerializer(block_size=16))
+    yield custom_index
+    custom_index.close()
+
+
+def create_queries(custom_index, no_of_queries=20, seed=3):
+    rng = random.Random(seed)
+    terms = ['w{}'.format(i) for i in range(50)] + ['missing']
+    return [{'id': str(ix), 'tokens': custom_index.analyze_terms(' '.join(rng.sample(terms, rng.randint(1, 4))), True)}
+            for ix in range(no_of_queries)]
+
+
+def assert_top_k_scores(top_k_scores, scores, k):
+    """
+    The top-k documents may differ from the exhaustive ones on ties, their scores may not
+    """
+    scores = dict((doc_id, score) for score, doc_id in scores)
+    expected_scores = sorted(scores.values(), reverse=True)[:k]
+    assert [score for score, _ in top_k_scores] == pytest.approx(expected_scores)
+    assert [score for score, _ in top_k_scores] == pytest.approx([scores[doc_id] for _, doc_id in top_k_scores])
+
+
+def test_varbyte():
+    numbers = [0, 1, 127, 128, 300, 16383, 16384, 2 ** 35 + 7]
+    encoded = VarByte.encode(numbers)
+    assert len(encoded) == 1 + 1 + 1 + 2 + 2 + 2 + 3 + 6
+    assert VarByte.decode(bytes(encoded)).tolist() == numbers
+    assert VarByte.decode(VarByte.encode_gaps([5, 8, 8, 20])).tolist() == [5, 3, 0, 12]
+
+    with pytest.raises(ValueError):
+        VarByte.encode([-1])
+
+
+def test_varbyte_serializer(termvector):
+    serializer = VarByteSerializer()
+    serialized_bytes = serializer.serialize(termvector)
+    assert serializer.deserialize(serialized_bytes) == termvector
+    assert serializer.deserialize(memoryview(serialized_bytes)) == termvector
+
+    # the doc ids and the tfs are decoded without reading the positions stored after them
+    positions_offset = serializer._deserialize_header(serialized_bytes)[-1][0]
+    doc_ids, tfs = serializer.deserialize_postings(serialized_bytes[:positions_offset])
+    assert (doc_ids.tolist(), tfs.tolist()) == ([5, 10, 999], [1, 6, 2])
+
+    text_serializer = TermvectorSerializer()
+    assert text_serializer.deserialize(text_serializer.serialize(termvector)) == termvector
+    assert JsonSerializer().deserialize(JsonSerializer().serialize(termvector)) == termvector
+    assert len(serialized_bytes) < len(text_serializer.serialize(termvector))
+
+
+def test_postings_cursor(termvector):
+    serializer = VarByteSerializer(block_size=2)
+    serialized_bytes = serializer.serialize(termvector)
+    assert serializer.deserialize(serialized_bytes) == termvector
+
+    cursor = serializer.create_postings_cursor(serialized_bytes)
+    assert cursor.df == 3
+    assert cursor.max_tf == 6
+    assert cursor.block_last_doc_ids == [10, 999]
+    assert (cursor.doc_id, cursor.tf, cursor.positions) == (5, 1, [129])
+
+    assert cursor.advance(6) == 10
+    assert cursor.positions == [1, 2, 3, 16384, 16385, 2097152]
+    assert cursor.advance(10) == 10
+    assert cursor.shallow_advance(11) == 1
+    assert cursor.advance(11) == 999
+    assert cursor.tf == 2
+    # the positions of a block are decoded only when asked for
+    assert cursor.block.positions is None
+    assert cursor.next() == cursor.END
+    assert cursor.is_exhausted()
+
+
+def test_term_dictionary(tmpdir):
+    terms = ['a', 'ab', 'abc', 'abd', 'b', 'ba', 'bank', 'banks', 'c', 'caf\xe9']
+    writer = TermDictionaryWriter(['pos', 'size'], block_size=3)
+    for ix, term in enumerate(terms):
+        writer.add(term, {'pos': ix * 100, 'size': ix})
+
+    with pytest.raises(ValueError):
+        writer.add('ba', {'pos': 0, 'size': 0})
+
+    file_path = str(tmpdir.join('catalog.txt'))
+    writer.write(file_path, {'total_docs': 2})
+
+    term_dictionary = TermDictionary(file_path)
+    assert len(term_dictionary) == len(terms)
+    assert term_dictionary.metadata == {'total_docs': 2}
+    assert list(term_dictionary.keys()) == terms
+    assert term_dictionary.get('bank') == {'pos': 600, 'size': 6}
+    assert term_dictionary.get('caf\xe9') == {'pos': 900, 'size': 9}
+    assert term_dictionary.get('abcd') is None
+    assert term_dictionary.get('0') is None
+    assert 'c' in term_dictionary
+    assert list(term_dictionary.get_terms_with_prefix('ba')) == ['ba', 'bank', 'banks']
+    assert list(term_dictionary.get_terms_with_prefix('ab')) == ['ab', 'abc', 'abd']
+    term_dictionary.close()
+
+
+def test_scoring_kernels(termvector):
+    doc_ids, tfs = VarByteSerializer().deserialize_postings(VarByteSerializer().serialize(termvector))
+    assert doc_ids.tolist() == [5, 10, 999]
+    assert tfs.tolist() == [1, 6, 2]
+
+    doc_lengths = np.array([10, 20, 30])
+    scores = ScoringKernels.okapi_tf_idf(tfs, doc_lengths, avg_doc_len=20, total_documents=100, doc_freq=3)
+    expected = [tf / (tf + 0.5 + (1.5 * (doc_length / 20))) * math.log(100 / 3)
+                for tf, doc_length in zip([1, 6, 2], [10, 20, 30])]
+    assert scores.tolist() == pytest.approx(expected)
+
+    scores = ScoringKernels.unigram_lm_with_jelinek_mercer_smoothing(0, doc_lengths, ttf=0, vocabulary_size=50)
+    assert scores.tolist() == [0.0, 0.0, 0.0]
+
+
+def test_minimum_span():
+    assert ProximitySearchEngine.compute_minimum_span([[1, 10, 20], [4, 18], [12, 30]]) == 8
+    assert ProximitySearchEngine.compute_minimum_span([[5], [5]]) == 0
+    assert ProximitySearchEngine.compute_minimum_span([[0, 100]]) == 0
+
+
+def test_positional_operators():
+    positions_lists = [[1, 5, 9], [2, 7, 10], [3, 12]]
+    assert Phrase(['a', 'b']).count_matches(positions_lists[:2]) == 2
+    assert Phrase(['a', 'b', 'c']).count_matches(positions_lists) == 1
+    assert OrderedWindow(['a', 'b', 'c'], 2).count_matches(positions_lists) == 2
+    assert UnorderedWindow(['c', 'a'], 4).count_matches([positions_lists[2], positions_lists[0]]) == 2
+    assert UnorderedWindow(['a', 'c'], 2).count_matches([positions_lists[0], positions_lists[2]]) == 0
+
+
+def test_postings_cache():
+    cache = PostingsCache(max_size_in_bytes=100)
+    cache.put('a', 'postings of a', 40)
+    cache.put('b', 'postings of b', 40)
+    assert cache.get('a') == 'postings of a'
+    assert cache.get('c') is None
+
+    # b has been used less than a, it is evicted first
+    cache.put('c', 'postings of c', 40)
+    assert 'a' in cache and 'b' not in cache and 'c' in cache
+    assert cache.size_in_bytes == 80
+
+    cache.put('d', 'postings of d', 1000)
+    assert 'd' not in cache
+    assert cache.get_statistics()['hit_rate'] == 0.5
+    assert cache.get_statistics()['evictions'] == 1
+    assert cache.get_statistics()['rejections'] == 1
+
+
+def test_query_result_cache(tmpdir):
+    metadata_file_path = str(tmpdir.join('metadata.txt'))
+    with open(metadata_file_path, 'w') as file:
+        file.write('{"catalog_file_path": "catalog.txt"}')
+
+    query = {'tokens': ['oil', 'price'], 'operators': [Phrase(['oil', 'price'])]}
+    cache = QueryResultCache(metadata_file_path)
+    cache.put('bm25', {'k_1': 1.2}, query, [(1.5, 'AP-1')])
+    cache.save()
+
+    cache = QueryResultCache(metadata_file_path)
+    assert cache.get('bm25', {'k_1': 1.2}, query) == [(1.5, 'AP-1')]
+    assert cache.get('bm25', {'k_1': 2.0}, query) is None
+    assert cache.get('bm25', {'k_1': 1.2}, {'tokens': ['oil', 'price'], 'operators': []}) is None
+
+    # a new index in place of the old one invalidates the cached results
+    with open(metadata_file_path, 'w') as file:
+        file.write('{"catalog_file_path": "other-catalog.txt"}')
+    assert QueryResultCache(metadata_file_path).get('bm25', {'k_1': 1.2}, query) is None
+
+
+def test_analyzer(tmpdir):
+    stopwords_file_path = str(tmpdir.join('stoplist.txt'))
+    with open(stopwords_file_path, 'w') as file:
+        file.write('the\nof\n')
+
+    tokenizer, stopwords_filter, stemmer = Tokenzier(), StopwordsFilter(stopwords_file_path), SnowballStemmer('english')
+    analyzer = Analyzer(tokenizer, stopwords_filter, stemmer, stem_cache_size=2)
+    # ascii and non ascii texts are split differently
+    text = 'The Prices of OIL rose 3.5 percent, the prices of oil! Über Straße'
+    for enable_stemming, analyzed_text in itertools.product([False, True], [text, 'The Prices of OIL rose 3.5']):
+        tokens = stopwords_filter.filter(tokenizer.tokenize(analyzed_text))
+        if enable_stemming:
+            tokens = [(stemmer.stem(token[0]), token[1]) for token in tokens]
+
+        assert analyzer.analyze(analyzed_text, enable_stemming) == tokens
+        assert analyzer.analyze_terms(analyzed_text, enable_stemming) == [token[0] for token in tokens]
+
+    assert analyzer.analyze_terms('Über STRASSE', False) == ['über', 'strasse']
+    assert len(analyzer.stems) == 2
+
+    documents = [{'id': 'AP-1', 'text': text, 'head': 'Oil prices'}, {'id': 'AP-2', 'text': 'the of'}]
+    analysis_cache = AnalysisCache.build(documents, analyzer, str(tmpdir.join('analysis-cache.npz')), no_of_workers=1)
+    for enable_stemming in [False, True]:
+        assert list(analysis_cache.iterate_documents(enable_stemming)) == [
+            {'id': document['id'], 'text_terms': analyzer.analyze_terms(document['text'], enable_stemming),
+             'head_terms': analyzer.analyze_terms(document.get('head', ''), enable_stemming)}
+            for document in documents]
+
+
+def test_tiered_merge_policy():
+    def create_segment(name, no_of_documents, no_of_deleted_documents=0):
+        return {'name': name, 'no_of_documents': no_of_documents, 'no_of_deleted_documents': no_of_deleted_documents}
+
+    policy = TieredMergePolicy(merge_factor=3, min_segment_size=10, max_deleted_documents_ratio=0.5)
+    segments = [create_segment('a', 100), create_segment('b', 5), create_segment('c', 12, 8), create_segment('d', 20),
+                create_segment('e', 1), create_segment('f', 29), create_segment('g', 35, 10)]
+    # c is mostly deleted, a is in a higher tier and f, g wait for another segment of the first tier
+    assert policy.find_merges(segments) == [['c'], ['b', 'd', 'e']]
+
+
+def test_zlib_block_compressor(termvector):
+    serializer = VarByteSerializer()
+    compressor = ZlibBlockCompressor(block_size=64)
+    records = [serializer.serialize({'ttf': termvector['ttf'], 'tf': {doc_id + i: postings for doc_id, postings in
+                                                                      termvector['tf'].items()}}) for i in range(20)]
+
+    file = BytesIO()
+    writer = compressor.create_writer(file, records)
+    locations = [writer.write(record) for record in records]
+    compression_metadata = writer.close()
+    assert compression_metadata['dictionary'] and len(compression_metadata['block_starts']) > 1
+
+    reader = compressor.create_reader(file, memoryview(file.getvalue()), compression_metadata)
+    for record, (pos, size) in reversed(list(zip(records, locations))):
+        assert bytes(reader.read(pos, size)) == record
+
+
+def test_index_analyzed_documents(data_dir, documents, custom_index):
+    analysis_cache = AnalysisCache.build(documents, Factory.create_analyzer(),
+                                         AnalysisCache.get_new_analysis_cache_file_path(), no_of_workers=2)
+    analyzed_index = Factory.create_custom_index()
+    document_store_dir = data_dir.join(Constants.DATA_DIR, 'custom-index', 'data', 'document-store')
+    document_store_file_paths = set(document_store_dir.listdir())
+    # the analyzed documents have no text to store
+    with pytest.raises(ValueError):
+        analyzed_index.index_documents(analysis_cache.iterate_documents(True), True, True, no_of_workers=1)
+    assert set(document_store_dir.listdir()) == document_store_file_paths
+
+    analyzed_index.index_documents(analysis_cache.iterate_documents(True), True, True, no_of_workers=1,
+                                   store_documents=False)
+    assert analyzed_index.get_document_lengths().tolist() == custom_index.get_document_lengths().tolist()
+    for term in ['w0', 'w10', 'w49']:
+        assert analyzed_index.get_termvector(term) == custom_index.get_termvector(term)
+    analyzed_index.close()
+
+
+def test_document_store(tmpdir):
+    documents = {doc_id: {'head': 'head {}'.format(doc_id), 'text': 'caf\xe9 text ' * doc_id}
+                 for doc_id in range(0, 60, 3)}
+    writer = DocumentStoreWriter(str(tmpdir.join('store.bin')), block_size=256)
+    for doc_id, document in documents.items():
+        writer.add(doc_id, document['head'], document['text'])
+    file_paths = writer.close()
+
+    document_store = DocumentStore(file_paths['document_store_file_path'], file_paths['document_store_table_file_path'])
+    assert document_store.get_document_ids().tolist() == list(documents)
+    for doc_id in reversed(range(62)):
+        assert document_store.get_document(doc_id) == documents.get(doc_id)
+    document_store.close()
+
+
+def test_close_custom_index_with_live_postings_cursor(custom_index):
+    doc_ids, tfs = custom_index.get_postings_arrays('w0')
+    postings_cursor = custom_index.get_postings_cursor('w0')
+    custom_index.close()
+    assert custom_index.index_mmap is None and custom_index.index_buffer is None
+    custom_index.close()
+
+    # the mapping is unmapped only once the cursor is gone
+    postings = []
+    while not postings_cursor.is_exhausted():
+        postings.append((postings_cursor.doc_id, postings_cursor.tf))
+        postings_cursor.next()
+    assert postings == list(zip(doc_ids.tolist(), tfs.tolist()))
+
+
+def test_segmented_index(data_dir, documents):
+    segmented_index = SegmentedIndex(SegmentedIndex.get_new_manifest_file_path(), Factory.create_custom_index,
+                                     merge_policy=TieredMergePolicy(merge_factor=2, min_segment_size=50))
+    segmented_index.add_documents(documents[:100], no_of_workers=1)
+    postings_cursor = segmented_index.get_postings_cursor('w0')
+    for start in range(100, len(documents), 100):
+        segmented_index.add_documents(documents[start:start + 100], no_of_workers=1)
+
+    # a document added again replaces its previous version
+    new_document = {'id': 'AP-1', 'head': '', 'text': 'w49 w49 w48'}
+    segmented_index.add_documents([new_document], no_of_workers=1)
+    segmented_index.delete_documents(['AP-2', 'AP-1000'])
+    segmented_index.wait_for_merges()
+    assert len(segmented_index.segments) < 5
+    # the cursor reads the segment merged away until it is gone
+    assert postings_cursor.advance(0) == segmented_index.get_internal_document_id('AP-0')
+
+    live_documents = [new_document if document['id'] == 'AP-1' else document for document in documents
+                      if document['id'] != 'AP-2']
+    custom_index = Factory.create_custom_index()
+    custom_index.index_documents(live_documents, True, True, no_of_workers=1)
+    assert segmented_index.get_total_documents() == custom_index.get_total_documents() == len(documents) - 1
+    assert segmented_index.get_average_doc_length() == pytest.approx(custom_index.get_average_doc_length())
+    assert segmented_index.get_vocabulary_size() == custom_index.get_vocabulary_size()
+    assert segmented_index.get_document_lengths().tolist() == custom_index.get_document_lengths().tolist()
+    for term in ['w0', 'w10', 'w48', 'w49']:
+        assert [postings.tolist() for postings in segmented_index.get_postings_arrays(term)] == [
+            postings.tolist() for postings in custom_index.get_postings_arrays(term)]
+        assert segmented_index.get_doc_freq(term) == custom_index.get_doc_freq(term)
+        assert segmented_index.get_ttf(term) == custom_index.get_ttf(term)
+
+    for document_id in ['AP-0', 'AP-1', 'AP-399']:
+        doc_id = segmented_index.get_internal_document_id(document_id)
+        assert segmented_index.get_document(doc_id) == custom_index.get_document(doc_id)
+    assert segmented_index.get_document(segmented_index.get_internal_document_id('AP-2')) is None
+    custom_index.close()
+
+    segmented_index.close()
+    assert not segmented_index.segments
+    # the segments merged away are deleted, the live ones are listed in the manifest
+    live_file_paths = {file_path for segment in segmented_index.manifest['segments']
+                       for file_path in SegmentedIndex._get_segment_file_paths(segment)}
+    metadata_dir = data_dir.join(Constants.DATA_DIR, 'custom-index', 'metadata')
+    assert {str(file_path) for file_path in metadata_dir.listdir()} - {custom_index.metadata_file_path} == {
+        file_path for file_path in live_file_paths if file_path.startswith(str(metadata_dir))}
+
+
+def test_segmented_index_keeps_documents_without_tokens(data_dir, documents):
+    segmented_index = SegmentedIndex(SegmentedIndex.get_new_manifest_file_path(), Factory.create_custom_index,
+                                     index_head=False,
+                                     merge_policy=TieredMergePolicy(merge_factor=2, min_segment_size=50))
+    for start in range(0, len(documents), 100):
+        segmented_index.add_documents(documents[start:start + 100], no_of_workers=1)
+    segmented_index.wait_for_merges()
+    # every segment left is merged into one
+    segmented_index._merge_segments([segment['name'] for segment in segmented_index.manifest['segments']])
+    segmented_index.refresh()
+    assert len(segmented_index.segments) == 1
+
+    custom_index = Factory.create_custom_index()
+    custom_index.index_documents(documents, False, True, no_of_workers=1)
+    assert custom_index.get_total_documents() == len(documents)
+    assert segmented_index.get_total_documents() == custom_index.get_total_documents()
+    assert segmented_index.get_average_doc_length() == pytest.approx(custom_index.get_average_doc_length())
+
+    # a document made only of stopwords added again replaces its previous version
+    empty_document = next(document for document in documents if document['text'] == 'the of')
+    segmented_index.add_documents([dict(empty_document)], no_of_workers=1)
+    segmented_index.wait_for_merges()
+    assert segmented_index.get_total_documents() == custom_index.get_total_documents()
+    assert segmented_index.get_average_doc_length() == pytest.approx(custom_index.get_average_doc_length())
+
+    segmented_index.delete_documents([empty_document['id']])
+    assert segmented_index.get_total_documents() == custom_index.get_total_documents() - 1
+    custom_index.close()
+    segmented_index.close()
+
+
+def test_segmented_index_failed_merge(data_dir, documents, monkeypatch):
+    def merge_document_stores(*args):
+        raise OSError('No space left on device')
+
+    monkeypatch.setattr(CustomIndex, '_merge_document_stores', merge_document_stores)
+    segmented_index = SegmentedIndex(SegmentedIndex.get_new_manifest_file_path(), Factory.create_custom_index,
+                                     merge_policy=TieredMergePolicy(merge_factor=2, min_segment_size=50))
+    segmented_index.add_documents(documents[:100], no_of_workers=1)
+    segmented_index.add_documents(documents[100:200], no_of_workers=1)
+    with pytest.raises(OSError):
+        segmented_index.wait_for_merges()
+
+    # the files of the failed merge are deleted, the segments are left as they were
+    assert len(segmented_index.segments) == 2
+    live_file_paths = {file_path for segment in segmented_index.manifest['segments']
+                       for file_path in SegmentedIndex._get_segment_file_paths(segment)}
+    index_dir = data_dir.join(Constants.DATA_DIR, 'custom-index')
+    file_paths = {str(file_path) for dir_name in ['data', 'metadata'] for file_path in index_dir.join(dir_name).visit()
+                  if file_path.isfile()}
+    assert file_paths == live_file_paths
+    segmented_index.close()
+
+
+def test_merge_indexes_keeps_documents_without_tokens(data_dir, documents):
+    custom_index = create_custom_index(documents, VarByteSerializer(), index_head=False)
+    empty_doc_ids = [custom_index.get_internal_document_id(document['id']) for document in documents
+                     if document['text'] == 'the of']
+    assert empty_doc_ids and custom_index.get_total_documents() == len(documents)
+    assert custom_index.get_indexed_document_ids().tolist() == sorted(
+        custom_index.get_internal_document_id(document['id']) for document in documents)
+    assert not set(empty_doc_ids) & set(custom_index.get_all_document_ids().tolist())
+
+    merged_metadata, _ = custom_index.merge_indexes([custom_index.metadata], [set()])
+    assert merged_metadata['statistics'] == custom_index.metadata['statistics']
+
+    # a document without any token is deleted as any other document
+    merged_metadata, _ = custom_index.merge_indexes([custom_index.metadata], [{empty_doc_ids[0]}])
+    assert merged_metadata['statistics']['total_docs'] == len(documents) - 1
+    assert merged_metadata['statistics']['total_tokens'] == custom_index.get_total_tokens()
+    custom_index.close()
+
+
+def test_head_positions_follow_text_positions(data_dir):
+    documents = [{'id': 'AP-1', 'text': 'oil prices', 'head': 'rose'}, {'id': 'AP-2', 'text': 'prices rose'}]
+    custom_index = create_custom_index(documents, VarByteSerializer())
+    doc_id = custom_index.get_internal_document_id('AP-1')
+    assert custom_index.get_termvector('rose')['tf'][doc_id]['pos'] == [2 + Constants.HEAD_POSITION_GAP + 1]
+
+    # the phrase does not span the text and the head
+    terms = custom_index.analyze_terms('prices rose', True)
+    doc_ids, _ = PositionalQueryEvaluator(custom_index).evaluate(Phrase(terms))
+    assert list(doc_ids) == [custom_index.get_internal_document_id('AP-2')]
+    custom_index.close()
+
+
+def test_top_k_scores(custom_index):
+    kwargs = {'avg_doc_len': custom_index.get_average_doc_length(),
+              'total_documents': custom_index.get_total_documents()}
+    for query, k in itertools.product(create_queries(custom_index), [1, 10, 1000]):
+        assert_top_k_scores(HW2.calculate_okapi_bm25_top_k_scores(query, custom_index, k=k, **kwargs),
+                            HW2.calculate_okapi_bm25_scores(query, custom_index, **kwargs), k)
+        assert_top_k_scores(HW2.calculate_okapi_tf_idf_top_k_scores(query, custom_index, k=k, **kwargs),
+                            HW2.calculate_okapi_tf_idf_scores(query, custom_index, **kwargs), k)
+
+
+def test_language_model_top_k_scores(custom_index):
+    vocabulary_size = custom_index.get_vocabulary_size()
+    # the documents without any query term are ranked from the length baseline
+    queries = create_queries(custom_index) + [{'id': 'missing', 'tokens': ['missing']}]
+    for query, k in itertools.product(queries, [1, 10, 1000]):
+        assert_top_k_scores(
+            HW2.calculate_unigram_lm_with_laplace_smoothing_top_k_scores(query, custom_index, vocabulary_size, k=k),
+            HW2.calculate_unigram_lm_with_laplace_smoothing_scores(query, custom_index, vocabulary_size), k)
+        assert_top_k_scores(
+            HW2.calculate_unigram_lm_with_jelinek_mercer_smoothing_top_k_scores(query, custom_index, vocabulary_size,
+                                                                                k=k),
+            HW2.calculate_unigram_lm_with_jelinek_mercer_smoothing_scores(query, custom_index, vocabulary_size), k)
+
+
+def test_top_k_scores_without_postings_cursors(data_dir, documents):
+    custom_index = create_custom_index(documents, PickleSerializer())
+    kwargs = {'avg_doc_len': custom_index.get_average_doc_length(),
+              'total_documents': custom_index.get_total_documents()}
+    for query in create_queries(custom_index, 5):
+        assert_top_k_scores(HW2.calculate_okapi_bm25_top_k_scores(query, custom_index, k=10, **kwargs),
+                            HW2.calculate_okapi_bm25_scores(query, custom_index, **kwargs), 10)
+    custom_index.close()
+
+
+def test_batch_search(custom_index):
+    queries = create_queries(custom_index, 8)
+    kwargs = {'avg_doc_len': custom_index.get_average_doc_length(),
+              'total_documents': custom_index.get_total_documents()}
+    expected_top_k_scores = [BatchSearcher.get_top_k(HW2.calculate_okapi_bm25_scores(query, custom_index, **kwargs),
+                                                     custom_index) for query in queries]
+    # the queries are spread over the workers in chunks, the results keep the order of the queries
+    assert BatchSearcher.search_top_k(custom_index.metadata_file_path, queries, HW2.calculate_okapi_bm25_scores,
+                                      no_of_workers=2, chunk_size=3, **kwargs) == expected_top_k_scores
+
+    vocabulary_size = custom_index.get_vocabulary_size()
+    results = BatchSearcher.search(custom_index.metadata_file_path, queries,
+                                   HW2.calculate_unigram_lm_with_laplace_smoothing_scores, no_of_workers=2,
+                                   vocabulary_size=vocabulary_size)
+    assert results == [result for query in queries for result in BatchSearcher.transform_scores_for_writing(
+        HW2.calculate_unigram_lm_with_laplace_smoothing_scores(query, custom_index, vocabulary_size), query,
+        custom_index)]
+
+
+if __name__ == '__main__':
+    Utils.configure_logging()
+    pytest.main()
@@ -0,0 +1,81 @@
+import numpy as np
+
+
+class VarByte:
+    """
+    Variable byte encoding of non negative integers.
+    Every byte holds 7 bits of the number, least significant group first,
+    the high bit is set on every byte except the last byte of a number.
+    """
+    _PAYLOAD_MASK = 0x7F
+    _CONTINUATION_BIT = 0x80
+
+    @classmethod
+    def encode(cls, numbers, output: bytearray = None) -> bytearray:
+        if output is None:
+            output = bytearray()
+
+        for number in numbers:
+            if number < 0:
+                raise ValueError('VarByte cannot encode negative number: {}'.format(number))
+
+            while number >= cls._CONTINUATION_BIT:
+                output.append((number & cls._PAYLOAD_MASK) | cls._CONTINUATION_BIT)
+                number >>= 7
+            output.append(number)
+
+        return output
+
+    @classmethod
+    def decode_one(cls, buffer, offset: int = 0):
+        """
+        Decodes a single number starting at the given offset
+        :param buffer:
+        :param offset:
+        :return: tuple of the decoded number and the offset of the next number
+        """
+        number, shift = 0, 0
+        while True:
+            byte = buffer[offset]
+            offset += 1
+            number |= (byte & cls._PAYLOAD_MASK) << shift
+            if byte < cls._CONTINUATION_BIT:
+                return number, offset
+            shift += 7
+
+    @classmethod
+    def decode(cls, buffer) -> np.ndarray:
+        """
+        Decodes all the numbers present in the buffer at once using whole array operations.
+        :param buffer: any bytes like object, e.g. a slice of a memory mapped file
+        :return: uint64 array of the decoded numbers
+        """
+        encoded = np.frombuffer(buffer, dtype=np.uint8)
+        if len(encoded) == 0:
+            return np.zeros(0, dtype=np.uint64)
+
+        ends = np.flatnonzero(encoded < cls._CONTINUATION_BIT)
+        if len(ends) == 0 or ends[-1] != len(encoded) - 1:
+            raise ValueError('Buffer does not end with a complete VarByte number')
+
+        if len(ends) == len(encoded):
+            # fast path, every number fits in a single byte
+            return encoded.astype(np.uint64)
+
+        starts = np.empty_like(ends)
+        starts[0] = 0
+        starts[1:] = ends[:-1] + 1
+
+        # index of every byte within the number it belongs to
+        byte_index = np.arange(len(encoded)) - np.repeat(starts, ends - starts + 1)
+        payload = (encoded & cls._PAYLOAD_MASK).astype(np.uint64) << (byte_index.astype(np.uint64) * np.uint64(7))
+        return np.add.reduceat(payload, starts)
+
+    @classmethod
+    def encode_gaps(cls, sorted_numbers, output: bytearray = None, previous: int = 0) -> bytearray:
+        gaps = []
+        for number in sorted_numbers:
+            gaps.append(number - previous)
+            previous = number
+
+        return cls.encode(gaps, output)
@@ -0,0 +1,195 @@
+import heapq
+import math
+from abc import abstractmethod
+from collections import Counter
+
+from HW_2.indexer import CustomIndex
+from HW_2.postings import PostingsCursor
+
+
+class TermScorer:
+    """
+    Score contribution of a single query term to a document.
+    The contribution must not decrease with the tf and must not increase with the doc length,
+    the upper bound of a term is then the contribution for its max tf and the minimum doc length of the collection.
+    """
+    # protects the pruning decisions against rounding differences between the bound and the actual scores
+    _UPPER_BOUND_SLACK = 1e-9
+
+    @abstractmethod
+    def score(self, tf: int, doc_length: int, doc_freq: int, query_tf: int) -> float:
+        pass
+
+    def upper_bound(self, max_tf: int, min_doc_length: int, doc_freq: int, query_tf: int) -> float:
+        bound = self.score(max_tf, min_doc_length, doc_freq, query_tf)
+        return max(0.0, bound) * (1 + self._UPPER_BOUND_SLACK)
+
+
+class OkapiBm25TermScorer(TermScorer):
+
+    def __init__(self, avg_doc_len, total_documents, k_1=1.2, k_2=500, b=0.75) -> None:
+        self.avg_doc_len = avg_doc_len
+        self.total_documents = total_documents
+        self.k_1 = k_1
+        self.k_2 = k_2
+        self.b = b
+
+    def score(self, tf: int, doc_length: int, doc_freq: int, query_tf: int) -> float:
+        k_1, k_2, b = self.k_1, self.k_2, self.b
+        temp_1 = math.log((self.total_documents + 0.5) / (doc_freq + 0.5))
+        temp_2 = (tf + (k_1 * tf)) / (tf + (k_1 * ((1 - b) + (b * (doc_length / self.avg_doc_len)))))
+        temp_3 = (query_tf + (k_2 * query_tf)) / (query_tf + k_2)
+        return temp_1 * temp_2 * temp_3
+
+
+class OkapiTfIdfTermScorer(TermScorer):
+
+    def __init__(self, avg_doc_len, total_documents) -> None:
+        self.avg_doc_len = avg_doc_len
+        self.total_documents = total_documents
+
+    def score(self, tf: int, doc_length: int, doc_freq: int, query_tf: int) -> float:
+        temp = tf / (tf + 0.5 + (1.5 * (doc_length / self.avg_doc_len)))
+        return temp * math.log(self.total_documents / doc_freq)
+
+
+class _QueryTerm:
+
+    def __init__(self, term: str, cursor: PostingsCursor, query_tf: int, term_scorer: TermScorer,
+                 min_doc_length: int, max_tf: int) -> None:
+        self.term = term
+        self.cursor = cursor
+        self.query_tf = query_tf
+        self.term_scorer = term_scorer
+        self.min_doc_length = min_doc_length
+        # every occurrence of the term in the query adds its contribution
+        self.upper_bound = query_tf * term_scorer.upper_bound(max_tf, min_doc_length, cursor.df, query_tf)
+
+    def get_block_upper_bound(self, block_ix: int) -> float:
+        if block_ix >= len(self.cursor.block_max_tfs):
+            return 0.0
+
+        block_max_tf = self.cursor.get_block_max_tf(block_ix)
+        return self.query_tf * self.term_scorer.upper_bound(block_max_tf, self.min_doc_length, self.cursor.df,
+                                                            self.query_tf)
+
+
+class BlockMaxWand:
+    """
+    Top-k document at a time query evaluation with dynamic pruning.
+    WAND skips every document whose sum of the term upper bounds cannot beat the k-th best score seen so far,
+    Block-Max WAND additionally checks the upper bounds of the blocks the candidate document falls in.
+    The returned top-k is the same as the top-k of exhaustive scoring of all the postings.
+    """
+
+    def __init__(self, custom_index: CustomIndex, term_scorer: TermScorer, k: int = 1000,
+                 use_block_max: bool = True) -> None:
+        self.custom_index = custom_index
+        self.term_scorer = term_scorer
+        self.k = k
+        self.use_block_max = use_block_max
+
+    def _create_query_terms(self, query_tokens):
+        query_terms = {}
+        min_doc_length = self.custom_index.get_min_doc_length()
+        for term, query_tf in Counter(query_tokens).items():
+            cursor = self.custom_index.get_postings_cursor(term)
+            if cursor:
+                max_tf = self.custom_index.get_term_max_tf(term)
+                query_terms[term] = _QueryTerm(term, cursor, query_tf, self.term_scorer, min_doc_length, max_tf)
+
+        return query_terms
+
+    def _score_document(self, doc_id, query_tokens, query_terms):
+        doc_length = self.custom_index.get_doc_length(doc_id)
+
+        # summing in the query token order keeps the score identical to the exhaustive scoring
+        score = 0.0
+        for query_token in query_tokens:
+            query_term = query_terms.get(query_token)
+            if query_term and query_term.cursor.doc_id == doc_id:
+                score += self.term_scorer.score(query_term.cursor.tf, doc_length, query_term.cursor.df,
+                                                query_term.query_tf)
+
+        return score, doc_id
+
+    @classmethod
+    def _find_pivot(cls, sorted_terms, threshold):
+        upper_bound_sum = 0.0
+        for ix, query_term in enumerate(sorted_terms):
+            if query_term.cursor.is_exhausted():
+                return None
+
+            upper_bound_sum += query_term.upper_bound
+            if upper_bound_sum >= threshold:
+                # the terms sharing the pivot document are part of the pivot as well
+                pivot_doc_id = query_term.cursor.doc_id
+                while ix + 1 < len(sorted_terms) and sorted_terms[ix + 1].cursor.doc_id == pivot_doc_id:
+                    ix += 1
+                return ix
+
+        return None
+
+    def _passes_block_max_check(self, sorted_terms, pivot_ix, pivot_doc_id, threshold):
+        block_upper_bound_sum = 0.0
+        for query_term in sorted_terms[:pivot_ix + 1]:
+            block_ix = query_term.cursor.shallow_advance(pivot_doc_id)
+            block_upper_bound_sum += query_term.get_block_upper_bound(block_ix)
+
+        return block_upper_bound_sum >= threshold
+
+    @classmethod
+    def _get_next_candidate(cls, sorted_terms, pivot_ix, pivot_doc_id):
+        # the first document which may fall outside the blocks examined by the block max check
+        next_candidate = PostingsCursor.END
+        for query_term in sorted_terms[:pivot_ix + 1]:
+            block_ix = query_term.cursor.shallow_advance(pivot_doc_id)
+            next_candidate = min(next_candidate, query_term.cursor.get_block_last_doc_id(block_ix) + 1)
+
+        if pivot_ix + 1 < len(sorted_terms):
+            next_candidate = min(next_candidate, sorted_terms[pivot_ix + 1].cursor.doc_id)
+
+        return next_candidate
+
+    def search(self, query_tokens) -> list:
+        """
+        :param query_tokens: analyzed query tokens
+        :return: list of (score, doc_id) tuples of the top-k documents, sorted by score in descending order
+        """
+        query_terms = self._create_query_terms(query_tokens)
+        top_k = []
+        threshold = -math.inf
+
+        while True:
+            sorted_terms = sorted(query_terms.values(), key=lambda _query_term: _query_term.cursor.doc_id)
+            pivot_ix = self._find_pivot(sorted_terms, threshold)
+            if pivot_ix is None:
+                break
+
+            pivot_doc_id = sorted_terms[pivot_ix].cursor.doc_id
+            if self.use_block_max and len(top_k) == self.k and \
+                    not self._passes_block_max_check(sorted_terms, pivot_ix, pivot_doc_id, threshold):
+                next_candidate = self._get_next_candidate(sorted_terms, pivot_ix, pivot_doc_id)
+                for query_term in sorted_terms[:pivot_ix + 1]:
+                    query_term.cursor.advance(next_candidate)
+
+            elif sorted_terms[0].cursor.doc_id == pivot_doc_id:
+                entry = self._score_document(pivot_doc_id, query_tokens, query_terms)
+                if len(top_k) < self.k:
+                    heapq.heappush(top_k, entry)
+                elif entry > top_k[0]:
+                    heapq.heapreplace(top_k, entry)
+
+                if len(top_k) == self.k:
+                    threshold = top_k[0][0]
+
+                for query_term in sorted_terms:
+                    if query_term.cursor.doc_id != pivot_doc_id:
+                        break
+                    query_term.cursor.next()
+
+            else:
+                for query_term in sorted_terms[:pivot_ix]:
+                    query_term.cursor.advance(pivot_doc_id)
+
+        return sorted(top_k, reverse=True)
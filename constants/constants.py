@@ -1,3 +1,5 @@
+import os
+
 from sqlalchemy import create_engine
 
 
@@ -23,23 +25,49 @@ class Constants:
 
     # ES related configs
     CHUNK_SIZE = 10000
+    TERM_STATISTICS_CHUNK_SIZE = 1000
     ES_TIMEOUT = 30
 
     BYES_TO_PROCESS_AT_ONCE_FOR_COMPRESSION = 8192
+    COMPRESSION_BLOCK_SIZE = 64 * 1024
+    ZLIB_COMPRESSION_LEVEL = 6
+    COMPRESSION_DICTIONARY_SIZE = 32 * 1024
+    COMPRESSION_DICTIONARY_SAMPLES = 1000
+    DOCUMENT_STORE_BLOCK_SIZE = 16 * 1024
     NO_OF_PARALLEL_INDEXING_TASKS = 10
-    TERMVECTOR_CACHE_SIZE = 10000
+    NO_OF_PARALLEL_PARSING_TASKS = 4
+    TREC_PARSER_READ_SIZE = 1024 * 1024
+    INDEXING_BATCH_SIZE = 500
+    INDEXING_MEMORY_BUDGET_PER_WORKER = 256 * 1024 * 1024
+    MAX_INDEXES_TO_MERGE_AT_ONCE = 128
+    POSTINGS_CACHE_SIZE_IN_BYTES = 512 * 1024 * 1024
+    USE_MMAP_FOR_INDEX_READS = True
+    POSTINGS_BLOCK_SIZE = 128
+    HEAD_POSITION_GAP = 100
+    TERM_DICTIONARY_BLOCK_SIZE = 16
+    PROXIMITY_SEARCH_NO_OF_CANDIDATES = 1000
+    # segments of a SegmentedIndex, see TieredMergePolicy
+    SEGMENT_MERGE_FACTOR = 10
+    MIN_SEGMENT_SIZE = 1000
+    MAX_DELETED_DOCUMENTS_RATIO = 0.5
+    NO_OF_PARALLEL_SEARCH_TASKS = os.cpu_count()
+    SEARCH_CHUNK_SIZE = 4
 
     # Compressor configs
     GZIP_COMPRESSOR_NAME = 'Gzip'
     NO_OPS_COMPRESSOR_NAME = 'NoOps'
+    ZLIB_BLOCK_COMPRESSOR_NAME = 'ZlibBlock'
 
     # Serializer configs
     JSON_SERIALIZER_NAME = 'Json'
     PICKLE_SERIALIZER_NAME = 'Pickle'
     TERMVECTOR_SERIALIZER_NAME = 'TermvectorSerializer'
+    VARBYTE_SERIALIZER_NAME = 'VarByteSerializer'
 
     # Stemmer configs
     SNOWBALL_STEMMER_NAME = 'Snowball'
+    # max number of words whose stem is memoized by the analyzer
+    STEM_CACHE_SIZE = 500000
 
     # Stopwords filter configs
     STOPWORDS_FILTER_NAME = 'CustomStopwordsFilter'
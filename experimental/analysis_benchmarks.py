@@ -0,0 +1,53 @@
+import logging
+import sys
+import time
+
+from HW_1.main import get_file_paths_to_parse, get_parsed_documents
+from HW_2.analyzer import Analyzer
+from HW_2.factory import Factory
+from constants.constants import Constants
+from utils.utils import Utils
+
+
+def analyze_with_separate_steps(tokenizer, stopwords_filter, stemmer, text, enable_stemming):
+    """
+    Tokenizer, stopwords filter and stemmer applied one after the other, as CustomIndex.analyze used to do
+    """
+    tokens = stopwords_filter.filter(tokenizer.tokenize(text))
+    if enable_stemming:
+        tokens = [(stemmer.stem(token[0]), token[1]) for token in tokens]
+    return [token[0] for token in tokens]
+
+
+def benchmark_analysis(name, analyze, texts, enable_stemming):
+    start_time = time.perf_counter()
+    results = [analyze(text, enable_stemming) for text in texts]
+    elapsed_time = time.perf_counter() - start_time
+
+    no_of_tokens = sum(len(terms) for terms in results)
+    logging.info('{}, stemming: {}, tokens: {}, time: {:.2f} s, throughput: {:.0f} tokens/s'.format(
+        name, enable_stemming, no_of_tokens, elapsed_time, no_of_tokens / elapsed_time))
+    return results
+
+
+def main(no_of_documents=None):
+    documents = get_parsed_documents(get_file_paths_to_parse(Utils.get_ap89_collection_abs_path()))
+    texts = [document['text'] for document in documents[:no_of_documents]]
+
+    tokenizer = Factory.create_tokenizer(Constants.CUSTOM_TOKENIZER_NAME)
+    stopwords_filter = Factory.create_stopwords_filter(Constants.STOPWORDS_FILTER_NAME)
+    stemmer = Factory.create_stemmer(Constants.SNOWBALL_STEMMER_NAME)
+
+    for enable_stemming in [False, True]:
+        expected = benchmark_analysis(
+            'Separate steps',
+            lambda text, stemming: analyze_with_separate_steps(tokenizer, stopwords_filter, stemmer, text, stemming),
+            texts, enable_stemming)
+        # a new analyzer for every run, the stems memoized by the previous run would skew the results
+        analyzer = Analyzer(tokenizer, stopwords_filter, stemmer)
+        assert benchmark_analysis('Analyzer', analyzer.analyze_terms, texts, enable_stemming) == expected
+
+
+if __name__ == '__main__':
+    Utils.configure_logging()
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else None)
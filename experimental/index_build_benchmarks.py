@@ -0,0 +1,252 @@
+import argparse
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import tempfile
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from HW_1.main import get_file_paths_to_parse
+from HW_1.parser import StreamingTRECParser
+from HW_2.factory import Factory
+from HW_2.indexer import CustomIndex
+from HW_2.main import HW2
+from constants.constants import Constants
+from utils.utils import Utils
+
+SERIALIZER_NAMES = [Constants.VARBYTE_SERIALIZER_NAME, Constants.TERMVECTOR_SERIALIZER_NAME,
+                    Constants.JSON_SERIALIZER_NAME, Constants.PICKLE_SERIALIZER_NAME]
+COMPRESSOR_NAMES = [Constants.NO_OPS_COMPRESSOR_NAME, Constants.GZIP_COMPRESSOR_NAME,
+                    Constants.ZLIB_BLOCK_COMPRESSOR_NAME]
+STAGES = ['parse', 'analyze', 'invert', 'serialize', 'compress', 'write', 'merge']
+
+
+class StageTimer:
+    """
+    Accumulates the time spent in every stage, the time of a stage nested in another one, e.g. serialize inside
+    write, is subtracted from the outer stage so that the stage times add up to the total time
+    """
+
+    def __init__(self) -> None:
+        self.totals = defaultdict(float)
+        self.nested_times = []
+
+    def wrap(self, stage, function):
+        def wrapper(*args, **kwargs):
+            start_time = time.perf_counter()
+            self.nested_times.append(0.0)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed_time = time.perf_counter() - start_time
+                self.totals[stage] += elapsed_time - self.nested_times.pop()
+                if self.nested_times:
+                    self.nested_times[-1] += elapsed_time
+
+        return wrapper
+
+
+def generate_synthetic_corpus(dir_path, no_of_documents, no_of_files=10, vocabulary_size=50000, seed=7):
+    """
+    TREC formatted files whose words follow a Zipf distribution, with document lengths close to the ones of AP89
+    :return: paths of the generated files
+    """
+    rng = np.random.default_rng(seed)
+    words = np.array(['w{}'.format(i) for i in range(vocabulary_size)])
+    weights = 1.0 / np.arange(1, vocabulary_size + 1)
+    weights /= weights.sum()
+
+    file_paths = []
+    for file_no, document_nos in enumerate(np.array_split(np.arange(no_of_documents), no_of_files)):
+        file_path = '{}/synthetic-{:03d}'.format(dir_path, file_no)
+        with open(file_path, 'w', encoding=Constants.AP_DATA_FILE_ENCODING) as file:
+            for document_no in document_nos:
+                head = ' '.join(rng.choice(words, size=8, p=weights))
+                text_words = rng.choice(words, size=int(rng.integers(50, 800)), p=weights)
+                text = '\n'.join(' '.join(text_words[i:i + 12]) for i in range(0, len(text_words), 12))
+                file.write('<DOC>\n<DOCNO> SYN-{} </DOCNO>\n<HEAD>{}</HEAD>\n<TEXT>\n{}\n</TEXT>\n</DOC>\n'.format(
+                    document_no, head, text))
+        file_paths.append(file_path)
+
+    return file_paths
+
+
+def parse_documents(file_paths, no_of_documents=None):
+    """
+    :return: the first no_of_documents documents of the files, in the order of the files
+    """
+    parser = StreamingTRECParser(Constants.AP_DATA_FILE_ENCODING)
+    documents = []
+    for file_path in file_paths:
+        documents.extend(parser.parse(file_path))
+        if no_of_documents and len(documents) >= no_of_documents:
+            return documents[:no_of_documents]
+    return documents
+
+
+def create_queries(custom_index, documents, no_of_queries, enable_stemming, seed):
+    rng = random.Random(seed)
+    queries = []
+    while len(queries) < no_of_queries:
+        terms = custom_index.analyze_terms(rng.choice(documents)['text'], enable_stemming)
+        if terms:
+            queries.append({'id': str(len(queries)), 'tokens': rng.sample(terms, min(len(terms), rng.randint(2, 5)))})
+    return queries
+
+
+def get_latency_percentiles(latencies):
+    latencies = np.array(latencies) * 1000
+    return {
+        'mean_ms': float(latencies.mean()),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'max_ms': float(latencies.max())
+    }
+
+
+def measure_query_latencies(custom_index, queries, score_calculator, **kwargs):
+    latencies = []
+    for query in queries:
+        start_time = time.perf_counter()
+        score_calculator(query, custom_index=custom_index, **kwargs)
+        latencies.append(time.perf_counter() - start_time)
+    return get_latency_percentiles(latencies)
+
+
+def run_benchmark(file_paths, serializer_name, compressor_name, no_of_documents, memory_budget, index_head,
+                  enable_stemming, no_of_queries, seed):
+    """
+    Builds the index in a single process, the stages of CustomIndex.index_documents are run one after the other so
+    that every stage can be timed, then runs the queries.
+    Runs in a process of its own, hence the peak RSS is the one of this combination only.
+    """
+    timer = StageTimer()
+    documents = timer.wrap('parse', parse_documents)(file_paths, no_of_documents)
+
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as file:
+        json.dump({document['id']: ix for ix, document in enumerate(documents)}, file)
+        document_id_mapping_file_path = file.name
+
+    custom_index = CustomIndex(Factory.create_tokenizer(Constants.CUSTOM_TOKENIZER_NAME),
+                               Factory.create_stopwords_filter(Constants.STOPWORDS_FILTER_NAME),
+                               Factory.create_stemmer(Constants.SNOWBALL_STEMMER_NAME),
+                               Factory.create_compressor(compressor_name), Factory.create_serializer(serializer_name),
+                               document_id_mapping_file_path)
+    custom_index.analyzer.analyze_terms = timer.wrap('analyze', custom_index.analyzer.analyze_terms)
+    custom_index._calculate_and_update_termvectors = timer.wrap('invert',
+                                                                custom_index._calculate_and_update_termvectors)
+    custom_index.serializer.serialize = timer.wrap('serialize', custom_index.serializer.serialize)
+    custom_index.compressor.compress_bytes = timer.wrap('compress', custom_index.compressor.compress_bytes)
+    custom_index._write_partial_index = timer.wrap('write', custom_index._write_partial_index)
+    merge_indexes_and_catalogs = timer.wrap('merge', custom_index._merge_indexes_and_catalogs)
+    add_document_lengths_and_statistics = timer.wrap('merge', custom_index._add_document_lengths_and_statistics)
+
+    start_time = time.perf_counter()
+    batches = custom_index._split_documents_into_batches(documents, Constants.INDEXING_BATCH_SIZE)
+    metadata_list = custom_index._create_documents_index_and_catalog(batches, index_head, enable_stemming,
+                                                                     memory_budget)
+    metadata = merge_indexes_and_catalogs(metadata_list)
+    add_document_lengths_and_statistics(metadata)
+    metadata_file_path = custom_index._write_metadata_to_file(metadata)
+    build_time = time.perf_counter() - start_time + timer.totals['parse']
+    # the queries are analyzed as well, the stage times are taken before running them
+    stage_times = {stage: timer.totals[stage] for stage in STAGES}
+
+    custom_index.metadata = metadata
+    custom_index.init_index()
+    queries = create_queries(custom_index, documents, no_of_queries, enable_stemming, seed)
+    score_kwargs = {'avg_doc_len': custom_index.get_average_doc_length(),
+                    'total_documents': custom_index.get_total_documents()}
+    query_latencies = {'okapi_bm25': measure_query_latencies(custom_index, queries, HW2.calculate_okapi_bm25_scores,
+                                                             **score_kwargs)}
+    if hasattr(custom_index.serializer, 'create_postings_cursor'):
+        query_latencies['okapi_bm25_top_k'] = measure_query_latencies(
+            custom_index, queries, HW2.calculate_okapi_bm25_top_k_scores, **score_kwargs)
+
+    result = {
+        'serializer': serializer_name,
+        'compressor': compressor_name,
+        'no_of_documents': len(documents),
+        'no_of_partial_indexes': len(metadata_list),
+        'stage_times_s': stage_times,
+        'build_time_s': build_time,
+        'peak_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        'index_size_bytes': {
+            'index': os.path.getsize(metadata['index_file_path']),
+            'catalog': os.path.getsize(metadata['catalog_file_path']),
+            'document_lengths': os.path.getsize(metadata['document_length_file_path'])
+        },
+        'query_latencies': query_latencies
+    }
+
+    custom_index.close()
+    custom_index._delete_index_and_catalog_files(metadata)
+    os.remove(metadata_file_path)
+    os.remove(document_id_mapping_file_path)
+    return result
+
+
+def get_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              universal_newlines=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Benchmarks the build and the queries of CustomIndex')
+    arg_parser.add_argument('output_file_path', help='JSON file the results are written to')
+    arg_parser.add_argument('--corpus-dir', help='TREC files to sample the documents from, e.g. the AP89 collection, '
+                                                 'a synthetic corpus is generated when absent')
+    arg_parser.add_argument('--no-of-documents', type=int, default=5000)
+    arg_parser.add_argument('--memory-budget', type=int, default=Constants.INDEXING_MEMORY_BUDGET_PER_WORKER // 16,
+                            help='bytes of termvectors held in memory before a partial index is written')
+    arg_parser.add_argument('--serializers', nargs='+', default=SERIALIZER_NAMES)
+    arg_parser.add_argument('--compressors', nargs='+', default=COMPRESSOR_NAMES)
+    arg_parser.add_argument('--no-of-queries', type=int, default=100)
+    arg_parser.add_argument('--no-head', action='store_true')
+    arg_parser.add_argument('--no-stemming', action='store_true')
+    arg_parser.add_argument('--seed', type=int, default=7)
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as corpus_dir:
+        if args.corpus_dir:
+            file_paths = sorted(get_file_paths_to_parse(args.corpus_dir))
+        else:
+            file_paths = generate_synthetic_corpus(corpus_dir, args.no_of_documents, seed=args.seed)
+
+        results = []
+        for serializer_name, compressor_name in itertools.product(args.serializers, args.compressors):
+            logging.info('Benchmarking serializer: {}, compressor: {}'.format(serializer_name, compressor_name))
+            # a new interpreter for every combination, so that the peak RSS of one does not hide the next one
+            with multiprocessing.get_context('spawn').Pool(1) as pool:
+                results.append(pool.apply(run_benchmark, (file_paths, serializer_name, compressor_name,
+                                                          args.no_of_documents, args.memory_budget, not args.no_head,
+                                                          not args.no_stemming, args.no_of_queries, args.seed)))
+
+    report = {
+        'commit': get_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'corpus': args.corpus_dir or 'synthetic',
+        'arguments': vars(args),
+        'results': results
+    }
+    with open(args.output_file_path, 'w') as file:
+        json.dump(report, file, indent=True)
+    logging.info('Results written to {}'.format(args.output_file_path))
+
+
+if __name__ == '__main__':
+    Utils.configure_logging()
+    main()
@@ -0,0 +1,56 @@
+import logging
+import sys
+import time
+
+import numpy as np
+
+from HW_2.factory import Factory
+from HW_2.main import HW2
+from HW_2.query_operators import Phrase, UnorderedWindow, PositionalQueryEvaluator
+from utils.utils import Utils
+
+
+def create_operators(query):
+    """
+    Every pair of adjacent query tokens as an exact phrase and the whole query as an unordered window
+    """
+    tokens = query['tokens']
+    operators = [Phrase(tokens[i:i + 2]) for i in range(len(tokens) - 1)]
+    if len(tokens) > 1:
+        operators.append(UnorderedWindow(tokens, 4 * len(tokens)))
+    return operators
+
+
+def benchmark_operators(custom_index, queries, use_skip_pointers):
+    evaluator = PositionalQueryEvaluator(custom_index, use_skip_pointers)
+    latencies, results = [], []
+    for query in queries:
+        start_time = time.perf_counter()
+        results.append([evaluator.evaluate(operator) for operator in create_operators(query)])
+        latencies.append((time.perf_counter() - start_time) * 1000)
+
+    latencies = np.array(latencies)
+    logging.info('Skip pointers: {}, mean: {:.2f} ms, p50: {:.2f} ms, p95: {:.2f} ms, max: {:.2f} ms'.format(
+        use_skip_pointers, latencies.mean(), np.percentile(latencies, 50), np.percentile(latencies, 95),
+        latencies.max()))
+    return results
+
+
+def main(metadata_file_path):
+    custom_index = Factory.create_custom_index()
+    custom_index.init_index(metadata_file_path)
+    queries = HW2.get_queries(custom_index)
+
+    # the first run warms up the page cache of the memory mapped index
+    benchmark_operators(custom_index, queries, use_skip_pointers=True)
+    with_skip_pointers = benchmark_operators(custom_index, queries, use_skip_pointers=True)
+    without_skip_pointers = benchmark_operators(custom_index, queries, use_skip_pointers=False)
+
+    for query_results, other_query_results in zip(with_skip_pointers, without_skip_pointers):
+        for (doc_ids, counts), (other_doc_ids, other_counts) in zip(query_results, other_query_results):
+            assert np.array_equal(doc_ids, other_doc_ids) and np.array_equal(counts, other_counts)
+
+
+if __name__ == '__main__':
+    Utils.configure_logging()
+    main(sys.argv[1])